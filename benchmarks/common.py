@@ -0,0 +1,58 @@
+import os
+import resource
+from os.path import join, dirname, abspath
+
+"""
+Helpers shared by the GradeO benchmarks.
+"""
+
+__author__ = 'Joshua D. Katz'
+
+GRADEO_ROOT = dirname(dirname(abspath(__file__)))
+
+EXAMPLE_GRADER = join(GRADEO_ROOT, "examples", "hw001_cs100_h01.py")
+
+LAB_TEMPLATE = """
+QUESTIONS_1 = "A"
+QUESTIONS_2 = "B"
+QUESTIONS_3 = "%s"
+QUESTIONS_4 = "D"
+QUESTIONS_5 = "A"
+
+PADDING = [%d] * %d
+
+
+def multiply_by_four(number):
+    return number * %d
+
+
+def multiply_by_two(number):
+    return number * 2
+"""
+
+
+def write_labs(lab_folder, count, padding=0):
+    """
+    Write generated lab submissions for the example grader.
+
+    :param lab_folder: The folder to write labs into.
+    :param count: The number of labs to write.
+    :param padding: The length of a list each lab builds when it is imported, to give it a memory footprint.
+    :return:
+    """
+    for number in range(count):
+        with open(join(lab_folder, "hw001_bm%05d.py" % number), "w") as lab:
+            lab.write(LAB_TEMPLATE % ("ABCD"[number % 4], number, padding, 3 + number % 2))
+
+
+def get_rss():
+    """
+    Get the resident set size of this process.
+
+    :return: The resident set size in bytes. Falls back to the peak resident set size where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,166 @@
+import argparse
+import shutil
+import tempfile
+import threading
+import socketserver
+from time import perf_counter, sleep
+
+from libs.email_manager import EmailManager
+from libs.outbox import Outbox, flush_outbox
+
+"""
+Measures how quickly grade emails are put in an outbox and then sent from it, against a stand-in SMTP server on this
+machine.
+
+    The stand-in accepts every message without delivering it. It can wait before accepting each message, to stand in
+    for the round trip to a real server, and can drop each connection after a number of messages, to check that
+    dropped connections are replaced without losing emails.
+
+    Run from the GradeO directory:
+
+        python -m benchmarks.email_throughput --messages 500 --connections 1 2 4 --latency 0.01 --drop_every 50
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def read_data(self):
+        while True:
+            line = self.rfile.readline()
+
+            if not line or line == b".\r\n":
+                return
+
+    def handle(self):
+        server = self.server
+        accepted = 0
+
+        self.reply("220 localhost GradeO stand-in SMTP")
+
+        while True:
+            line = self.rfile.readline()
+
+            if not line:
+                return
+
+            command = line[:4].upper()
+
+            if command == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.read_data()
+                sleep(server.latency)
+
+                with server.lock:
+                    server.received += 1
+
+                self.reply("250 OK")
+                accepted += 1
+
+                if server.drop_every and accepted % server.drop_every == 0:
+                    return
+            elif command == b"NOOP":
+                with server.lock:
+                    server.noops += 1
+
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                return
+            elif command in (b"EHLO", b"HELO", b"MAIL", b"RCPT", b"RSET"):
+                self.reply("250 OK")
+            else:
+                self.reply("502 Command not implemented")
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0.0, drop_every=0):
+        """
+        Start a stand-in SMTP server on a free port of localhost.
+
+        :param latency: Seconds to wait before accepting each message.
+        :param drop_every: Drop a connection after it sends this many messages, or 0 to never drop connections.
+        :return:
+        """
+        super().__init__(("127.0.0.1", 0), StandInSMTPHandler)
+        self.latency = latency
+        self.drop_every = drop_every
+        self.received = 0
+        self.noops = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def get_address(self):
+        return "%s:%d" % self.server_address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def time_sending(messages, connections, latency, drop_every, rate):
+    """
+    Time putting messages in an outbox and flushing it to a new stand-in SMTP server.
+
+    :return: A tuple of the seconds taken to fill the outbox, the seconds taken to flush it, the messages received and
+             the NOOP health checks made.
+    """
+    outbox_folder = tempfile.mkdtemp(prefix="gradeo_outbox_")
+    server = StandInSMTPServer(latency, drop_every)
+
+    try:
+        outbox = Outbox(outbox_folder)
+        start = perf_counter()
+
+        for number in range(messages):
+            outbox.add("bm%05d" % number, "bm%05d received a 65" % number)
+
+        queue_seconds = perf_counter() - start
+
+        email_manager = EmailManager("grader", None, "cs100", "h01", server.get_address(), connections, rate,
+                                     use_tls=False)
+        start = perf_counter()
+
+        try:
+            flush_outbox(outbox, email_manager)
+        finally:
+            email_manager.close_smtp_connection()
+
+        flush_seconds = perf_counter() - start
+    finally:
+        server.stop()
+        shutil.rmtree(outbox_folder)
+
+    return queue_seconds, flush_seconds, server.received, server.noops
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GradeO email sending")
+    parser.add_argument("--messages", type=int, default=500, help="Number of emails to send")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 2, 4],
+                        help="Numbers of SMTP connections to compare")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds the server takes to accept a message")
+    parser.add_argument("--drop_every", type=int, default=0,
+                        help="Drop each connection after this many messages, 0 to never drop")
+    parser.add_argument("--rate", type=float, default=None, help="Most emails sent per second")
+    options = parser.parse_args()
+
+    print("%12s %10s %10s %12s %10s %8s" % ("connections", "queue s", "flush s", "emails/s", "received", "noops"))
+
+    for connections in options.connections:
+        queue_seconds, flush_seconds, received, noops = time_sending(options.messages, connections, options.latency,
+                                                                     options.drop_every, options.rate)
+        print("%12d %10.3f %10.3f %12.1f %10d %8d" % (connections, queue_seconds, flush_seconds,
+                                                      options.messages / flush_seconds, received, noops))
+
+
+if __name__ == '__main__':
+    main()
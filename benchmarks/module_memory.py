@@ -0,0 +1,55 @@
+import sys
+import shutil
+import argparse
+import tempfile
+from io import StringIO
+from contextlib import redirect_stdout
+
+from libs.auto_grader import load_grader
+from libs.lab_submissions import load_labs
+from benchmarks.common import EXAMPLE_GRADER, write_labs, get_rss
+
+"""
+Shows that grading labs in process does not grow GradeO's memory with the size of the class.
+
+    Every generated lab builds a list when it is imported. Labs are graded in process, one at a time, and the resident
+    set size and number of loaded modules are sampled as grading goes. Both should stay flat.
+
+    Run from the GradeO directory:
+
+        python -m benchmarks.module_memory --labs 5000 --padding 20000
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GradeO memory use while loading labs")
+    parser.add_argument("--labs", type=int, default=5000, help="Number of labs to generate")
+    parser.add_argument("--padding", type=int, default=20000, help="Length of the list each lab builds")
+    parser.add_argument("--samples", type=int, default=10, help="Number of times to sample memory")
+    options = parser.parse_args()
+
+    lab_folder = tempfile.mkdtemp(prefix="gradeo_benchmark_")
+
+    try:
+        write_labs(lab_folder, options.labs, options.padding)
+        auto_grader = load_grader(EXAMPLE_GRADER)
+        sample_every = max(1, options.labs // options.samples)
+
+        print("%10s %12s %14s" % ("labs", "rss (MB)", "sys.modules"))
+        print("%10d %12.1f %14d" % (0, get_rss() / 1048576.0, len(sys.modules)))
+
+        with redirect_stdout(StringIO()) as output:
+            for graded, _ in enumerate(load_labs(auto_grader, lab_folder, deduplicate=False), 1):
+                if graded % sample_every == 0:
+                    sys.__stdout__.write("%10d %12.1f %14d\n" % (graded, get_rss() / 1048576.0, len(sys.modules)))
+                    output.seek(0)
+                    output.truncate()
+    finally:
+        shutil.rmtree(lab_folder)
+
+
+if __name__ == '__main__':
+    main()
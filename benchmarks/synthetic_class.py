@@ -0,0 +1,185 @@
+import random
+from os.path import join
+
+"""
+Generates a synthetic class of lab submissions and the grader for them.
+
+    Submissions are a mix of:
+        correct: Every answer and function is right.
+        wrong: Some answers are wrong and a function returns the wrong value.
+        crashing: The lab throws when it is imported.
+        slow: The functions are right but loop far more than they need to.
+        duplicate: A copy of an earlier correct lab with its variables renamed.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+SYNTHETIC_LAB_NUMBER = 1
+
+SYNTHETIC_GRADER_NAME = "hw001_bench_s01.py"
+
+SYNTHETIC_ANSWERS = ["A", "C", "B", "D", "A", "B"]
+
+SYNTHETIC_KINDS = ["correct"] * 4 + ["wrong"] * 3 + ["crashing", "slow", "duplicate"]
+
+SYNTHETIC_GRADER = '''
+ANSWERS_1 = "A"
+ANSWERS_2 = "C"
+ANSWERS_3 = "B"
+ANSWERS_4 = "D"
+ANSWERS_5 = "A"
+ANSWERS_6 = "B"
+
+
+def multiply_by_four_test(implementation):
+    return all(implementation(n) == n * 4 for n in range(-20, 20))
+
+
+def sum_to_test(implementation):
+    return all(implementation(n) == n * (n + 1) // 2 for n in range(0, 60))
+
+
+def count_vowels_test(implementation):
+    words = ["gradeo", "benchmark", "rhythm", "AEIOU", ""]
+    return all(implementation(w) == sum(c in "aeiouAEIOU" for c in w) for w in words)
+
+
+def scorer(multiple_choice_correct, written_correct):
+    return 40 * multiple_choice_correct + 60 * written_correct
+'''
+
+CORRECT_FUNCTIONS = '''
+
+def multiply_by_four({number}):
+    return {number} * 4
+
+
+def sum_to({number}):
+    {total} = 0
+    for {index} in range({number} + 1):
+        {total} += {index}
+    return {total}
+
+
+def count_vowels({word}):
+    return len([{letter} for {letter} in {word} if {letter} in "aeiouAEIOU"])
+'''
+
+WRONG_FUNCTIONS = '''
+
+def multiply_by_four(number):
+    return number * 4 + (1 if number > 10 else 0)
+
+
+def sum_to(number):
+    return number * (number - 1) // 2
+
+
+def count_vowels(word):
+    return len([letter for letter in word if letter in "aeiou"])
+'''
+
+SLOW_FUNCTIONS = '''
+
+def multiply_by_four(number):
+    total = 0
+    for _ in range(2000):
+        total = number * 4
+    return total
+
+
+def sum_to(number):
+    total = 0
+    for _ in range(50):
+        total = sum(range(number + 1))
+    return total
+
+
+def count_vowels(word):
+    return sum(1 for letter in word for vowel in "aeiouAEIOU" if letter == vowel)
+'''
+
+CRASHING_FUNCTIONS = '''
+
+def multiply_by_four(number):
+    return number * 4
+
+
+RESULT = multiply_by_four(2) / 0
+'''
+
+
+def get_answers(rng, wrong):
+    answers = list(SYNTHETIC_ANSWERS)
+
+    if wrong:
+        for number in rng.sample(range(len(answers)), 2):
+            answers[number] = rng.choice("ABCD")
+
+    return "".join(['QUESTIONS_%d = "%s"\n' % (n + 1, a) for n, a in enumerate(answers)])
+
+
+def get_names(rng):
+    """
+    Get variable names for a correct lab. Duplicates rename these to look different.
+    """
+    names = ["number", "total", "index", "word", "letter"]
+    suffix = "_%d" % rng.randint(0, 999)
+
+    return {name: name + suffix for name in names}
+
+
+def get_lab_source(rng, kind):
+    """
+    Get the source of a single synthetic lab.
+
+    :param rng: The random.Random to draw from.
+    :param kind: One of SYNTHETIC_KINDS.
+    :return: The source of the lab.
+    """
+    header = '"""\nSynthetic %s lab generated by the GradeO benchmarks.\n"""\n\n' % kind
+
+    if kind == "wrong":
+        return header + get_answers(rng, True) + WRONG_FUNCTIONS
+
+    if kind == "slow":
+        return header + get_answers(rng, False) + SLOW_FUNCTIONS
+
+    if kind == "crashing":
+        return header + get_answers(rng, False) + CRASHING_FUNCTIONS
+
+    names = {"number": "number", "total": "total", "index": "index", "word": "word", "letter": "letter"}
+
+    if kind == "duplicate":
+        names = get_names(rng)
+
+    return header + get_answers(rng, False) + CORRECT_FUNCTIONS.format(**names)
+
+
+def write_synthetic_class(lab_folder, grader_folder, count, seed=0):
+    """
+    Write a synthetic class of labs and its grader.
+
+    :param lab_folder: The folder to write the labs into.
+    :param grader_folder: The folder to write the grader into.
+    :param count: The number of labs to write.
+    :param seed: The seed for choosing the kind and contents of every lab.
+    :return: A tuple of the grader path and a dictionary counting the labs of each kind.
+    """
+    rng = random.Random(seed)
+    kinds = {}
+
+    for number in range(count):
+        kind = SYNTHETIC_KINDS[rng.randrange(len(SYNTHETIC_KINDS))]
+        kinds[kind] = kinds.get(kind, 0) + 1
+
+        with open(join(lab_folder, "hw%0.3d_sy%05d.py" % (SYNTHETIC_LAB_NUMBER, number)), "w") as lab:
+            lab.write(get_lab_source(rng, kind))
+
+    grader_path = join(grader_folder, SYNTHETIC_GRADER_NAME)
+
+    with open(grader_path, "w") as grader:
+        grader.write(SYNTHETIC_GRADER)
+
+    return grader_path, kinds
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from io import StringIO
+from time import perf_counter
+from contextlib import redirect_stdout
+from os.path import join
+
+from libs.auto_grader import load_grader
+from libs.lab_submissions import load_labs, WORKER_MODES
+from libs.finished_manager import FinishedLabManager
+from libs.gradebook import Gradebook
+from libs.gradebook_manager import GradebookManager
+from libs.cheating_manager import CheatingManager
+from libs.profiler import GradingProfiler
+from benchmarks.common import GRADEO_ROOT
+from benchmarks.synthetic_class import write_synthetic_class
+
+"""
+Measures end to end grading throughput on synthetic classes.
+
+    Each class size is graded in its own child process so peak memory is measured per size. For every size the
+    benchmark reports labs per second, peak RSS and the seconds spent in each stage:
+
+        load: Importing labs, summed over every lab.
+        score: Running the grader's test functions, summed over every lab.
+        csv: Recording grades in the gradebook and exporting the CSV.
+        similarity: The CheatingManager pass. Skipped above --similarity_limit labs.
+
+    Results are printed as a table and written as JSON so runs from different versions can be compared.
+
+    Run from the GradeO directory:
+
+        python -m benchmarks.throughput --sizes 100 1000 10000 --output throughput.json
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+
+def get_peak_rss():
+    """
+    Get the peak resident set size of this process and of the children it has waited for.
+
+    :return: A tuple of the peak RSS of this process and of its largest child, in megabytes.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+    return own, children
+
+
+def get_gradeo_version():
+    """
+    Get the git commit GradeO is at, so results can be matched to a version.
+
+    :return: The commit hash, or None if GradeO is not in a git checkout.
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=GRADEO_ROOT, stderr=subprocess.DEVNULL)
+        return commit.decode("utf8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(size, jobs, worker_mode, similarity_limit, seed):
+    """
+    Generate and grade a single synthetic class.
+
+    :return: A dictionary of the measurements.
+    """
+    work_folder = tempfile.mkdtemp(prefix="gradeo_benchmark_")
+    lab_folder = join(work_folder, "labs")
+    os.mkdir(lab_folder)
+
+    try:
+        grader_path, kinds = write_synthetic_class(lab_folder, work_folder, size, seed)
+        auto_grader = load_grader(grader_path)
+
+        run_similarity = size <= similarity_limit
+        gradebook = Gradebook(join(work_folder, "grades.sqlite"))
+        gradebook_manager = GradebookManager(gradebook, auto_grader.course, auto_grader.section,
+                                             auto_grader.lab_number, join(work_folder, "grades.csv"))
+        cheating_manager = CheatingManager(run_similarity, jobs=jobs)
+        profiler = GradingProfiler()
+        finished_lab_manager = FinishedLabManager([gradebook_manager, cheating_manager], profiler)
+
+        start = perf_counter()
+
+        with redirect_stdout(StringIO()):
+            finished_lab_manager.handle_graded_lab(load_labs(auto_grader, lab_folder, jobs, None, worker_mode))
+
+        seconds = perf_counter() - start
+        gradebook.close()
+
+        handler_seconds = {name: sum(values) for name, values in profiler.handler_timings.items()}
+        peak_rss, peak_child_rss = get_peak_rss()
+
+        return {
+            "labs": size,
+            "kinds": kinds,
+            "graded": len(profiler.lab_timings),
+            "seconds": seconds,
+            "labs_per_second": size / seconds,
+            "peak_rss_mb": peak_rss,
+            "peak_child_rss_mb": peak_child_rss,
+            "stages": {
+                "load": sum(profiler.import_timings),
+                "score": sum(sum(values) for values in profiler.test_timings.values()),
+                "csv": (handler_seconds.get("GradebookManager.handle_lab", 0) +
+                        handler_seconds.get("GradebookManager.finish", 0)),
+                "similarity": (handler_seconds.get("CheatingManager.handle_lab", 0) +
+                               handler_seconds.get("CheatingManager.finish", 0)) if run_similarity else None
+            }
+        }
+    finally:
+        shutil.rmtree(work_folder)
+
+
+def format_seconds(seconds):
+    return "%10s" % "skipped" if seconds is None else "%10.3f" % seconds
+
+
+def print_results(results):
+    print("%8s %10s %10s %10s %10s %10s %10s %10s" % ("labs", "seconds", "labs/s", "rss MB", "load s", "score s",
+                                                      "csv s", "similar s"))
+
+    for result in results:
+        stages = result["stages"]
+        print("%8d %10.3f %10.1f %10.1f %s %s %s %s" % (result["labs"], result["seconds"], result["labs_per_second"],
+                                                        max(result["peak_rss_mb"], result["peak_child_rss_mb"]),
+                                                        format_seconds(stages["load"]),
+                                                        format_seconds(stages["score"]),
+                                                        format_seconds(stages["csv"]),
+                                                        format_seconds(stages["similarity"])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GradeO grading throughput on synthetic classes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Class sizes to grade")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of labs to grade at once")
+    parser.add_argument("--worker_mode", choices=WORKER_MODES, default=None, help="Worker mode to grade with")
+    parser.add_argument("--similarity_limit", type=int, default=1000,
+                        help="Largest class size to run the similarity pass on")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for generating the classes")
+    parser.add_argument("--output", type=str, default=None, help="File to write the JSON results to")
+    parser.add_argument("--run_size", type=int, default=None, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.run_size is not None:
+        result = run_size(options.run_size, options.jobs, options.worker_mode, options.similarity_limit, options.seed)
+        print(json.dumps(result))
+        return
+
+    results = []
+
+    for size in options.sizes:
+        command = [sys.executable, "-m", "benchmarks.throughput", "--run_size", str(size), "--jobs", str(options.jobs),
+                   "--similarity_limit", str(options.similarity_limit), "--seed", str(options.seed)]
+
+        if options.worker_mode is not None:
+            command += ["--worker_mode", options.worker_mode]
+
+        output = subprocess.check_output(command, cwd=GRADEO_ROOT)
+        results.append(json.loads(output.decode("utf8").strip().splitlines()[-1]))
+
+    print_results(results)
+
+    if options.output:
+        report = {
+            "gradeo_version": get_gradeo_version(),
+            "python": sys.version,
+            "jobs": options.jobs,
+            "worker_mode": options.worker_mode,
+            "seed": options.seed,
+            "results": results
+        }
+
+        with open(options.output, "w") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+
+        print("Results written to %s" % options.output)
+
+
+if __name__ == '__main__':
+    main()
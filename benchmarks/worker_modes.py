@@ -0,0 +1,61 @@
+import argparse
+import shutil
+import tempfile
+from time import perf_counter
+from io import StringIO
+from contextlib import redirect_stdout
+
+from libs.auto_grader import load_grader
+from libs.lab_submissions import load_labs, WORKER_MODES
+from libs.sandbox import SandboxLimits
+from benchmarks.common import EXAMPLE_GRADER, write_labs
+
+"""
+Compares how long each worker mode takes to grade a class of generated labs.
+
+    Run from the GradeO directory:
+
+        python -m benchmarks.worker_modes --labs 200 --jobs 4
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+
+def time_worker_mode(auto_grader, lab_folder, jobs, worker_mode):
+    """
+    Time how long it takes to grade every lab in a folder.
+
+    :return: A tuple of the seconds taken and the number of labs graded.
+    """
+    start = perf_counter()
+
+    with redirect_stdout(StringIO()):
+        labs = list(load_labs(auto_grader, lab_folder, jobs, SandboxLimits(), worker_mode, deduplicate=False))
+
+    return perf_counter() - start, len(labs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GradeO worker modes")
+    parser.add_argument("--labs", type=int, default=200, help="Number of labs to generate")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of labs to grade at once")
+    options = parser.parse_args()
+
+    lab_folder = tempfile.mkdtemp(prefix="gradeo_benchmark_")
+
+    try:
+        write_labs(lab_folder, options.labs)
+        auto_grader = load_grader(EXAMPLE_GRADER)
+
+        print("%-10s %10s %12s" % ("mode", "seconds", "labs/second"))
+
+        for worker_mode in WORKER_MODES:
+            seconds, graded = time_worker_mode(auto_grader, lab_folder, options.jobs, worker_mode)
+            print("%-10s %10.3f %12.1f" % (worker_mode, seconds, graded / seconds))
+    finally:
+        shutil.rmtree(lab_folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,27 @@
 from traceback import format_exc
+from itertools import chain
 import argparse
+from argparse import ArgumentTypeError
 
 from os import sep
-from libs.auto_grader import load_grader
-from libs.csv_manager import CSVManager
-from libs.lab_submissions import load_labs
-from libs.email_manager import EmailDispatcher
+from libs.auto_grader import load_graders
+from libs.gradebook import Gradebook, get_gradebook_path, export_csv, import_csv
+from libs.gradebook_manager import GradebookManager
+from libs.lab_submissions import find_lab_paths, grade_labs, WORKER_MODES, WORKER_IN_PROCESS, WORKER_SPAWN, WORKER_FORK
+from libs.email_manager import EmailManager, EmailDispatcher, SMTP_SERVER
+from libs.outbox import Outbox, flush_outbox
+from libs.ucid_login import get_grader_ucid_account
 from libs.finished_manager import FinishedLabManager
 from libs.output_manager import ConsoleOutputManager
 from libs.move_finished_manager import MoveFinishedLabHandler
 from libs.cheating_manager import CheatingManager
+from libs.item_analysis import ItemAnalysisManager
+from libs.sandbox import SandboxLimits, can_fork
+from libs.grade_cache import GradeCache
+from libs.lab_watcher import watch_labs
+from libs.profiler import GradingProfiler
+from libs.run_journal import RunJournal
+from libs.grader_cases import TestOptions, TEST_MODES
 from libs import argparse_validation
 
 __author__ = 'Joshua D. Katz'
@@ -25,15 +37,17 @@ def main():
 
     # AutoGrader file location argument
     parser.add_argument("--grader", action="store",
-                        type=argparse_validation.is_file,
-                        help="The AutoGrader file to use",
+                        nargs="+",
+                        type=argparse_validation.is_file_or_folder,
+                        help="The AutoGrader files to use, or folders of AutoGrader files. Labs are graded by the "
+                             "AutoGrader for their lab number.",
                         required=True)
 
     # Labs folder location argument
     parser.add_argument("--labs", action="store",
                         type=argparse_validation.is_folder,
-                        help="Folder with labs to grade",
-                        default="labs" + sep)
+                        help="Folder with labs to grade. Defaults to labs%s" % sep,
+                        default=None)
 
     # Move lab after grading into a file
     parser.add_argument("--move_finished", action="store",
@@ -47,13 +61,136 @@ def main():
                         default=False)
 
     parser.add_argument("--csv", action="store",
-                        help="Set a file to store the grades in CSV format to.",
+                        help="Set a file to store the grades in CSV format to. The grades are kept in a gradebook "
+                             "next to it, such as grades.sqlite for grades.csv, unless --gradebook is given.",
                         default="")
 
+    parser.add_argument("--gradebook", action="store",
+                        type=str,
+                        help="SQLite file to store the grades in.",
+                        default=None)
+
+    parser.add_argument("--export_csv", action="store",
+                        type=str,
+                        help="Write the grades stored in the gradebook for the AutoGrader's course and section to "
+                             "this CSV file, without grading any labs.",
+                        default=None)
+
+    parser.add_argument("--item_analysis", action="store",
+                        type=str,
+                        help="Write the difficulty, discrimination index and answer counts of every multiple choice "
+                             "question to this CSV file, and print the questions that might be broken.",
+                        default=None)
+
+    parser.add_argument("--jobs", action="store",
+                        type=argparse_validation.is_positive_int,
+                        help="Number of worker processes to grade labs with.",
+                        default=1)
+
+    parser.add_argument("--watch", action="store_true",
+                        help="After grading, keep watching the labs folder and grade labs as they arrive.",
+                        default=False)
+
+    parser.add_argument("--watch_interval", action="store",
+                        type=argparse_validation.is_positive_number,
+                        help="Seconds between checks of the labs folder when it can not be watched with inotify.",
+                        default=1.0)
+
     parser.add_argument("--find_similar", "--find_pumpkin_eaters", "--find_pants_on_fire", action="store_true",
-                        help="Enable a SUPER ALPHA similarity finder. Will take forever to run.",
+                        help="Report groups of labs whose ASTs are within a small tree edit distance of each other.",
                         default=False)
 
+    parser.add_argument("--similarity_top", action="store",
+                        type=argparse_validation.is_positive_int,
+                        help="Only report this many of the most similar pairs of labs found by --find_similar.",
+                        default=None)
+
+    parser.add_argument("--similarity_corpus", action="store",
+                        type=str,
+                        help="Folder of labs from earlier runs. --find_similar also compares labs against them and "
+                             "adds the labs of this run to it.",
+                        default=None)
+
+    journal_option_group = parser.add_argument_group("Run Journal", "Pick up a run that stopped part way")
+
+    journal_option_group.add_argument("--journal", action="store",
+                                      type=str,
+                                      help="File to journal which labs were graded, emailed, recorded and moved in.",
+                                      default=".gradeo_journal")
+
+    journal_option_group.add_argument("--resume", action="store_true",
+                                      help="Continue the run journaled in --journal. Only labs it did not grade are "
+                                           "graded, and no lab is emailed twice.",
+                                      default=False)
+
+    profile_option_group = parser.add_argument_group("Profiling", "Find out where the time of a run goes")
+
+    profile_option_group.add_argument("--profile", action="store_true",
+                                      help="Print the slowest tests, students and handlers after grading. "
+                                           "Cached labs are not profiled, so combine with --no_cache.",
+                                      default=False)
+
+    profile_option_group.add_argument("--profile_stats", action="store",
+                                      type=str,
+                                      help="Also dump cProfile stats of the GradeO process to this file. Labs graded "
+                                           "in worker processes are only covered by the --profile summary.",
+                                      default=None)
+
+    cache_option_group = parser.add_argument_group("Grade Cache", "Reuse the grades of labs that have not changed")
+
+    cache_option_group.add_argument("--no_cache", action="store_true",
+                                    help="Grade every lab even if it has not changed since it was last graded.",
+                                    default=False)
+
+    cache_option_group.add_argument("--cache_dir", action="store",
+                                    type=str,
+                                    help="Folder to store cached grades in.",
+                                    default=".gradeo_cache" + sep)
+
+    cache_option_group.add_argument("--cache_size", action="store",
+                                    type=argparse_validation.is_positive_number,
+                                    help="Megabytes the grade cache may use before the oldest grades are removed.",
+                                    default=64)
+
+    test_option_group = parser.add_argument_group("Test Cases", "Control how the AutoGrader's tests are run")
+
+    test_option_group.add_argument("--test_timeout", action="store",
+                                   type=argparse_validation.is_positive_number,
+                                   help="Seconds each test function or case may run for. Overrides the AutoGrader's "
+                                        "TEST_TIMEOUT.",
+                                   default=None)
+
+    test_option_group.add_argument("--test_mode", action="store",
+                                   choices=TEST_MODES,
+                                   help="Stop testing a function at its first failing case (fast) or run every case "
+                                        "and report each failing case with its time (full).",
+                                   default=None)
+
+    limits_option_group = parser.add_argument_group("Submission Limits",
+                                                    "Grade each lab in its own process under resource limits")
+
+    limits_option_group.add_argument("--lab_timeout", action="store",
+                                     type=argparse_validation.is_positive_number,
+                                     help="Seconds a lab may run for before it is marked as timed out.",
+                                     default=None)
+
+    limits_option_group.add_argument("--lab_cpu", action="store",
+                                     type=argparse_validation.is_positive_number,
+                                     help="CPU seconds a lab may use. Defaults to the lab timeout.",
+                                     default=None)
+
+    limits_option_group.add_argument("--lab_memory", action="store",
+                                     type=argparse_validation.is_positive_number,
+                                     help="Megabytes of memory a lab may use before it is marked as out of memory.",
+                                     default=None)
+
+    limits_option_group.add_argument("--worker_mode", action="store",
+                                     choices=WORKER_MODES,
+                                     help="Grade labs within GradeO (inprocess), in a fresh interpreter per lab "
+                                          "(spawn) or in a fork of a process with the grader loaded (fork). "
+                                          "Defaults to fork when limits are set.",
+                                     default=None)
+
     email_option_group = parser.add_argument_group("Email Dispatcher", "Send's email's to students")
 
     email_option_group.add_argument("--enable_email", action="store_true",
@@ -70,44 +207,205 @@ def main():
                                     help="Sets the default send option.",
                                     default="NEVER")
 
+    email_option_group.add_argument("--smtp_server", action="store",
+                                    type=str,
+                                    help="The host:port of the SMTP server emails are sent through.",
+                                    default=SMTP_SERVER)
+
+    email_option_group.add_argument("--email_connections", action="store",
+                                    type=argparse_validation.is_positive_int,
+                                    help="Number of SMTP connections to send emails over at once.",
+                                    default=2)
+
+    email_option_group.add_argument("--email_rate", action="store",
+                                    type=argparse_validation.is_positive_number,
+                                    help="Send at most this many emails per second, to stay under the email "
+                                         "provider's limits.",
+                                    default=None)
+
+    email_option_group.add_argument("--outbox", action="store",
+                                    type=str,
+                                    help="Folder emails wait in until the outbox is flushed.",
+                                    default=".gradeo_outbox" + sep)
+
+    email_option_group.add_argument("--flush_outbox", action="store_true",
+                                    help="Send the emails waiting in the outbox, without grading any labs.",
+                                    default=False)
+
+    email_option_group.add_argument("--outbox_retries", action="store",
+                                    type=argparse_validation.is_positive_int,
+                                    help="How many times an email that could not be sent is sent again before it is "
+                                         "moved into the outbox's failed folder.",
+                                    default=5)
+
+    email_option_group.add_argument("--outbox_backoff", action="store",
+                                    type=argparse_validation.is_positive_number,
+                                    help="Seconds to wait before sending a failed email again. The wait doubles "
+                                         "after every failed attempt.",
+                                    default=2.0)
+
     parser.add_argument_group(email_option_group)
 
     # Parse arguments from command line arguments
     options = parser.parse_args()
 
+    # The default folder is only checked when labs are graded, so --export_csv and --flush_outbox work without one.
+    if options.labs is None and not options.export_csv and not options.flush_outbox:
+        try:
+            options.labs = argparse_validation.is_folder("labs" + sep)
+        except ArgumentTypeError as e:
+            parser.error("argument --labs: %s" % e)
+
+    has_limits = bool(options.lab_timeout or options.lab_cpu or options.lab_memory)
+
+    if options.worker_mode == WORKER_IN_PROCESS and has_limits:
+        parser.error("Labs graded in process can not be limited. Use the spawn or fork worker mode.")
+
+    if options.worker_mode == WORKER_FORK and not can_fork():
+        parser.error("The fork worker mode is not supported on this system.")
+
     # Pass to grade functionality
     try:
-        auto_grader = load_grader(options.grader)
-        course = auto_grader.course
-        section = auto_grader.section
-        print("Grader loaded: Course %s-%s and lab number %0.3d" % (course, section, auto_grader.lab_number))
+        auto_graders = load_graders(options.grader, TestOptions(options.test_timeout, options.test_mode))
     except:
         print("Error loading AutoGrader file.")
         print(format_exc())
         return
 
+    course = auto_graders[0].course
+    section = auto_graders[0].section
+
+    for auto_grader in auto_graders:
+        print("Grader loaded: Course %s-%s and lab number %0.3d" % (auto_grader.course, auto_grader.section,
+                                                                     auto_grader.lab_number))
+
+        if (auto_grader.course, auto_grader.section) != (course, section):
+            print("All AutoGraders must be for the same course and section.")
+            return
+
+    gradebook = None
+    gradebook_path = options.gradebook or (get_gradebook_path(options.csv) if options.csv else None)
+
+    if gradebook_path:
+        gradebook = Gradebook(gradebook_path)
+
+        # Grades from before the gradebook was kept are brought over the first time it is used.
+        if options.csv and not gradebook.has_grades(course, section):
+            import_csv(gradebook, options.csv, course, section)
+
+    if options.export_csv:
+        if gradebook is None:
+            parser.error("--export_csv needs a --gradebook to export.")
+
+        export_csv(gradebook, options.export_csv, course, section, auto_graders[-1].lab_number)
+        return
+
+    if options.flush_outbox:
+        ucid_account = get_grader_ucid_account()
+
+        if not ucid_account.is_login_available():
+            print("Grader did not input a username and password, the outbox was not sent.")
+            return
+
+        username, password = ucid_account.get_ucid_credentials()
+        sender = EmailManager(username, password, course, section, options.smtp_server, options.email_connections,
+                              options.email_rate)
+
+        try:
+            sent, set_aside = flush_outbox(Outbox(options.outbox), sender, options.outbox_retries,
+                                           options.outbox_backoff)
+        finally:
+            sender.close_smtp_connection()
+
+        print("Sent %d emails, %d could not be sent." % (sent, set_aside))
+        return
+
+    limits = None
+    worker_mode = options.worker_mode
+
+    if has_limits:
+        cpu_time = options.lab_cpu if options.lab_cpu else options.lab_timeout
+        memory = int(options.lab_memory * 1024 * 1024) if options.lab_memory else None
+        limits = SandboxLimits(options.lab_timeout, cpu_time, memory)
+
+    if worker_mode is None and has_limits:
+        worker_mode = WORKER_FORK if can_fork() else WORKER_SPAWN
+
+    cache = None
+
+    if not options.no_cache:
+        cache = GradeCache(options.cache_dir, int(options.cache_size * 1024 * 1024))
+
+    outbox = None
+
+    if options.enable_email or options.email_default == "ALWAYS":
+        outbox = Outbox(options.outbox)
+
     email_options = [options.enable_email, options.email_default, options.email_pref]
-    email_manager = EmailDispatcher(*email_options, course=course, section=section)
+    email_manager = EmailDispatcher(*email_options, course=course, section=section, outbox=outbox)
 
     output_manager = ConsoleOutputManager(options.short_print)
 
     move_finished_handler = MoveFinishedLabHandler(options.move_finished)
 
-    csv_manager = CSVManager(options.csv, auto_grader.lab_number)
+    gradebook_manager = None
+
+    if gradebook is not None:
+        gradebook_manager = GradebookManager(gradebook, course, section, auto_graders[-1].lab_number, options.csv)
+
+    item_analysis_manager = None
+
+    if options.item_analysis:
+        item_analysis_manager = ItemAnalysisManager(auto_graders, options.item_analysis)
+
+    cheating_manager = CheatingManager(options.find_similar, top=options.similarity_top, jobs=options.jobs,
+                                       corpus_folder=options.similarity_corpus, course=course)
 
-    cheating_manager = CheatingManager(options.find_similar)
+    profiler = None
 
+    if options.profile or options.profile_stats:
+        profiler = GradingProfiler(options.profile_stats)
+
+    journal = RunJournal(options.journal, options.resume)
+
+    # Labs are moved last so that every other handler can still read them.
     finished_lab_manager = FinishedLabManager([
         output_manager,
-        move_finished_handler,
         email_manager,
-        csv_manager,
-        cheating_manager
-    ])
+        gradebook_manager,
+        item_analysis_manager,
+        cheating_manager,
+        move_finished_handler
+    ], profiler, journal)
+
+    grading_options = [options.jobs, limits, worker_mode, cache]
+
+    if profiler is not None:
+        profiler.start()
+
+    finished, unfinished, lab_paths = journal.resume(find_lab_paths(options.labs),
+                                                     finished_lab_manager.get_journal_events())
+
+    if unfinished:
+        print("Resuming %d graded labs that were not finished." % len(unfinished))
+
+    if finished:
+        print("Reports also cover the %d labs the journaled run finished." % len(finished))
+        finished_lab_manager.replay_finished_labs(finished)
+
+    finished_lab_manager.handle_graded_lab(chain(unfinished, grade_labs(auto_graders, lab_paths, *grading_options)))
+
+    if options.watch:
+        def grade_arrived_labs(lab_paths):
+            finished_lab_manager.handle_graded_lab(grade_labs(auto_graders, lab_paths, *grading_options))
+
+        watch_labs(options.labs, grade_arrived_labs, options.watch_interval)
 
-    email_manager.shutdown()
+    journal.close()
 
-    finished_lab_manager.handle_graded_lab(load_labs(auto_grader, options.labs))
+    if profiler is not None:
+        profiler.stop()
+        profiler.finish()
 
 
 if __name__ == '__main__':
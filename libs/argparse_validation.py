@@ -1,3 +1,4 @@
+from math import isfinite
 from argparse import ArgumentTypeError
 from os.path import exists, isdir, isfile
 
@@ -26,6 +27,17 @@ def is_folder(path):
     raise ArgumentTypeError("%s is not an existing folder" % path)
 
 
+def is_file_or_folder(path):
+    """
+    Checks to see if a path represents an existing file or folder
+    :param path: The path to check
+    :return:
+    """
+    if exists(path) and (isfile(path) or isdir(path)):
+        return path
+    raise ArgumentTypeError("%s is not an existing file or folder" % path)
+
+
 def is_acceptable_email_default(default):
     """
     Checks to see if a path represents an existing folder
@@ -39,3 +51,35 @@ def is_acceptable_email_default(default):
         raise ArgumentTypeError("%s is not acceptable email default setting. Must be %s" % (default, acceptable_string))
 
     return default
+
+
+def is_positive_int(value):
+    """
+    Checks to see if a value represents a whole number greater than zero
+    :param value: The value to check
+    :return:
+    """
+    if not value.isdigit() or int(value) < 1:
+        raise ArgumentTypeError("%s is not a positive whole number" % value)
+
+    return int(value)
+
+
+def is_positive_number(value):
+    """
+    Checks to see if a value represents a number greater than zero
+    :param value: The value to check
+    :return:
+    """
+    try:
+        number = float(value)
+    except ValueError:
+        raise ArgumentTypeError("%s is not a number" % value)
+
+    if not isfinite(number):
+        raise ArgumentTypeError("%s is not a finite number" % value)
+
+    if number <= 0:
+        raise ArgumentTypeError("%s is not greater than zero" % value)
+
+    return number
@@ -1,6 +1,12 @@
-from os.path import basename
+import os
+import re
+from os.path import basename, isdir
+import importlib
 
 from libs.module_loader import load_module, get_module_functions, get_variables
+from libs.grader_cases import TestCase, TestTable, TestOptions, TEST_MODE_FAST, get_listed_cases, get_table, \
+    run_function_cases
+from libs.reference_oracle import get_reference_tables
 
 """
 
@@ -27,6 +33,27 @@ A grader is specified as follows:
         The test function will be able to run the student implementation as follows:
             student_implementation(parameters)
 
+    Functions can instead be tested with individual cases, each reported on its own:
+
+        def student_given_function_name_cases():
+            return [(arguments, expected_value), ...]
+
+        Every test function and case runs under a time budget of TEST_TIMEOUT seconds when the grader sets one:
+
+            TEST_TIMEOUT = 2
+
+    Numeric functions can be tested with a table of cases, earning partial credit for the fraction passed:
+
+        def student_given_function_name_table():
+            return {"inputs": [arguments, ...], "expected": [expected_value, ...], "tolerance": 1e-9}
+
+    Or from a reference solution and a generator of inputs, compared within REFERENCE_TOLERANCE if it is set:
+
+        def reference_student_given_function_name(parameters)
+
+        def student_given_function_name_inputs(rng):
+            return [arguments, ...]
+
         The graders must also implement at scorer method:
             This method is used to calculate the final score for labs.
             The method must accept two variables:
@@ -34,10 +61,16 @@ A grader is specified as follows:
                 The second is the percent, 0.0 to 1.0, of written answers correct.
 
                 This method must return the score for the lab submission.
+
+    Graders that rely on heavy libraries can list them so they are imported once before labs are forked:
+
+        PRELOAD_MODULES = ["numpy"]
 """
 
 __author__ = 'Joshua D. Katz'
 
+GRADER_FILE_NAME = re.compile(r"^hw\d{3}_[^_]+_[^_.]+\.py$")
+
 
 class AutoGrader:
     lab_number = None
@@ -45,24 +78,53 @@ class AutoGrader:
     section = None
     functions = None
     multiple_choice_answers = None
-
-    def __init__(self, lab_number, course, section, module):
+    grader_path = None
+    preload_modules = None
+    test_options = None
+    test_timeout = None
+    test_mode = None
+    test_cases = None
+    tested_function_names = None
+    reference_seed = None
+    reference_tolerance = None
+
+    def __init__(self, lab_number, course, section, module, grader_path=None, test_options=None):
         """
         Create the AutoGrader file that automates the scoring/grating process.
 
         :param lab_number: The lab number that we are grading.
         :param course: The class section that we are grading.
         :param module: The module of the AutoGrader script. Loaded from .py file.
+        :param grader_path: The path the AutoGrader script was loaded from. Used to reload it in worker processes.
+        :param test_options: TestOptions overriding how the grader's test cases are run.
         :return: AutoGrader object.
         """
         self.lab_number = lab_number
         self.course = course
         self.section = section
+        self.grader_path = grader_path
         self.functions = get_module_functions(module)
-
-        answers = {k.lower(): v.lower() for k, v in get_variables(module).items()}
+        self.preload_modules = list(getattr(module, "PRELOAD_MODULES", []))
+        self.test_options = test_options if test_options is not None else TestOptions()
+        self.test_timeout = self.test_options.timeout or getattr(module, "TEST_TIMEOUT", None)
+        self.test_mode = self.test_options.mode or TEST_MODE_FAST
+        self.test_cases = None
+        self.tested_function_names = None
+        self.reference_seed = getattr(module, "REFERENCE_SEED", 0)
+        self.reference_tolerance = getattr(module, "REFERENCE_TOLERANCE", None)
+
+        answers = {k.lower(): v.lower() for k, v in get_variables(module).items() if isinstance(v, str)}
         self.multiple_choice_answers = {int(k[8:]): v for k, v in answers.items() if k.startswith("answers")}
 
+    def preload(self):
+        """
+        Import every module listed in the grader's PRELOAD_MODULES.
+
+        :return:
+        """
+        for module_name in self.preload_modules:
+            importlib.import_module(module_name)
+
     def get_test_functions(self):
         """
         Get all of the AutoGrader functions that are used for testing labs.
@@ -71,7 +133,87 @@ class AutoGrader:
         """
         return {n[0:n.index("_test")]: f for n, f in self.functions.items() if n.endswith("_test")}
 
-    def score(self, lab_functions_defined, lab_multiple_choice_answers):
+    def get_case_functions(self):
+        """
+        Get all of the AutoGrader functions that list individual test cases.
+
+        :return: A dictionary who's keys are the function the cases test and who's value is the *_cases function.
+        """
+        return {n[0:n.rindex("_cases")]: f for n, f in self.functions.items() if n.endswith("_cases")}
+
+    def get_table_functions(self):
+        """
+        Get all of the AutoGrader functions that return a table of test cases.
+
+        :return: A dictionary who's keys are the function the table tests and who's value is the *_table function.
+        """
+        return {n[0:n.rindex("_table")]: f for n, f in self.functions.items() if n.endswith("_table")}
+
+    def get_reference_functions(self):
+        """
+        Get all of the AutoGrader's reference solutions.
+
+        :return: A dictionary who's keys are the function being tested and who's value is the reference_* function.
+        """
+        return {n[len("reference_"):]: f for n, f in self.functions.items() if n.startswith("reference_")}
+
+    def get_input_functions(self):
+        """
+        Get all of the AutoGrader functions that generate inputs for reference solutions.
+
+        :return: A dictionary who's keys are the function being tested and who's value is the *_inputs function.
+        """
+        return {n[0:n.rindex("_inputs")]: f for n, f in self.functions.items() if n.endswith("_inputs")}
+
+    def get_test_cases(self):
+        """
+        Get the cases every tested function is run against. The *_cases and *_table functions are only called once
+        per grader and reference solutions are only run when their saved outputs are out of date.
+
+        :return: A dictionary who's keys are the function being tested and who's values are lists of TestCases and
+                 TestTables.
+        """
+        if self.test_cases is None:
+            self.test_cases = {}
+
+            for name, test in self.get_test_functions().items():
+                self.test_cases[name] = [TestCase(name + "_test", test)]
+
+            for name, case_function in self.get_case_functions().items():
+                self.test_cases.setdefault(name, []).extend(get_listed_cases(name, case_function()))
+
+            for name, table_function in self.get_table_functions().items():
+                self.test_cases.setdefault(name, []).append(get_table(name, table_function()))
+
+            references = get_reference_tables(self.grader_path, self.get_reference_functions(),
+                                              self.get_input_functions(), self.reference_seed)
+
+            for name, (inputs, expected) in references.items():
+                self.test_cases.setdefault(name, []).append(TestTable(name, inputs, expected,
+                                                                      self.reference_tolerance))
+
+        return self.test_cases
+
+    def get_tested_function_names(self):
+        """
+        Get the names of every function the grader tests, in the order their incorrect bits are stored.
+
+        :return: A tuple of function names. The same tuple is returned every time so graded labs can share it.
+        """
+        if self.tested_function_names is None:
+            self.tested_function_names = tuple(self.get_test_cases())
+
+        return self.tested_function_names
+
+    def has_written_tests(self):
+        """
+        Check to see if the grader tests any functions. Graders without tests never need to run a lab's code.
+
+        :return: True if there is at least one test function, list of cases or table.
+        """
+        return bool(self.get_test_cases())
+
+    def score(self, lab_functions_defined, lab_multiple_choice_answers, test_timings=None, case_report=None):
 
         if not lab_functions_defined and not lab_multiple_choice_answers:
             return None, None, None
@@ -81,31 +223,52 @@ class AutoGrader:
         multiple_choice_response = (0, None)
         written_section_response = (0, None)
 
-        function_tests = self.get_test_functions()
+        function_tests = self.get_test_cases()
 
         if self.multiple_choice_answers:
             correct_answers = self.multiple_choice_answers
             multiple_choice_response = get_percent_multiple_correct(correct_answers, lab_multiple_choice_answers)
 
         if function_tests:
-            written_section_response = get_percent_written_correct(function_tests, lab_functions_defined)
+            written_section_response = get_percent_written_correct(function_tests, lab_functions_defined, test_timings,
+                                                                   self.test_timeout, self.test_mode, case_report)
 
         score = scorer(multiple_choice_response[0], written_section_response[0])
 
         return score, multiple_choice_response[1], written_section_response[1]
 
 
-def get_percent_written_correct(test_cases, lab_functions_defined):
+def get_percent_written_correct(test_cases, lab_functions_defined, test_timings=None, timeout=None,
+                                mode=TEST_MODE_FAST, case_report=None):
+    """
+    Run the test cases of every tested function.
+
+    :param test_cases: A dictionary of function names and the list of TestCases they are run against.
+    :param lab_functions_defined: The functions defined by the lab.
+    :param test_timings: A dictionary to store the seconds spent testing each function in, or None.
+    :param timeout: Seconds each case may run for if the case does not set its own.
+    :param mode: One of TEST_MODES.
+    :param case_report: A dictionary to store the label, outcome and seconds of each case run per function, or None.
+    :return: A tuple of the percent of written credit earned and a dictionary of which functions passed every case.
+    """
     correct = 0
     total = len(test_cases)
     score_set = {}
 
-    for name, test in test_cases.items():
+    for name, cases in test_cases.items():
 
-        score_set[name] = name in lab_functions_defined and test(lab_functions_defined[name])
+        if name not in lab_functions_defined:
+            score_set[name] = False
+            continue
 
-        if score_set[name]:
-            correct += 1
+        function_report = case_report.setdefault(name, []) if case_report is not None else None
+        credit, seconds = run_function_cases(cases, lab_functions_defined[name], timeout, mode, function_report)
+        score_set[name] = credit == 1.0
+
+        if test_timings is not None:
+            test_timings[name] = seconds
+
+        correct += credit
 
     return correct / total, score_set
 
@@ -123,11 +286,12 @@ def get_percent_multiple_correct(correct_answers, lab_multiple_choice_answers):
     return correct / total, score_set
 
 
-def load_grader(grader_path):
+def load_grader(grader_path, test_options=None):
     """
     Load the AutoGrader's script file.
 
     :param grader_path: Path to the AutoGrader script file
+    :param test_options: TestOptions overriding how the grader's test cases are run.
     :return: The AutoGrader file.
     """
     grader_file = basename(grader_path)
@@ -153,4 +317,50 @@ def load_grader(grader_path):
         print(module)
         raise Exception("Error loading AutoGrader module")
 
-    return AutoGrader(number, course, section, module)
+    auto_grader = AutoGrader(number, course, section, module, grader_path, test_options)
+
+    # Built once here so problems in the grader's cases are reported as it loads and reference outputs are saved
+    # before any worker process loads the grader.
+    auto_grader.get_test_cases()
+
+    return auto_grader
+
+
+def find_grader_paths(path):
+    """
+    Find the AutoGrader script files at a path.
+
+    :param path: Either an AutoGrader script file or a folder of files named like hw001_cs100_h01.py.
+    :return: A sorted list of paths to AutoGrader script files.
+    """
+    if not isdir(path):
+        return [path]
+
+    return sorted(entry.path for entry in os.scandir(path) if entry.is_file() and GRADER_FILE_NAME.match(entry.name))
+
+
+def load_graders(paths, test_options=None):
+    """
+    Load several AutoGrader script files. Every grader must be for a different lab number.
+
+    :param paths: AutoGrader script files or folders of AutoGrader script files.
+    :param test_options: TestOptions overriding how the graders' test cases are run.
+    :return: A list of AutoGraders sorted by lab number.
+    """
+    auto_graders = {}
+
+    for path in paths:
+        for grader_path in find_grader_paths(path):
+            auto_grader = load_grader(grader_path, test_options)
+
+            if auto_grader.lab_number in auto_graders:
+                other_path = auto_graders[auto_grader.lab_number].grader_path
+                raise Exception("AutoGraders %s and %s both grade lab %d" % (other_path, grader_path,
+                                                                              auto_grader.lab_number))
+
+            auto_graders[auto_grader.lab_number] = auto_grader
+
+    if not auto_graders:
+        raise Exception("No AutoGrader files found in %s" % ", ".join(paths))
+
+    return [auto_graders[lab_number] for lab_number in sorted(auto_graders)]
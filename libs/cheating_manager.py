@@ -1,105 +1,301 @@
 import ast
+from collections import ChainMap
 from libs.finished_manager import FinishedLabHandler
-from itertools import combinations
+from libs.module_loader import get_file_hash
+from libs.similarity import FingerprintIndex, get_fingerprints, get_postorder_tree, get_similar_tree_pairs, \
+    get_clusters, get_renamed_key
+from libs.similarity_corpus import SimilarityCorpus, CorpusSubmission
 
 __author__ = 'Joshua D. Katz'
 
 """
-Warning: You may think that at some time touching this code will be a good idea.
-You are mistaken.
+Finds labs that might have been copied from each other.
 
-This should be classified as a biohazard.
-Do not touch it.
+    Labs that are copies of an earlier lab, the same once their own names are renamed, are reported as copies without
+    being compared pair by pair. Only the first lab of each group of copies is compared with other labs.
+
+    Every other lab is fingerprinted as it is handled, so nothing but its fingerprints and normalized AST is kept.
+    Labs are only compared against labs for the same lab number that share at least one fingerprint with them. Pairs
+    sharing enough fingerprints are candidates, and a candidate is reported if the tree edit distance between the two
+    ASTs, relative to the larger tree, is within the similarity threshold.
+
+    Labs are reported in groups of labs connected by similar pairs, so a lab copied by several students is reviewed
+    once, with the most similar group first.
+
+    Given a corpus folder, labs are also compared against the labs of earlier runs for the same course, and are added
+    to the corpus once compared. See libs.similarity_corpus.
 """
 
 
-def levenshtein_ast_difference(first, second):
-    # http://stackoverflow.com/a/19598419
-    if type(first) is not type(second):  # Not equal case
-        return 1
+def get_ucid(lab):
+    return lab.ucid
 
-    if isinstance(first, ast.AST):
 
-        var_pairs = []
-        for k, v in vars(first).items():
-            if k in ("lineno", "col_offset", "ctx"):
-                continue
+def get_name(lab):
+    return str(lab) if isinstance(lab, CorpusSubmission) else lab.ucid
 
-            try:
-                attr = getattr(second, k)
-            except:
-                attr = None
 
-            var_pairs.append((v, attr))
+def get_tree_key(tree):
+    return tree.labels.tobytes(), tree.leftmost.tobytes()
 
-        test_set = [levenshtein_ast_difference(*pair) + 1 for pair in var_pairs]
-        if not test_set:
-            return 1
-        return max(test_set)
 
-    if isinstance(first, list):
-        if not isinstance(second, list):
-            return 1
+class CheatingManager(FinishedLabHandler):
+    replays_finished_labs = True
 
-        if not first or not second:
-            return 1
-        test_set = [levenshtein_ast_difference(*pair) + 1 for pair in zip(first, second)]
-        if not test_set:
-            return 1
-        return max(test_set)
+    def __init__(self, run, threshold=0.8, candidate_threshold=0.3, top=None, jobs=1, corpus_folder=None, course=None):
+        """
+        :param run: True to look for similar labs.
+        :param threshold: The similarity, 0.0 to 1.0, two labs must have to be reported. Labs are similar by one
+                          minus their tree edit distance over the size of the larger tree.
+        :param candidate_threshold: The fraction of fingerprints, 0.0 to 1.0, two labs must share to be compared.
+        :param top: The number of most similar pairs to report, or None to report every pair.
+        :param jobs: The number of processes to compare labs with.
+        :param corpus_folder: The folder holding the SimilarityCorpus of earlier runs, or None to only compare the
+                              labs of this run.
+        :param course: The course the labs are for, such as "cs100". Required with a corpus folder.
+        :return:
+        """
+        self.run = run
+        self.threshold = threshold
+        self.candidate_threshold = candidate_threshold
+        self.top = top
+        self.jobs = jobs
+        self.indexes = {}
+        self.trees = {}
+        self.distinct_trees = []
+        self.tree_numbers = {}
+        self.corpus_folder = corpus_folder
+        self.course = course
+        self.corpora = {}
+        self.file_hashes = {}
+        self.lab_keys = set()
+        self.copy_groups = {}
+        self.copy_hashes = {}
+        self.representatives = {}
+        self.copy_keys = {}
+        self.new_copies = []
+        self.new_labs = []
 
-    return 0 if first == second else 1
+    def handle_lab(self, lab, broken=False):
 
+        if not self.run:
+            return
 
-def module_len(module):
-    if isinstance(module, ast.AST):
+        path = lab.lab_path
+        try:
+            with open(path) as handle:
+                compiled = ast.parse(handle.read(), path)
+        except OSError:
+            print("Could not read %s, it is left out of the similarity report." % path)
+            return
+        except:
+            return
 
-        total = 0
-        for k, v in vars(module).items():
-            if k in ("lineno", "col_offset", "ctx"):
-                continue
+        # Hashed now, as the lab may be moved before the copies are reported or the corpus is saved.
+        file_hash = get_file_hash(path)
+        copy_key = (lab.lab_number, get_renamed_key(compiled))
+        group = self.copy_groups.setdefault(copy_key, [])
+        group.append(lab)
+        self.copy_keys[lab] = copy_key
+        self.copy_hashes.setdefault(copy_key, set()).add(file_hash)
 
-            total += module_len(v)
-        return total + 1
+        if self.corpus_folder is not None:
+            self.file_hashes[lab] = file_hash
+            self.lab_keys.add((lab.ucid, file_hash))
 
-    if isinstance(module, list):
-        return len(module) + 1
-    # print(str(type(module)))
-    return sum([module_len(x) for x in module.body])
+        if len(group) > 1:
+            self.representatives[lab] = group[0]
+            self.trees[lab] = self.trees[group[0]]
+            self.new_copies.append(lab)
+            return
 
+        index = self.indexes.setdefault(lab.lab_number, FingerprintIndex())
+        index.add(lab, get_fingerprints(compiled))
 
-class CheatingManager(FinishedLabHandler):
-    def __init__(self, run):
-        self.run = run
+        # Identical trees are shared, so every distinct pair of trees is only compared once.
+        self.trees[lab] = self.add_tree(get_postorder_tree(compiled))
+        self.new_labs.append(lab)
 
-    def handle_labs(self, lab_scores):
+    def add_tree(self, tree):
+        """
+        Add a tree to the distinct trees. Identical trees are shared, so every distinct pair of trees is only
+        compared once.
 
-        if not self.run:
-            return
+        :param tree: A PostorderTree.
+        :return: The position of the tree within the distinct trees.
+        """
+        tree_key = get_tree_key(tree)
 
-        lab_asts = {}
+        if tree_key not in self.tree_numbers:
+            self.tree_numbers[tree_key] = len(self.distinct_trees)
+            self.distinct_trees.append(tree)
 
-        for lab in lab_scores:
-            path = lab.lab_path
-            with open(path) as handle:
-                try:
-                    compiled = ast.parse(handle.read(), path)
-                except:
+        return self.tree_numbers[tree_key]
+
+    def get_corpus(self, lab_number):
+        """
+        Open the SimilarityCorpus of a lab number once.
+
+        :param lab_number: The lab number of the corpus.
+        :return: The SimilarityCorpus, or None if there is no corpus folder or the corpus can not be read.
+        """
+        if self.corpus_folder is None:
+            return None
+
+        if lab_number not in self.corpora:
+            try:
+                self.corpora[lab_number] = SimilarityCorpus(self.corpus_folder, self.course, lab_number)
+            except (OSError, ValueError) as error:
+                print("Could not open the similarity corpus: %s" % error)
+                self.corpora[lab_number] = None
+
+        return self.corpora[lab_number]
+
+    def get_corpus_candidates(self, corpus, index, labs, corpus_trees):
+        """
+        Find the labs of earlier runs that share enough fingerprints with new labs to be compared.
+
+        :param corpus: The SimilarityCorpus of the labs' lab number.
+        :param index: The FingerprintIndex of the labs' lab number.
+        :param labs: The new labs.
+        :param corpus_trees: A dictionary to add the position of each CorpusSubmission's tree to.
+        :return: A list of tuples of a new lab and a CorpusSubmission.
+        """
+        candidates = []
+
+        for lab in labs:
+            for _, submission in corpus.get_similar(index.fingerprints[lab], self.candidate_threshold, lab.ucid):
+                # The same file graded again in this run is already compared as a lab of this run.
+                if (submission.ucid, submission.file_hash) in self.lab_keys:
                     continue
-                # print("%s %d" % (lab.ucid, module_len(compiled)))
-                lab_asts[lab] = (compiled, module_len(compiled))
-        all_combinations = combinations(lab_asts.items(), 2)
-        diffthresh = [x[1] for x in lab_asts.values()]
 
-        mind = min(diffthresh)
-        maxd = max(diffthresh)
+                if submission not in corpus_trees:
+                    corpus_trees[submission] = self.add_tree(corpus.get_tree(submission.number))
 
-        threash = mind + ((maxd - mind) / 2)
+                candidates.append((lab, submission))
 
-        all_distances = [(c[0][0], c[1][0]) for c in all_combinations if
-                         levenshtein_ast_difference(c[0][1][0], c[1][1][0]) >= threash]
-        for c, v in all_distances:
-            print("Lab from %s and %s might be similar" % (c.ucid, v.ucid))
+        return candidates
 
-    def handle_lab(self, lab, broken=False):
-        pass
+    def save_corpus(self, corpus, index, labs):
+        """
+        Add new labs to the corpus of their lab number.
+
+        :param corpus: The SimilarityCorpus of the labs' lab number.
+        :param index: The FingerprintIndex of the labs' lab number.
+        :param labs: The new labs.
+        :return:
+        """
+        for lab in labs:
+            corpus.add(lab.ucid, self.file_hashes.pop(lab), index.fingerprints[self.representatives.get(lab, lab)],
+                       self.distinct_trees[self.trees[lab]])
+
+        try:
+            corpus.save()
+        except OSError as error:
+            print("Could not save the similarity corpus: %s" % error)
+
+    def finish(self):
+        """
+        Compare every lab handled since the last finish against every lab handled so far.
+        :return:
+        """
+        if not self.run or not (self.new_labs or self.new_copies):
+            return
+
+        new_labs = self.new_labs
+        new_copies = self.new_copies
+        self.new_labs = []
+        self.new_copies = []
+
+        self.print_copies(new_copies)
+
+        pairs = []
+        tree_pairs = {}
+        corpus_trees = {}
+        trees = ChainMap(self.trees, corpus_trees)
+
+        for lab_number, index in sorted(self.indexes.items()):
+            labs = [lab for lab in new_labs if lab.lab_number == lab_number]
+
+            candidates = [(a, b) for _, a, b in index.get_similar_pairs(labs, self.candidate_threshold)]
+            corpus = self.get_corpus(lab_number)
+
+            if corpus is not None:
+                candidates.extend(self.get_corpus_candidates(corpus, index, labs, corpus_trees))
+
+            for a, b in candidates:
+                first_tree, second_tree = sorted((trees[a], trees[b]))
+
+                if first_tree == second_tree:
+                    pairs.append((1.0, 0, a, b))
+                else:
+                    tree_pairs.setdefault((first_tree, second_tree), []).append((a, b))
+
+        scored = get_similar_tree_pairs(self.distinct_trees, list(tree_pairs), self.threshold, self.top, self.jobs)
+
+        for similarity, distance, first_tree, second_tree in scored:
+            pairs.extend((similarity, distance, a, b) for a, b in tree_pairs[(first_tree, second_tree)])
+
+        pairs = [(similarity, distance, min(a, b, key=get_ucid), max(a, b, key=get_ucid))
+                 for similarity, distance, a, b in pairs]
+        pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2].lab_number, pair[2].ucid, pair[3].ucid))
+
+        if self.top is not None:
+            pairs = pairs[:self.top]
+
+        self.print_clusters(pairs)
+
+        for lab_number, index in sorted(self.indexes.items()):
+            corpus = self.get_corpus(lab_number)
+
+            if corpus is not None:
+                self.save_corpus(corpus, index, [lab for lab in new_labs + new_copies if lab.lab_number == lab_number])
+
+    def print_copies(self, new_copies):
+        """
+        Print every group of copies that a new lab was added to.
+
+        :param new_copies: The labs found to be copies of an earlier lab since the last finish.
+        :return:
+        """
+        copy_keys = sorted(set(self.copy_keys[lab] for lab in new_copies),
+                           key=lambda copy_key: (copy_key[0], self.copy_groups[copy_key][0].ucid))
+
+        for copy_key in copy_keys:
+            ucids = sorted(lab.ucid for lab in self.copy_groups[copy_key])
+            kind = "identical files" if len(self.copy_hashes[copy_key]) == 1 else "identical once renamed"
+            print("Labs from %s are copies of each other (%s)" % (", ".join(ucids), kind))
+
+    def get_name(self, lab):
+        """
+        Get how a lab is named in the report of similar labs.
+
+        :param lab: A lab, or a CorpusSubmission.
+        :return: The name of the lab, noting how many copies of it there are.
+        """
+        if lab not in self.copy_keys or len(self.copy_groups[self.copy_keys[lab]]) == 1:
+            return get_name(lab)
+
+        return "%s (and %d copies)" % (get_name(lab), len(self.copy_groups[self.copy_keys[lab]]) - 1)
+
+    def print_clusters(self, pairs):
+        """
+        Print the pairs of similar labs grouped into clusters of labs connected by them.
+
+        :param pairs: Tuples of the similarity, tree edit distance and both labs, most similar first.
+        :return:
+        """
+        clusters = get_clusters((first, second) for _, _, first, second in pairs)
+        cluster_numbers = {lab: number for number, cluster in enumerate(clusters) for lab in cluster}
+        cluster_pairs = [[] for _ in clusters]
+
+        for pair in pairs:
+            cluster_pairs[cluster_numbers[pair[2]]].append(pair)
+
+        for cluster, pairs in zip(clusters, cluster_pairs):
+            print("Labs from %s might be similar" % ", ".join(sorted(self.get_name(lab) for lab in cluster)))
+
+            for similarity, distance, first, second in pairs:
+                print("    %s and %s (tree edit distance %d, %d%% similar)" % (self.get_name(first),
+                                                                         self.get_name(second), distance,
+                                                                         similarity * 100))
@@ -1,5 +1,5 @@
 from os.path import exists, isfile
-from libs.finished_manager import FinishedLabHandler
+from libs.finished_manager import FinishedLabHandler, JOURNAL_BEFORE_HANDLING
 import smtplib
 from os.path import basename
 from traceback import print_exc
@@ -8,27 +8,43 @@ from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 import json
-from libs.ucid_login import get_grader_ucid_account
+from multiprocessing.pool import ThreadPool
+from libs.smtp_pool import SMTPConnectionPool, RateLimiter
 
 __author__ = "Joshua D. Katz"
 
+SMTP_SERVER = "smtp.gmail.com:587"
+
+# Seconds to wait on the SMTP server before a connection is treated as dropped.
+SMTP_TIMEOUT = 60
+
 
 class EmailManager:
-    def __init__(self, grader_ucid, password, course, section):
+    def __init__(self, grader_ucid, password, course, section, server=SMTP_SERVER, connections=1, rate=None,
+                 use_tls=True):
         """
         Create an EmailManager for a grader by UCID and password.
 
         :param grader_ucid: The grader's UCID.
-        :param password: The password for the grader's email.
+        :param password: The password for the grader's email, or None to send without logging in.
         :param course: The course that is being graded.
         :param section: The section that is being grader.
+        :param server: The "host:port" of the SMTP server.
+        :param connections: The number of connections emails are sent over at once.
+        :param rate: The most emails sent per second, or None for no limit.
+        :param use_tls: True to secure connections with STARTTLS.
         :return:
         """
         self.grader_ucid = grader_ucid
         self.password = password
         self.course = course
         self.section = section
-        self.connection = None
+        self.server = server
+        self.use_tls = use_tls
+        self.connections = connections
+        self.pool = SMTPConnectionPool(self.open_smtp_connection, connections)
+        self.rate_limiter = RateLimiter(rate)
+        self.sender = None
 
     @staticmethod
     def get_email_address(ucid):
@@ -40,27 +56,38 @@ class EmailManager:
         """
         return "%s@njit.edu" % ucid
 
-    def get_smtp_connection(self):
+    def open_smtp_connection(self):
         """
-        Get the SMTP connection for the EmailManager.
+        Open a new SMTP connection for the EmailManager's pool.
 
         :return: an instance of smtplib.SMTP
         """
-        if self.connection is None:
-            self.connection = smtplib.SMTP("smtp.gmail.com:587")
-            self.connection.starttls()
-            self.connection.login(self.get_email_address(self.grader_ucid), self.password)
-        return self.connection
+        connection = smtplib.SMTP(self.server, timeout=SMTP_TIMEOUT)
+
+        try:
+            if self.use_tls:
+                connection.starttls()
+
+            if self.password is not None:
+                connection.login(self.get_email_address(self.grader_ucid), self.password)
+        except:
+            connection.close()
+            raise
+
+        return connection
 
     def close_smtp_connection(self):
         """
-        Close the SMTP connection.
+        Close the SMTP connections.
 
         :return:
         """
-        if self.connection is not None:
-            self.connection.quit()
-        self.connection = None
+        if self.sender is not None:
+            self.sender.close()
+            self.sender.join()
+            self.sender = None
+
+        self.pool.close()
 
     def create_mime_multipart_email_to(self, receiver_ucid, message, subject, attachments=None):
         """
@@ -109,9 +136,9 @@ class EmailManager:
 
         return email
 
-    def send_email(self, ucid, message, subject=None, attachments=None):
+    def deliver_email(self, ucid, message, subject=None, attachments=None):
         """
-        Send an email to a person by UCID.
+        Send an email to a person by UCID, raising any error sending it.
 
         :param ucid: The UCID to send the email to.
         :param message: The message to send to the ucid.
@@ -119,39 +146,70 @@ class EmailManager:
         :param attachments: Attachments for the email, None if nothing to attach.
         :return:
         """
-        try:
-
-            connection = self.get_smtp_connection()
+        if subject is None:
+            subject = "%s-%s email from %s" % (self.course, self.section, self.grader_ucid)
 
-            if subject is None:
-                subject = "%s-%s email from %s" % (self.course, self.section, self.grader_ucid)
+        email = self.create_mime_multipart_email_to(ucid, message, subject, attachments)
 
-            email = self.create_mime_multipart_email_to(ucid, message, subject, attachments)
+        self.rate_limiter.wait()
+        self.pool.sendmail(email["From"], email["To"], email.as_string())
 
-            connection.sendmail(email["From"], email["To"], email.as_string())
+    def send_email(self, ucid, message, subject=None, attachments=None):
+        """
+        Send an email to a person by UCID. See deliver_email for the parameters.
 
-        except smtplib.SMTPAuthenticationError:
+        :return: None if the email was sent, otherwise the error sending it.
+        """
+        try:
+            self.deliver_email(ucid, message, subject, attachments)
+        except smtplib.SMTPAuthenticationError as e:
             print("Error connection to SMTP.")
             print_exc()
+            return e
+        except (smtplib.SMTPException, OSError) as e:
+            print("Error sending email to %s." % ucid)
+            print_exc()
+            return e
+
+        return None
+
+    def send_emails(self, emails):
+        """
+        Send several emails, over as many connections at once as the EmailManager has.
+
+        :param emails: A list of tuples of the UCID, message and subject of each email.
+        :return: A list of None for each email that was sent or the error sending it.
+        """
+        if self.sender is None:
+            self.sender = ThreadPool(self.connections)
+
+        return self.sender.starmap(self.send_email, emails)
 
 
 class EmailDispatcher(FinishedLabHandler):
-    def __init__(self, enable_email, email_default, preferences_path, course, section):
+    # Journaled before the email is put in the outbox, so a resumed run never emails a student twice.
+    journal_event = "emailed"
+    journal_when = JOURNAL_BEFORE_HANDLING
+
+    def __init__(self, enable_email, email_default, preferences_path, course, section, outbox=None):
         """
-        Initialize an email dispatcher object. This will collect the login info for the grader UCID.
+        Initialize an email dispatcher object. Emails are put in an outbox and sent by flushing it later.
 
         :param enable_email: If email should be enabled.
         :param email_default: The default setting to use for email.
         :param preferences_path: The path to the preferences for files for student email preferences.
         :param course: The course that the AutoGrader is grading for.
         :param section: The section that the AutoGrader is grading for.
+        :param outbox: The Outbox to put emails in, or None to never email.
         :return:
         """
         self.enable_email = enable_email
         self.email_default = email_default
         self.course = course
         self.section = section
-        self.email_manager = None
+        self.outbox = outbox
+        self.queued = 0
+        self.preferences = None
 
         if not exists(preferences_path) or not isfile(preferences_path):
             self.enable_email = email_default == "ALWAYS"
@@ -164,19 +222,8 @@ class EmailDispatcher(FinishedLabHandler):
             self.preferences_path = preferences_path
             self.preferences = json.load(open(preferences_path))
 
-        if not self.enable_email:
-            return
-
-        ucid_account = get_grader_ucid_account()
-
-        if not ucid_account.is_login_available():
-            print("Grader did not input a username and password, email has been disabled.")
+        if self.outbox is None:
             self.enable_email = False
-            return
-
-        username, password = get_grader_ucid_account().get_ucid_credentials()
-
-        self.email_manager = EmailManager(username, password, course, section)
 
     def get_dispatch_preference(self, ucid):
         """
@@ -220,15 +267,14 @@ class EmailDispatcher(FinishedLabHandler):
         if (not error and not email_case == "ALWAYS") or email_case == "NEVER":
             return
 
-        self.email_manager.send_email(submitter_ucid, printout)
+        self.outbox.add(submitter_ucid, printout)
+        self.queued += 1
 
-    def shutdown(self):
-        """
-        Shutdown the EmailDispatcher and it's EmailManager instance.
-        :return:
-        """
-        if self.email_manager is not None:
-            self.email_manager.close_smtp_connection()
+    def finish(self):
+        if self.queued:
+            print("%d emails are waiting in %s. Send them with --flush_outbox." % (self.queued,
+                                                                                 self.outbox.outbox_folder))
+        self.queued = 0
 
     def handle_lab(self, lab, broken=False):
 
@@ -2,30 +2,136 @@ from abc import ABCMeta, abstractmethod
 
 __author__ = 'Joshua D. Katz'
 
+# When a handler's journal event is written for a lab.
+JOURNAL_AFTER_HANDLING = "after handling"
+JOURNAL_BEFORE_HANDLING = "before handling"
+JOURNAL_AFTER_FINISH = "after finish"
+
 
 class FinishedLabManager:
-    def __init__(self, finished_lab_handlers):
-        self.finished_lab_handlers = finished_lab_handlers
-        pass
+    def __init__(self, finished_lab_handlers, profiler=None, journal=None):
+        self.finished_lab_handlers = [handler for handler in finished_lab_handlers if handler is not None]
+        self.profiler = profiler
+        self.journal = journal
+        self.journal_on_finish = {handler: [] for handler in self.finished_lab_handlers}
+
+    def get_journal_events(self):
+        return [handler.journal_event for handler in self.finished_lab_handlers if handler.journal_event is not None]
 
     def has_finished_lab_handlers(self):
         return bool(self.finished_lab_handlers)
 
+    def handle_finished_lab(self, lab):
+        """
+        Pass a single graded lab to every handler as soon as it is graded.
+
+        :param lab: The graded lab.
+        :return:
+        """
+        broken = lab.is_lab_correct()
+
+        if self.profiler is not None:
+            self.profiler.record_lab(lab)
+
+        if self.journal is not None:
+            self.journal.journal_graded(lab)
+
+        for handler in self.finished_lab_handlers:
+            event = handler.journal_event if self.journal is not None else None
+
+            if event is not None:
+                if self.journal.has_event(lab, event):
+                    continue
+
+                # Written to disk first, so a run that dies while handling the lab never handles it again.
+                if handler.journal_when == JOURNAL_BEFORE_HANDLING:
+                    self.journal.journal_event(lab, event, sync=True)
+
+            if self.profiler is not None:
+                self.profiler.time_handler(handler, handler.handle_lab, lab, broken)
+            else:
+                handler.handle_lab(lab, broken)
+
+            if event is not None:
+                if handler.journal_when == JOURNAL_AFTER_HANDLING:
+                    self.journal.journal_event(lab, event)
+                elif handler.journal_when == JOURNAL_AFTER_FINISH:
+                    self.journal_on_finish[handler].append(lab)
+
+    def finish(self):
+        """
+        Tell every handler that there are no more labs to handle.
+
+        :return:
+        """
+        for handler in self.finished_lab_handlers:
+            if self.profiler is not None:
+                self.profiler.time_handler(handler, handler.finish)
+            else:
+                handler.finish()
+
+            finished_labs = self.journal_on_finish[handler]
+            self.journal_on_finish[handler] = []
+
+            for lab in finished_labs:
+                self.journal.journal_event(lab, handler.journal_event)
+
+    def replay_finished_labs(self, labs):
+        """
+        Pass labs finished by a journaled run to the handlers that report over every lab of a run, so a resumed run
+        reports on the whole run. Nothing is journaled.
+
+        :param labs: The LabResults every handler finished handling in the journaled run.
+        :return:
+        """
+        handlers = [handler for handler in self.finished_lab_handlers if handler.replays_finished_labs]
+
+        for lab in labs:
+            for handler in handlers:
+                handler.handle_lab(lab, lab.is_lab_correct())
+
     def handle_graded_lab(self, labs):
+        """
+        Stream graded labs through every handler, then finish the handlers.
+
+        :param labs: An iterable of graded labs. Labs are handled as they are produced.
+        :return:
+        """
         if not self.has_finished_lab_handlers():
+            for lab in labs:
+                if self.profiler is not None:
+                    self.profiler.record_lab(lab)
             return
 
-        for handler in self.finished_lab_handlers:
-            if handler is None:
-                continue
-            handler.handle_labs(labs)
+        for lab in labs:
+            self.handle_finished_lab(lab)
+
+        self.finish()
 
 
 class FinishedLabHandler(metaclass=ABCMeta):
+    # What a RunJournal records once the handler has handled a lab, or None for handlers that simply handle every lab
+    # again when a run is resumed. journal_when is one of the JOURNAL_* timings.
+    journal_event = None
+    journal_when = JOURNAL_AFTER_HANDLING
+
+    # True for handlers that report over every lab of a run, so a resumed run also passes them the labs the journaled
+    # run finished.
+    replays_finished_labs = False
+
     def handle_labs(self, lab_scores):
         for labs in lab_scores:
             self.handle_lab(labs, labs.is_lab_correct())
+        self.finish()
 
     @abstractmethod
     def handle_lab(self, lab, broken=False):
         pass
+
+    def finish(self):
+        """
+        Called once every lab has been passed to handle_lab. Handlers that work on every lab at once do so here.
+
+        :return:
+        """
+        pass
@@ -0,0 +1,159 @@
+import os
+import sys
+import pickle
+import hashlib
+from os.path import join, exists, isdir, basename
+from libs.lab_submissions import Lab, LabResult, LAB_FINISHED
+from libs.module_loader import get_file_hash
+
+"""
+Caches the outcome of grading a lab so unchanged labs are not graded again.
+
+    Entries are keyed by the SHA-256 of the lab file and its file name, the SHA-256 of the AutoGrader file it was
+    graded with, the options its test cases were run with, the resource limits and worker mode it was graded under
+    and the version of Python grading the lab. Changing any of them will grade the lab again.
+
+    Each entry is stored in its own file within the cache folder. Reading an entry touches its file, so once the
+    folder grows past its size limit the least recently used entries are removed first.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+# Part of every key, so entries stored in an older layout are never read back.
+CACHE_FORMAT = "4"
+
+
+class GradeCache:
+    def __init__(self, cache_folder, max_size):
+        """
+        Create a cache of graded labs.
+
+        :param cache_folder: The folder to store cached grades in. Created if it does not exist.
+        :param max_size: The number of bytes the cache folder may use.
+        :return:
+        """
+        self.cache_folder = cache_folder
+        self.max_size = max_size
+        self.grader_hashes = {}
+
+        if not exists(cache_folder) or not isdir(cache_folder):
+            os.makedirs(cache_folder)
+
+    def get_grader_hash(self, grader_path):
+        """
+        Get the SHA-256 of an AutoGrader file. Each grader is only hashed once.
+
+        :param grader_path: Path to the AutoGrader script file.
+        :return: The hex digest of the grader.
+        """
+        if grader_path not in self.grader_hashes:
+            self.grader_hashes[grader_path] = get_file_hash(grader_path)
+
+        return self.grader_hashes[grader_path]
+
+    def get_key(self, grader_path, lab_path, test_options=None, limits=None, worker_mode=None):
+        """
+        Get the key of a lab's entry.
+
+        :param grader_path: Path to the AutoGrader script file the lab is graded with.
+        :param lab_path: The path to the submitted lab file.
+        :param test_options: The TestOptions the AutoGrader was loaded with.
+        :param limits: The SandboxLimits the lab is graded under.
+        :param worker_mode: The worker mode the lab is graded with.
+        :return: A hex digest identifying the lab, the AutoGrader, its test options, the limits and worker mode and the
+                 version of Python.
+        """
+        key = "\n".join([get_file_hash(lab_path), basename(lab_path), self.get_grader_hash(grader_path),
+                         repr(test_options), repr(limits), repr(worker_mode), sys.version, CACHE_FORMAT])
+        return hashlib.sha256(key.encode("utf8")).hexdigest()
+
+    def get_entry_path(self, grader_path, lab_path, test_options=None, limits=None, worker_mode=None):
+        return join(self.cache_folder, self.get_key(grader_path, lab_path, test_options, limits, worker_mode) +
+                    ".pickle")
+
+    def get(self, grader_path, lab_path, test_options=None, limits=None, worker_mode=None):
+        """
+        Get the cached grade for a lab.
+
+        :param grader_path: Path to the AutoGrader script file the lab is graded with.
+        :param lab_path: The path to the submitted lab file.
+        :param test_options: The TestOptions the AutoGrader was loaded with.
+        :param limits: The SandboxLimits the lab is graded under.
+        :param worker_mode: The worker mode the lab is graded with.
+        :return: None if the lab is not cached, otherwise a tuple of the LabResult and the output printed grading it.
+        """
+        entry_path = self.get_entry_path(grader_path, lab_path, test_options, limits, worker_mode)
+
+        try:
+            with open(entry_path, "rb") as handle:
+                entry = pickle.load(handle)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        os.utime(entry_path)
+
+        lab_number = Lab.get_lab_from_filename(lab_path)
+        ucid = Lab.get_ucid_from_filename(lab_path)
+        result = LabResult(ucid, lab_number, lab_path, entry["score"], entry["function_bits"], entry["question_bits"],
+                           entry["function_names"], entry["load_error"], test_report=entry["test_report"],
+                           answers=entry["answers"])
+
+        return result, entry["output"]
+
+    def put(self, grader_path, lab_path, result, output, test_options=None, limits=None, worker_mode=None):
+        """
+        Store the grade of a lab. Labs that did not finish grading are not stored as their limits may change.
+
+        :param grader_path: Path to the AutoGrader script file the lab was graded with.
+        :param lab_path: The path to the submitted lab file.
+        :param result: The LabResult of the lab.
+        :param output: The output printed while grading the lab.
+        :param test_options: The TestOptions the AutoGrader was loaded with.
+        :param limits: The SandboxLimits the lab was graded under.
+        :param worker_mode: The worker mode the lab was graded with.
+        :return:
+        """
+        if result is None or result.outcome != LAB_FINISHED:
+            return
+
+        entry = {
+            "score": result.score,
+            "function_bits": result.function_bits,
+            "question_bits": result.question_bits,
+            "function_names": result.function_names,
+            "load_error": result.load_error,
+            "test_report": result.test_report,
+            "answers": result.answers,
+            "output": output
+        }
+
+        entry_path = self.get_entry_path(grader_path, lab_path, test_options, limits, worker_mode)
+        temporary_path = "%s.%d.tmp" % (entry_path, os.getpid())
+
+        with open(temporary_path, "wb") as handle:
+            pickle.dump(entry, handle)
+
+        os.replace(temporary_path, entry_path)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits within its size limit.
+
+        :return:
+        """
+        entries = []
+
+        for entry in os.scandir(self.cache_folder):
+            if entry.is_file() and entry.name.endswith(".pickle"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+
+            os.remove(path)
+            total_size -= size
@@ -0,0 +1,228 @@
+import os
+import csv
+import sqlite3
+from datetime import datetime
+from itertools import groupby
+from os.path import exists, isfile, splitext
+from libs.lab_submissions import LAB_FINISHED, LAB_TIMED_OUT, LAB_OUT_OF_MEMORY
+
+"""
+Stores the grades of every student in a SQLite database.
+
+    Each grade is a row keyed by the course, section, UCID and lab number of the lab, so recording a lab only touches
+    its own row and a run only writes the labs it graded. Every batch of grades is recorded within one transaction, so
+    a run that stops part way leaves the gradebook as it was after the last batch.
+
+    The gradebook is exported to the CSV layout imported into Google Sheets on demand. Each line is a UCID followed by
+    the grade of every lab in order, blank for labs the student has not submitted:
+
+        jk369,65.0,,TIMEOUT
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+UNFINISHED_LAB_VALUES = {
+    LAB_TIMED_OUT: "TIMEOUT",
+    LAB_OUT_OF_MEMORY: "OOM"
+}
+
+# The score column has no type so that scores are read back exactly as they were recorded, 65 or 65.0.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grades (
+    course TEXT NOT NULL,
+    section TEXT NOT NULL,
+    ucid TEXT NOT NULL,
+    lab_number INTEGER NOT NULL,
+    score,
+    outcome TEXT NOT NULL,
+    graded_at TEXT NOT NULL,
+    PRIMARY KEY (course, section, ucid, lab_number)
+);
+CREATE INDEX IF NOT EXISTS grades_by_ucid ON grades (ucid);
+CREATE INDEX IF NOT EXISTS grades_by_lab ON grades (course, section, lab_number);
+"""
+
+UPSERT_GRADE = """
+INSERT INTO grades (course, section, ucid, lab_number, score, outcome, graded_at) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (course, section, ucid, lab_number) DO UPDATE SET
+    score = excluded.score, outcome = excluded.outcome, graded_at = excluded.graded_at
+"""
+
+
+def get_csv_value(score, outcome):
+    """
+    Get the value stored in the CSV for a graded lab.
+
+    :param score: The score of the lab, or None if no score was calculated.
+    :param outcome: How grading the lab ended, one of the LAB_* outcomes.
+    :return: The score, TIMEOUT or OOM for labs that did not finish, or -1 if no score was calculated.
+    """
+    if outcome in UNFINISHED_LAB_VALUES:
+        return UNFINISHED_LAB_VALUES[outcome]
+
+    return score if score is not None else -1
+
+
+def get_grade_from_csv_value(value):
+    """
+    Get the score and outcome of a grade read from a CSV.
+
+    :param value: The text of a single grade.
+    :return: A tuple of the score and outcome, or None if the value is blank.
+    """
+    value = value.strip()
+
+    if not value:
+        return None
+
+    for outcome, unfinished_value in UNFINISHED_LAB_VALUES.items():
+        if value == unfinished_value:
+            return None, outcome
+
+    for number_type in (int, float):
+        try:
+            return number_type(value), LAB_FINISHED
+        except ValueError:
+            pass
+
+    return value, LAB_FINISHED
+
+
+def get_gradebook_path(csv_file):
+    """
+    Get the gradebook kept for a CSV file given without a gradebook, such as grades.sqlite for grades.csv.
+
+    :param csv_file: The path to the CSV file.
+    :return: The path to the gradebook.
+    """
+    return splitext(csv_file)[0] + ".sqlite"
+
+
+class Gradebook:
+    def __init__(self, database_path):
+        """
+        Open a gradebook, creating it if it does not exist.
+
+        :param database_path: The path to the SQLite database file.
+        :return:
+        """
+        self.database_path = database_path
+        self.connection = sqlite3.connect(database_path)
+
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def record_grades(self, course, section, grades):
+        """
+        Record the grades of labs within a single transaction, replacing any earlier grade of the same lab.
+
+        :param course: The course the labs are for.
+        :param section: The section the labs are for.
+        :param grades: Tuples of the UCID, lab number, score and outcome of each lab.
+        :return:
+        """
+        graded_at = datetime.now().isoformat(timespec="seconds")
+
+        with self.connection:
+            self.connection.executemany(UPSERT_GRADE, ((course, section, ucid, lab_number, score, outcome, graded_at)
+                                                       for ucid, lab_number, score, outcome in grades))
+
+    def has_grades(self, course, section):
+        cursor = self.connection.execute("SELECT 1 FROM grades WHERE course = ? AND section = ? LIMIT 1",
+                                         (course, section))
+        return cursor.fetchone() is not None
+
+    def get_lab_count(self, course, section):
+        """
+        Get the highest lab number with a grade.
+
+        :param course: The course of the labs.
+        :param section: The section of the labs.
+        :return: The highest lab number, or 0 if there are no grades.
+        """
+        cursor = self.connection.execute("SELECT MAX(lab_number) FROM grades WHERE course = ? AND section = ?",
+                                         (course, section))
+        return cursor.fetchone()[0] or 0
+
+    def get_grades(self, course, section):
+        """
+        Get every grade of a course and section.
+
+        :param course: The course of the labs.
+        :param section: The section of the labs.
+        :return: A cursor of tuples of the UCID, lab number, score and outcome, ordered by UCID and lab number.
+        """
+        return self.connection.execute("SELECT ucid, lab_number, score, outcome FROM grades "
+                                       "WHERE course = ? AND section = ? ORDER BY ucid, lab_number",
+                                       (course, section))
+
+
+def get_ucid_of_grade(grade):
+    return grade[0]
+
+
+def export_csv(gradebook, csv_file, course, section, lab_count=0):
+    """
+    Write the grades of a course and section to a CSV, one student at a time. The CSV is written next to its final
+    path and then moved into place, so it is never left half written.
+
+    :param gradebook: The Gradebook to export.
+    :param csv_file: The path to write the CSV to.
+    :param course: The course to export.
+    :param section: The section to export.
+    :param lab_count: The fewest labs each line has a column for. Lines have a column for every lab with a grade.
+    :return:
+    """
+    lab_count = max(lab_count, gradebook.get_lab_count(course, section))
+    temporary_path = "%s.%d.tmp" % (csv_file, os.getpid())
+
+    try:
+        with open(temporary_path, "w", newline="") as handle:
+            writer = csv.writer(handle, lineterminator="\n")
+
+            for ucid, grades in groupby(gradebook.get_grades(course, section), key=get_ucid_of_grade):
+                row = [""] * lab_count
+
+                for _, lab_number, score, outcome in grades:
+                    if 1 <= lab_number <= lab_count:
+                        row[lab_number - 1] = get_csv_value(score, outcome)
+
+                writer.writerow([ucid] + row)
+
+        os.replace(temporary_path, csv_file)
+    finally:
+        if exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def import_csv(gradebook, csv_file, course, section):
+    """
+    Record the grades of a CSV written before the gradebook was kept.
+
+    :param gradebook: The Gradebook to record the grades in.
+    :param csv_file: The path to the CSV.
+    :param course: The course the grades are for.
+    :param section: The section the grades are for.
+    :return:
+    """
+    if not exists(csv_file) or not isfile(csv_file):
+        return
+
+    grades = []
+
+    with open(csv_file, newline="") as handle:
+        for row in csv.reader(handle):
+            if not row:
+                continue
+
+            for lab_number, value in enumerate(row[1:], 1):
+                grade = get_grade_from_csv_value(value)
+
+                if grade is not None:
+                    grades.append((row[0].strip(), lab_number) + grade)
+
+    gradebook.record_grades(course, section, grades)
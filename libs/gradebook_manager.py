@@ -0,0 +1,41 @@
+from libs.finished_manager import FinishedLabHandler, JOURNAL_AFTER_FINISH
+from libs.gradebook import export_csv
+
+__author__ = 'Joshua D. Katz'
+
+
+class GradebookManager(FinishedLabHandler):
+    # Grades are only in the gradebook once finish has recorded them.
+    journal_event = "recorded"
+    journal_when = JOURNAL_AFTER_FINISH
+
+    def __init__(self, gradebook, course, section, lab_number, csv_file=None):
+        """
+        Records the grade of every handled lab in a Gradebook.
+
+        :param gradebook: The Gradebook to record grades in.
+        :param course: The course the labs are for.
+        :param section: The section the labs are for.
+        :param lab_number: The fewest labs the CSV has a column for.
+        :param csv_file: The path to export the gradebook to as a CSV after every batch of labs, or None.
+        :return:
+        """
+        self.gradebook = gradebook
+        self.course = course
+        self.section = section
+        self.lab_number = lab_number
+        self.csv_file = csv_file
+        self.grades = []
+
+    def handle_lab(self, lab, broken=False):
+        self.grades.append((lab.ucid, lab.lab_number, lab.score, lab.outcome))
+
+    def finish(self):
+        grades = self.grades
+        self.grades = []
+
+        if grades:
+            self.gradebook.record_grades(self.course, self.section, grades)
+
+        if self.csv_file:
+            export_csv(self.gradebook, self.csv_file, self.course, self.section, self.lab_number)
@@ -0,0 +1,414 @@
+import copy
+import math
+import signal
+import threading
+from functools import partial
+from time import perf_counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+Runs an AutoGrader's test cases against the functions of a lab.
+
+    A grader tests a student's function with a single test function:
+
+        def add_two_test(implementation):
+            return implementation(2) == 4 and implementation(10) == 12
+
+    or with a list of individual cases. Each case is a tuple of the arguments and the expected return value, and may
+    add a timeout of its own. A single argument does not need to be wrapped in a tuple:
+
+        def add_two_cases():
+            return [(2, 4), (10, 12), ((1000,), 1002, 0.5)]
+
+    Numeric functions can be given a table of many cases. A function tested with a table gets partial credit for the
+    fraction of the table it passes. Floats are compared within the tolerance, if one is given:
+
+        def circle_area_table():
+            return {"inputs": [0.5 * n for n in range(500)],
+                    "expected": [math.pi * (0.5 * n) ** 2 for n in range(500)],
+                    "tolerance": 1e-9}
+
+    When NumPy is installed the student's function is first called once with a NumPy array per argument. Rows that
+    do not pass that way, or every row if the function can not take arrays, are then called one at a time.
+
+    Every test function and every case is run under its own time budget, TEST_TIMEOUT seconds in the grader unless
+    --test_timeout is given, so one case that never returns only costs its own budget. Tests run in one of two modes:
+
+        fast: Stop testing a function at its first failing case. Enough to know if the function is correct.
+        full: Run every case and record the outcome and seconds taken of each case in the lab's report.
+
+    Time budgets are enforced with SIGALRM, so they only apply on Unix within the main thread. Elsewhere cases run
+    unbounded and only the --lab_timeout of the whole lab applies.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+TEST_MODE_FAST = "fast"
+TEST_MODE_FULL = "full"
+TEST_MODES = [TEST_MODE_FAST, TEST_MODE_FULL]
+
+CASE_PASSED = "passed"
+CASE_FAILED = "failed"
+CASE_ERROR = "error"
+CASE_TIMED_OUT = "timed out"
+
+# NumPy dtype kinds that tables are vectorised over: booleans, integers and floats.
+NUMERIC_KINDS = "biuf"
+
+# Values a student's function can not change, so they are passed without being copied.
+IMMUTABLE_TYPES = (bool, int, float, complex, str, bytes, type(None))
+
+
+class TestCaseTimeout(BaseException):
+    """
+    Raised within a case that ran past its time budget. Not an Exception so that student code catching Exception
+    can not swallow it.
+    """
+    pass
+
+
+class TestOptions:
+    def __init__(self, timeout=None, mode=None):
+        """
+        Options for running test cases that override the AutoGrader's own.
+
+        :param timeout: Seconds each case may run for, or None to use the grader's TEST_TIMEOUT.
+        :param mode: One of TEST_MODES, or None for TEST_MODE_FAST.
+        :return:
+        """
+        self.timeout = timeout
+        self.mode = mode
+
+    def __repr__(self):
+        return "TestOptions(%r, %r)" % (self.timeout, self.mode)
+
+
+class TestCase:
+    def __init__(self, label, check, timeout=None):
+        """
+        A single check of a student's function.
+
+        :param label: How the case is named in reports, such as "add_two(2)".
+        :param check: A function taking the student's implementation, returning True if the case passed.
+        :param timeout: Seconds this case may run for, or None to use the grader's timeout.
+        :return:
+        """
+        self.label = label
+        self.check = check
+        self.timeout = timeout
+
+
+def is_close(actual, expected, tolerance=None):
+    """
+    Compare a returned value to the expected value.
+
+    :param actual: The value returned by the student's function.
+    :param expected: The expected value.
+    :param tolerance: The relative and absolute difference allowed between numbers, or None to compare exactly.
+    :return: True if the values match.
+    """
+    if tolerance is None or isinstance(actual, bool) or not isinstance(actual, (int, float)):
+        return actual == expected
+
+    return math.isclose(actual, expected, rel_tol=tolerance, abs_tol=tolerance)
+
+
+def copy_case_values(args, expected):
+    """
+    Copy the arguments and expected value of a case for a single call of a student's function.
+
+    :param args: The arguments of the case.
+    :param expected: The expected value of the case.
+    :return: A tuple of copies of the arguments and the expected value. Numbers and strings are not copied.
+    """
+    if isinstance(expected, IMMUTABLE_TYPES) and all(isinstance(arg, IMMUTABLE_TYPES) for arg in args):
+        return args, expected
+
+    return copy.deepcopy((args, expected))
+
+
+def check_case(args, expected, tolerance, implementation):
+    # Copies, so a function that changes its arguments can not change the case for the next student.
+    args, expected = copy_case_values(args, expected)
+    return is_close(implementation(*args), expected, tolerance)
+
+
+def get_case_label(name, args, length=60):
+    """
+    Get the label of a case, showing the call that is tested.
+
+    :param name: The name of the function being tested.
+    :param args: The arguments the function is called with.
+    :param length: The longest label to return.
+    :return: A label such as "add_two(2)".
+    """
+    label = "%s(%s)" % (name, ", ".join(repr(arg) for arg in args))
+    return label if len(label) <= length else label[:length - 3] + "..."
+
+
+def get_listed_cases(name, rows):
+    """
+    Get the cases of a function from the rows returned by a grader's *_cases function.
+
+    :param name: The name of the function being tested.
+    :param rows: Tuples of the arguments, the expected value and optionally the timeout of the case.
+    :return: A list of TestCases.
+    """
+    cases = []
+
+    for row in rows:
+        args, expected = row[0], row[1]
+        timeout = row[2] if len(row) > 2 else None
+
+        if not isinstance(args, tuple):
+            args = (args,)
+
+        cases.append(TestCase(get_case_label(name, args), partial(check_case, args, expected, None), timeout))
+
+    return cases
+
+
+class TestTable:
+    def __init__(self, name, inputs, expected, tolerance=None, timeout=None):
+        """
+        A table of cases for a single function, run in bulk.
+
+        :param name: The name of the function being tested.
+        :param inputs: The arguments of each row. A single argument does not need to be wrapped in a tuple.
+        :param expected: The expected return value of each row.
+        :param tolerance: The relative and absolute difference allowed between numbers, or None to compare exactly.
+        :param timeout: Seconds each call may run for, or None to use the grader's timeout.
+        :return:
+        """
+        self.name = name
+        self.args = [row if isinstance(row, tuple) else (row,) for row in inputs]
+        self.expected = list(expected)
+        self.tolerance = tolerance
+        self.timeout = timeout
+        self.columns = None
+        self.expected_array = None
+
+        if len(self.args) != len(self.expected):
+            raise ValueError("The table for %s has %d inputs but %d expected values" % (name, len(self.args),
+                                                                                       len(self.expected)))
+
+        self.cases = [TestCase(get_case_label(name, args), partial(check_case, args, expected, tolerance), timeout)
+                      for args, expected in zip(self.args, self.expected)]
+
+        if numpy is not None:
+            self.build_arrays()
+
+    def __len__(self):
+        return len(self.cases)
+
+    def build_arrays(self):
+        """
+        Build a NumPy array for every argument, and one for the expected values, if the table is entirely numeric.
+
+        :return:
+        """
+        if not self.args or len(set(len(args) for args in self.args)) != 1:
+            return
+
+        try:
+            columns = [numpy.array(column) for column in zip(*self.args)]
+            expected_array = numpy.array(self.expected)
+        except (ValueError, TypeError):
+            return
+
+        arrays = columns + [expected_array]
+
+        if all(array.ndim == 1 and array.dtype.kind in NUMERIC_KINDS for array in arrays):
+            self.columns = columns
+            self.expected_array = expected_array
+
+    def run_vectorised(self, implementation, timeout):
+        """
+        Call the student's function once with every row at once.
+
+        :param implementation: The student's function.
+        :param timeout: Seconds the call may run for.
+        :return: A list of whether each row passed, or None if the function could not be called with arrays.
+        """
+        if self.columns is None:
+            return None
+
+        # Copies, so a function that changes its arguments can not change the table for the next student.
+        columns = [column.copy() for column in self.columns]
+
+        try:
+            with numpy.errstate(all="ignore"):
+                actual = numpy.asarray(call_with_timeout(implementation, columns, timeout))
+
+                if actual.shape != self.expected_array.shape or actual.dtype.kind not in NUMERIC_KINDS:
+                    return None
+
+                if self.tolerance is None:
+                    return (actual == self.expected_array).tolist()
+
+                return numpy.isclose(actual, self.expected_array, rtol=self.tolerance, atol=self.tolerance).tolist()
+        except TestCaseTimeout:
+            return None
+        except MemoryError:
+            raise
+        except Exception:
+            return None
+
+    def run(self, implementation, timeout, mode, case_report=None):
+        """
+        Run every row of the table against the student's function.
+
+        Rows passed by the vectorised call are not run again. Every other row is run on its own, so a function
+        that gives the wrong answer for arrays, such as one that branches on its argument, is still graded fairly.
+        Each row is called with a copy of its arguments, as the same rows are used for every student.
+
+        :param implementation: The student's function.
+        :param timeout: Seconds each call may run for if the table does not set its own.
+        :param mode: One of TEST_MODES. In fast mode the rest of the table is failed once a row times out.
+        :param case_report: A list to append a tuple of the label, outcome and seconds of each row run on its own
+                            to, or None. Rows passed by the vectorised call are reported as a single entry.
+        :return: A tuple of the number of rows passed and the seconds taken.
+        """
+        timeout = self.timeout or timeout
+        start = perf_counter()
+        vectorised = self.run_vectorised(implementation, timeout)
+        seconds = perf_counter() - start
+
+        if vectorised is None:
+            vectorised = [False] * len(self.cases)
+        elif case_report is not None:
+            case_report.append(("%s vectorised on %d of %d rows" % (self.name, sum(vectorised), len(vectorised)),
+                                CASE_PASSED, seconds))
+
+        passed = 0
+
+        for case, vectorised_passed in zip(self.cases, vectorised):
+            if vectorised_passed:
+                passed += 1
+                continue
+
+            outcome, case_seconds = run_case(case, implementation, timeout)
+            seconds += case_seconds
+
+            if case_report is not None:
+                case_report.append((case.label, outcome, case_seconds))
+
+            if outcome == CASE_PASSED:
+                passed += 1
+            elif outcome == CASE_TIMED_OUT and mode != TEST_MODE_FULL:
+                break
+
+        return passed, seconds
+
+
+def get_table(name, table):
+    """
+    Get the TestTable of a function from the dictionary returned by a grader's *_table function.
+
+    :param name: The name of the function being tested.
+    :param table: A dictionary of "inputs", "expected" and optionally "tolerance" and "timeout".
+    :return: A TestTable.
+    """
+    return TestTable(name, table["inputs"], table["expected"], table.get("tolerance"), table.get("timeout"))
+
+
+def can_time_cases():
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+def raise_case_timeout(signal_number, frame):
+    raise TestCaseTimeout()
+
+
+def call_with_timeout(func, args, timeout):
+    """
+    Call a function, interrupting it once it runs past a time budget.
+
+    :param func: The function to call.
+    :param args: The arguments to call it with.
+    :param timeout: Seconds the call may take, or None to never interrupt it.
+    :return: The return value of the function. Raises TestCaseTimeout if it ran out of time.
+    """
+    if not timeout or not can_time_cases():
+        return func(*args)
+
+    previous_handler = signal.signal(signal.SIGALRM, raise_case_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def run_case(case, implementation, timeout):
+    """
+    Run a single case against a student's function.
+
+    :param case: The TestCase to run.
+    :param implementation: The student's function.
+    :param timeout: Seconds the case may run for if the case does not set its own.
+    :return: A tuple of the outcome, one of the CASE_* values, and the seconds the case took.
+    """
+    start = perf_counter()
+
+    try:
+        outcome = CASE_PASSED if call_with_timeout(case.check, (implementation,), case.timeout or timeout) \
+            else CASE_FAILED
+    except TestCaseTimeout:
+        outcome = CASE_TIMED_OUT
+    except MemoryError:
+        raise
+    except Exception:
+        outcome = CASE_ERROR
+
+    return outcome, perf_counter() - start
+
+
+def run_function_cases(cases, implementation, timeout, mode, case_report=None):
+    """
+    Run every case of a single function.
+
+    :param cases: The TestCases and TestTables of the function.
+    :param implementation: The student's function.
+    :param timeout: Seconds each case may run for if the case does not set its own.
+    :param mode: One of TEST_MODES.
+    :param case_report: A list to append a tuple of the label, outcome and seconds of each case to, or None.
+    :return: A tuple of the credit for the function, 0.0 to 1.0, and the seconds taken by all the cases. Any failed
+             case gives no credit, otherwise the credit is the fraction of table rows passed.
+    """
+    correct = True
+    seconds = 0.0
+    table_passed = 0
+    table_total = 0
+
+    for case in cases:
+        if isinstance(case, TestTable):
+            passed, case_seconds = case.run(implementation, timeout, mode, case_report)
+            seconds += case_seconds
+            table_passed += passed
+            table_total += len(case)
+            continue
+
+        outcome, case_seconds = run_case(case, implementation, timeout)
+        seconds += case_seconds
+
+        if case_report is not None:
+            case_report.append((case.label, outcome, case_seconds))
+
+        if outcome != CASE_PASSED:
+            correct = False
+
+            if mode != TEST_MODE_FULL:
+                break
+
+    if not correct:
+        return 0.0, seconds
+
+    return (table_passed / table_total if table_total else 1.0), seconds
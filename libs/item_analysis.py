@@ -0,0 +1,256 @@
+import os
+import csv
+from os.path import exists
+from libs.finished_manager import FinishedLabHandler
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+Item analysis of the multiple choice questions of a whole section.
+
+    The answers of every graded lab are kept as a row of a students by questions matrix, each answer coded as its
+    position within the sorted list of every answer given. Once every lab is graded each question gets:
+
+        difficulty:      The fraction of students who answered it correctly. Low values are hard questions.
+        discrimination:  The fraction of the top 27% of students, ranked by lab score, who answered it correctly less
+                         the fraction of the bottom 27% who did. Questions the weaker students get right more often
+                         than the stronger students, below zero, usually have a wrong or ambiguous answer.
+        frequencies:     How many students gave each answer, so distractors nobody picks or that draw more students
+                         than the answer stand out.
+
+    When NumPy is installed each of these is computed for every question at once from the matrix. Without it the
+    matrix is scored one answer at a time, giving the same report, only slower.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+# The fraction of students at each end of the ranking compared by the discrimination index.
+DISCRIMINATION_GROUP = 0.27
+
+# Questions answered correctly by fewer students than this, or with a discrimination index below the lowest, are
+# reported as possibly broken.
+LOWEST_DIFFICULTY = 0.2
+LOWEST_DISCRIMINATION = 0.0
+
+# How a blank answer is written in the report.
+BLANK_ANSWER = "(blank)"
+
+
+class QuestionAnalysis:
+    __slots__ = ["lab_number", "number", "answer", "difficulty", "discrimination", "frequencies"]
+
+    def __init__(self, lab_number, number, answer, difficulty, discrimination, frequencies):
+        """
+        The item analysis of a single multiple choice question.
+
+        :param lab_number: The lab number the question is from.
+        :param number: The number of the question.
+        :param answer: The correct answer of the question.
+        :param difficulty: The fraction, 0.0 to 1.0, of students who answered correctly.
+        :param discrimination: The discrimination index, -1.0 to 1.0, of the question.
+        :param frequencies: A dictionary of every answer given and the number of students who gave it.
+        :return:
+        """
+        self.lab_number = lab_number
+        self.number = number
+        self.answer = answer
+        self.difficulty = difficulty
+        self.discrimination = discrimination
+        self.frequencies = frequencies
+
+    def might_be_broken(self):
+        return self.difficulty < LOWEST_DIFFICULTY or self.discrimination < LOWEST_DISCRIMINATION
+
+    def get_frequency_report(self):
+        """
+        Get how often each answer was given, most common first.
+
+        :return: A string such as "a 512, b 30, (blank) 2".
+        """
+        frequencies = sorted(self.frequencies.items(), key=lambda item: (-item[1], item[0]))
+        return ", ".join("%s %d" % (answer or BLANK_ANSWER, count) for answer, count in frequencies)
+
+
+def get_group_size(student_count):
+    return max(1, int(round(DISCRIMINATION_GROUP * student_count)))
+
+
+def get_ranking(scores):
+    """
+    Rank students from the lowest lab score to the highest. Students with equal scores keep the order they were
+    graded in, so the groups compared are the same every run.
+
+    :param scores: The lab score of every student.
+    :return: A list of student positions.
+    """
+    return sorted(range(len(scores)), key=lambda student: scores[student])
+
+
+def analyze_matrix_vectorized(codes, key_codes, scores, choice_count):
+    """
+    Score a matrix of coded answers with NumPy.
+
+    :param codes: A list of rows, one per student, of the code of the answer given to each question.
+    :param key_codes: The code of the correct answer of each question.
+    :param scores: The lab score of every student.
+    :param choice_count: The number of distinct answers coded.
+    :return: A tuple of the difficulty, discrimination and answer counts of each question as lists.
+    """
+    codes = numpy.array(codes, dtype=numpy.int32)
+    student_count, question_count = codes.shape
+
+    correct = codes == numpy.array(key_codes, dtype=numpy.int32)
+    difficulty = correct.mean(axis=0)
+
+    group_size = get_group_size(student_count)
+    ranking = numpy.argsort(numpy.array(scores, dtype=numpy.float64), kind="stable")
+    discrimination = correct[ranking[-group_size:]].mean(axis=0) - correct[ranking[:group_size]].mean(axis=0)
+
+    # Each question's codes are offset into its own block of choice_count counts and every answer is counted at once.
+    offsets = codes + numpy.arange(question_count, dtype=numpy.int32) * choice_count
+    counts = numpy.bincount(offsets.ravel(), minlength=question_count * choice_count)
+
+    return difficulty.tolist(), discrimination.tolist(), counts.reshape(question_count, choice_count).tolist()
+
+
+def analyze_matrix(codes, key_codes, scores, choice_count):
+    """
+    Score a matrix of coded answers one answer at a time. See analyze_matrix_vectorized.
+    """
+    student_count = len(codes)
+    question_count = len(key_codes)
+
+    correct_counts = [0] * question_count
+    counts = [[0] * choice_count for _ in range(question_count)]
+
+    for row in codes:
+        for question, code in enumerate(row):
+            counts[question][code] += 1
+
+            if code == key_codes[question]:
+                correct_counts[question] += 1
+
+    ranking = get_ranking(scores)
+    group_size = get_group_size(student_count)
+
+    def get_group_correct(group):
+        return [sum(codes[student][question] == key_codes[question] for student in group) / group_size
+                for question in range(question_count)]
+
+    upper = get_group_correct(ranking[-group_size:])
+    lower = get_group_correct(ranking[:group_size])
+
+    difficulty = [correct / student_count for correct in correct_counts]
+    discrimination = [upper_correct - lower_correct for upper_correct, lower_correct in zip(upper, lower)]
+
+    return difficulty, discrimination, counts
+
+
+def analyze_items(lab_number, correct_answers, responses, scores):
+    """
+    Run an item analysis of every multiple choice question of a lab.
+
+    :param lab_number: The lab number the answers are for.
+    :param correct_answers: The AutoGrader's correct answer of each question by number.
+    :param responses: A list of rows, one per student, of the answer given to each question in question order.
+    :param scores: The lab score of every student.
+    :return: A list of QuestionAnalysis in question order, empty if nobody answered.
+    """
+    if not responses:
+        return []
+
+    numbers = sorted(correct_answers)
+    choices = sorted({answer for row in responses for answer in row} | set(correct_answers.values()))
+    choice_codes = {choice: code for code, choice in enumerate(choices)}
+
+    codes = [[choice_codes[answer] for answer in row] for row in responses]
+    key_codes = [choice_codes[correct_answers[number]] for number in numbers]
+
+    analyze = analyze_matrix_vectorized if numpy is not None else analyze_matrix
+    difficulty, discrimination, counts = analyze(codes, key_codes, scores, len(choices))
+
+    return [QuestionAnalysis(lab_number, number, correct_answers[number], difficulty[question],
+                             discrimination[question],
+                             {choices[code]: count for code, count in enumerate(counts[question]) if count})
+            for question, number in enumerate(numbers)]
+
+
+def write_report(analyses, report_path):
+    """
+    Write an item analysis to a CSV. The CSV is written next to its final path and then moved into place.
+
+    :param analyses: A list of QuestionAnalysis.
+    :param report_path: The path to write the CSV to.
+    :return:
+    """
+    temporary_path = "%s.%d.tmp" % (report_path, os.getpid())
+
+    try:
+        with open(temporary_path, "w", newline="") as handle:
+            writer = csv.writer(handle, lineterminator="\n")
+            writer.writerow(["lab", "question", "answer", "students", "difficulty", "discrimination", "answers"])
+
+            for analysis in analyses:
+                writer.writerow([analysis.lab_number, analysis.number, analysis.answer,
+                                 sum(analysis.frequencies.values()), "%.3f" % analysis.difficulty,
+                                 "%.3f" % analysis.discrimination, analysis.get_frequency_report()])
+
+        os.replace(temporary_path, report_path)
+    finally:
+        if exists(temporary_path):
+            os.remove(temporary_path)
+
+
+class ItemAnalysisManager(FinishedLabHandler):
+    replays_finished_labs = True
+
+    def __init__(self, auto_graders, report_path=None):
+        """
+        Collects the multiple choice answers of every handled lab and reports an item analysis of each question.
+
+        :param auto_graders: The AutoGraders labs are graded with.
+        :param report_path: The path to write the item analysis to as a CSV, or None to only print broken questions.
+        :return:
+        """
+        self.correct_answers = {auto_grader.lab_number: auto_grader.multiple_choice_answers
+                                for auto_grader in auto_graders if auto_grader.multiple_choice_answers}
+        self.report_path = report_path
+        self.responses = {lab_number: [] for lab_number in self.correct_answers}
+        self.scores = {lab_number: [] for lab_number in self.correct_answers}
+
+    def handle_lab(self, lab, broken=False):
+        if lab.answers is None or lab.lab_number not in self.correct_answers:
+            return
+
+        numbers = sorted(self.correct_answers[lab.lab_number])
+        self.responses[lab.lab_number].append([lab.answers.get(number, "") for number in numbers])
+        self.scores[lab.lab_number].append(lab.score)
+
+    def get_analyses(self):
+        analyses = []
+
+        for lab_number in sorted(self.correct_answers):
+            analyses.extend(analyze_items(lab_number, self.correct_answers[lab_number], self.responses[lab_number],
+                                          self.scores[lab_number]))
+
+        return analyses
+
+    def finish(self):
+        analyses = self.get_analyses()
+
+        if not analyses:
+            return
+
+        if self.report_path:
+            write_report(analyses, self.report_path)
+
+        broken = [analysis for analysis in analyses if analysis.might_be_broken()]
+
+        for analysis in broken:
+            print("Question %d of lab %0.3d might be broken: %d%% answered %s, discrimination %.2f (%s)" % (
+                analysis.number, analysis.lab_number, round(100 * analysis.difficulty), analysis.answer,
+                analysis.discrimination, analysis.get_frequency_report()))
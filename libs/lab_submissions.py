@@ -1,7 +1,20 @@
-from os import listdir
-from os.path import join, isfile, basename
-from libs.report_card import get_incorrect_report, get_error_report
-from libs.module_loader import get_variables, load_module, get_module_functions
+import os
+import ast
+import hashlib
+from os.path import basename, dirname
+from io import StringIO
+from contextlib import redirect_stdout
+from time import perf_counter
+from functools import partial
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from libs.report_card import get_incorrect_report, get_error_report, get_outcome_report
+from libs.sandbox import run_spawned, run_forked, SandboxLimits, SandboxTimeout, SandboxOutOfMemory, SandboxCrashed
+from libs.module_loader import get_variables, load_module, unload_module, get_module_functions, get_literal_variables
+from libs.auto_grader import AutoGrader, load_grader
+from libs.grader_cases import TEST_MODE_FULL
 from traceback import format_exc
 
 """
@@ -20,6 +33,21 @@ Used to load labs from students.
 
 __author__ = 'Joshua D. Katz'
 
+LAB_FINISHED = "finished"
+LAB_TIMED_OUT = "timed out"
+LAB_OUT_OF_MEMORY = "out of memory"
+
+# What happened to a lab that did not finish, as said in its report.
+LAB_OUTCOME_PHRASES = {
+    LAB_TIMED_OUT: "timed out",
+    LAB_OUT_OF_MEMORY: "ran out of memory"
+}
+
+WORKER_IN_PROCESS = "inprocess"
+WORKER_SPAWN = "spawn"
+WORKER_FORK = "fork"
+WORKER_MODES = [WORKER_IN_PROCESS, WORKER_SPAWN, WORKER_FORK]
+
 
 class GraderNotAcceptable(Exception):
     pass
@@ -30,45 +58,212 @@ class GradeOFailed(Exception):
         self.gradeo_error = gradeo_error
 
 
-class Lab:
+def get_bitset(report, keys=None):
+    """
+    Get a bitset of the entries of a report that were incorrect.
+
+    :param report: A dictionary of keys and whether they were correct, or None.
+    :param keys: The keys giving each bit its position, or None if the keys are already bit positions.
+    :return: An int with a bit set for every incorrect entry.
+    """
+    if not report:
+        return 0
+
+    if keys is None:
+        return sum(1 << key for key, correct in report.items() if not correct)
+
+    return sum(1 << bit for bit, key in enumerate(keys) if not report.get(key, True))
+
+
+def get_bit_positions(bits):
+    """
+    Get the positions of every set bit.
+
+    :param bits: A bitset.
+    :return: A list of the positions of the set bits, from lowest to highest.
+    """
+    positions = []
+    position = 0
+
+    while bits:
+        if bits & 1:
+            positions.append(position)
+
+        bits >>= 1
+        position += 1
+
+    return positions
+
+
+class LabResult:
+    __slots__ = ["ucid", "lab_number", "lab_path", "score", "function_bits", "question_bits", "function_names",
+                 "load_error", "outcome", "timings", "test_report", "answers"]
+
+    def __init__(self, ucid, lab_number, lab_path, score=None, function_bits=0, question_bits=0, function_names=(),
+                 load_error=None, outcome=LAB_FINISHED, timings=None, test_report=None, answers=None):
+        """
+        The outcome of grading a lab submission.
+
+        This holds everything the finished lab handlers need from a graded lab but none of the student's code,
+        so it can be pickled and passed back from a worker process. Incorrect functions and questions are kept as
+        bitsets so a graded lab only takes up a few hundred bytes.
+
+        :param ucid: The UCID of the submitter.
+        :param lab_number: The lab number of the submission.
+        :param lab_path: The path to the submitted lab file.
+        :param score: The score calculated by the AutoGrader or None if no score was calculated.
+        :param function_bits: A bitset of the incorrect functions, bit N being function_names[N].
+        :param question_bits: A bitset of the incorrect multiple choice questions, bit N being question N.
+        :param function_names: The functions tested by the AutoGrader, shared by every lab it grades.
+        :param load_error: The traceback text if the lab could not be loaded, otherwise None.
+        :param outcome: LAB_FINISHED if grading ran to completion, otherwise LAB_TIMED_OUT or LAB_OUT_OF_MEMORY.
+        :param timings: Seconds spent grading the lab, a dictionary with "grade", "import" and per function "tests".
+        :param test_report: The label, outcome and seconds of every case run per function when tests are run in
+                            full mode, otherwise None.
+        :param answers: The lowercase answer given to each of the AutoGrader's multiple choice questions by number,
+                        or None if the lab's answers were not graded.
+        """
+        self.ucid = ucid
+        self.lab_number = lab_number
+        self.lab_path = lab_path
+        self.score = score
+        self.function_bits = function_bits
+        self.question_bits = question_bits
+        self.function_names = function_names
+        self.load_error = load_error
+        self.outcome = outcome
+        self.timings = timings
+        self.test_report = test_report
+        self.answers = answers
+
+    @property
+    def functions_incorrect(self):
+        return [self.function_names[bit] for bit in get_bit_positions(self.function_bits)]
+
+    @property
+    def multiple_choice_incorrect(self):
+        return get_bit_positions(self.question_bits)
+
+    def has_finished(self):
+        return self.outcome == LAB_FINISHED
+
+    def has_load_error(self):
+        return self.score is None and self.load_error is not None
+
+    def is_lab_correct(self):
+        if not self.has_finished() or self.has_load_error():
+            return False
+
+        return not self.function_bits and not self.question_bits
+
+    def get_score_report(self, short_hand):
+
+        if not self.has_finished():
+            return get_outcome_report(self.ucid, LAB_OUTCOME_PHRASES.get(self.outcome, self.outcome), short_hand)
+
+        if self.has_load_error():
+            return get_error_report(self.ucid, self.load_error)
+
+        if self.score is None:
+            return "%s did not submit anything that could be graded" % self.ucid
+
+        if not short_hand and not self.is_lab_correct():
+            return get_incorrect_report(self.ucid, self.score, self.functions_incorrect, self.multiple_choice_incorrect,
+                                        self.test_report)
+
+        return "%s received a %d" % (self.ucid, self.score)
+
+
+class Lab(LabResult):
+    __slots__ = ["module"]
+
     def __init__(self, auto_grader, lab_path):
         self.lab_number = self.get_lab_from_filename(lab_path)
         self.ucid = self.get_ucid_from_filename(lab_path)
         self.lab_path = lab_path
-        self.module = load_module(lab_path)
-        self.multiple_choice_answers = None
-        self.score = None
-        self.functions_incorrect = None
-        self.multiple_choice_incorrect = None
 
         if self.lab_number is not auto_grader.lab_number:
             raise GraderNotAcceptable("Attempted to use incorrect AutoGrader for grading.")
 
-        if type(self.module) is str:
+        start = perf_counter()
+        self.module = load_module(lab_path) if auto_grader.has_written_tests() else None
+        self.timings = {"import": perf_counter() - start, "tests": {}}
+        self.test_report = {} if auto_grader.test_mode == TEST_MODE_FULL else None
+        self.load_error = self.module if type(self.module) is str else None
+        self.outcome = LAB_FINISHED
+        self.score = None
+        self.function_bits = 0
+        self.question_bits = 0
+        self.answers = None
+        self.function_names = auto_grader.get_tested_function_names()
+
+        if not auto_grader.has_written_tests():
+            functions_defined = {}
+            multiple_choice_responses = self.find_static_multiple_choice_answers(lab_path)
+
+            if multiple_choice_responses is None:
+                print("Error grading lab.")
+                print(self.load_error)
+                return
+        elif type(self.module) is str:
             print("Error grading lab.")
             print(self.module)
-            return
 
-        functions_defined = get_module_functions(self.module)
-        multiple_choice_responses = self.find_multiple_choice_answers(get_variables(self.module))
+            functions_defined = {}
+            multiple_choice_responses = None
+
+            if auto_grader.multiple_choice_answers:
+                multiple_choice_responses = self.find_static_multiple_choice_answers(lab_path)
+
+            if not multiple_choice_responses:
+                return
+
+            print("Multiple choice answers from %s were graded without running the lab." % self.ucid)
+        else:
+            functions_defined = get_module_functions(self.module)
+            multiple_choice_responses = self.find_multiple_choice_answers(get_variables(self.module))
 
         try:
-            score, mc_report, function_report = auto_grader.score(functions_defined, multiple_choice_responses)
+            score, mc_report, function_report = auto_grader.score(functions_defined, multiple_choice_responses,
+                                                                  self.timings["tests"], self.test_report)
+        except MemoryError:
+            raise
         except:
             raise GradeOFailed("GradeO Failed to load lab from %s.\n%s\n" % (self.ucid, format_exc()))
+        finally:
+            # Nothing of the student's code is needed once the lab is scored.
+            self.release()
 
-        self.multiple_choice_answers = multiple_choice_responses
         self.score = score
+        self.function_bits = get_bitset(function_report, self.function_names)
+        self.question_bits = get_bitset(mc_report)
 
-        if function_report and mc_report:
-            self.functions_incorrect = {f: correct for f, correct in function_report.items() if not correct}
-            self.multiple_choice_incorrect = {number: correct for number, correct in mc_report.items() if not correct}
-        else:
-            self.functions_incorrect = None
-            self.multiple_choice_incorrect = None
+        # Kept for item analysis of the whole section, blank for questions the lab did not answer.
+        if auto_grader.multiple_choice_answers and score is not None:
+            self.answers = {number: str(multiple_choice_responses.get(number, "")) if multiple_choice_responses else ""
+                            for number in auto_grader.multiple_choice_answers}
 
     def has_graded_successfully(self):
-        return type(self.module) is not str
+        return self.load_error is None
+
+    def release(self):
+        """
+        Unload the student's module once the lab has been scored.
+
+        :return:
+        """
+        unload_module(self.module)
+        self.module = None
+
+    def get_result(self):
+        """
+        Get the picklable outcome of this lab without the student's module.
+
+        :return: A LabResult holding the grade of this lab.
+        """
+        return LabResult(self.ucid, self.lab_number, self.lab_path, self.score, self.function_bits, self.question_bits,
+                         self.function_names, self.load_error, self.outcome, self.timings, self.test_report,
+                         self.answers)
 
     @staticmethod
     def find_multiple_choice_answers(variables):
@@ -81,24 +276,19 @@ class Lab:
 
         return {int(k[10:]): v.lower() for k, v in variables.items() if k.lower().startswith("question")}
 
-    def has_load_error(self):
-        return self.score is None and type(self.module) is str
-
-    def is_lab_correct(self):
-        if self.has_load_error():
-            return False
-
-        return not self.functions_incorrect and not self.multiple_choice_incorrect
-
-    def get_score_report(self, short_hand):
-
-        if self.has_load_error():
-            return get_error_report(self.ucid, self.module)
-
-        if not short_hand and not self.is_lab_correct():
-            return get_incorrect_report(self.ucid, self.score, self.functions_incorrect, self.multiple_choice_incorrect)
+    def find_static_multiple_choice_answers(self, lab_path):
+        """
+        Gets the multiple choice answers from the literal assignments in a lab, without running it.
 
-        return "%s received a %d" % (self.ucid, self.score)
+        :param lab_path: The path to the submitted lab file.
+        :return: The answers or None if the lab could not be parsed. The parse error is stored as the load error.
+        """
+        try:
+            return self.find_multiple_choice_answers(get_literal_variables(lab_path))
+        except (SyntaxError, ValueError):
+            if self.load_error is None:
+                self.load_error = format_exc()
+            return None
 
     @staticmethod
     def get_lab_from_filename(code_path):
@@ -133,29 +323,480 @@ class Lab:
         return file_name[ucid_start:ucid_end]
 
 
-def load_labs(auto_grader, lab_folder):
-    labs = []
-
-    for lab_file_name in listdir(lab_folder):
+def grade_lab(auto_grader, lab_path):
+    """
+    Grade a single lab submission.
 
-        lab_path = join(lab_folder, lab_file_name)
+    Anything printed while grading, by GradeO or by the student's code, is captured so that the caller can print it
+    in a deterministic order.
 
-        if not isfile(lab_path):
-            continue
-
-        if not lab_path.endswith(".py"):
-            print("Bad file in labs directory %s" % lab_path)
-            continue
+    :param auto_grader: The AutoGrader to score the lab with.
+    :param lab_path: The path to the submitted lab file.
+    :return: A tuple of the LabResult, or None if the lab could not be graded, and the captured output.
+    """
+    output = StringIO()
+    result = None
 
+    with redirect_stdout(output):
         try:
+            start = perf_counter()
             lab = Lab(auto_grader, lab_path)
+            lab.timings["grade"] = perf_counter() - start
+            result = lab.get_result()
+            lab.release()
+        except MemoryError:
+            result = get_unfinished_result(lab_path, LAB_OUT_OF_MEMORY)
         except GraderNotAcceptable:
-            print("Submission for wrong lab number in folder: %s" % lab_folder)
-            continue
+            print("Submission for wrong lab number in folder: %s" % dirname(lab_path))
         except GradeOFailed as e:
             print(e.gradeo_error)
+
+    return result, output.getvalue()
+
+
+def get_unfinished_result(lab_path, outcome, load_error=None):
+    """
+    Get the LabResult for a lab that could not be graded to completion.
+
+    :param lab_path: The path to the submitted lab file.
+    :param outcome: Why grading did not finish.
+    :param load_error: Text describing the failure, if there is any.
+    :return: A LabResult without a score.
+    """
+    lab_number = Lab.get_lab_from_filename(lab_path)
+    ucid = Lab.get_ucid_from_filename(lab_path)
+    return LabResult(ucid, lab_number, lab_path, load_error=load_error, outcome=outcome)
+
+
+def grade_lab_from_path(grader_path, lab_path, test_options=None):
+    return grade_lab(load_grader(grader_path, test_options), lab_path)
+
+
+def grade_lab_isolated(run_sandboxed, func, args, lab_path, limits):
+    """
+    Grade a single lab submission in a child process under resource limits.
+
+    :param run_sandboxed: run_spawned or run_forked.
+    :param func: The grading function to run within the child.
+    :param args: The arguments of the grading function.
+    :param lab_path: The path to the submitted lab file.
+    :param limits: The SandboxLimits to grade under.
+    :return: A tuple of the LabResult, or None if the lab could not be graded, and the captured output.
+    """
+    try:
+        return run_sandboxed(func, args, limits)
+    except SandboxTimeout as e:
+        return get_unfinished_result(lab_path, LAB_TIMED_OUT, str(e)), ""
+    except SandboxOutOfMemory as e:
+        return get_unfinished_result(lab_path, LAB_OUT_OF_MEMORY, str(e)), ""
+    except SandboxCrashed as e:
+        return get_unfinished_result(lab_path, LAB_FINISHED, str(e)), ""
+
+
+def grade_lab_spawned(grader_path, lab_path, limits, test_options=None):
+    """
+    Grade a lab in a fresh interpreter that loads the AutoGrader itself.
+
+    :param grader_path: Path to the AutoGrader script file.
+    :param lab_path: The path to the submitted lab file.
+    :param limits: The SandboxLimits to grade under.
+    :param test_options: The TestOptions to load the AutoGrader with.
+    :return: A tuple of the LabResult, or None if the lab could not be graded, and the captured output.
+    """
+    return grade_lab_isolated(run_spawned, grade_lab_from_path, (grader_path, lab_path, test_options), lab_path,
+                              limits)
+
+
+def grade_lab_forked(auto_grader, lab_path, limits):
+    """
+    Grade a lab in a forked copy of this process. Every lab sees the AutoGrader exactly as it was loaded.
+
+    :param auto_grader: The already loaded AutoGrader.
+    :param lab_path: The path to the submitted lab file.
+    :param limits: The SandboxLimits to grade under.
+    :return: A tuple of the LabResult, or None if the lab could not be graded, and the captured output.
+    """
+    return grade_lab_isolated(run_forked, grade_lab, (auto_grader, lab_path), lab_path, limits)
+
+
+def grade_lab_cached(grade, cache, auto_grader, limits, worker_mode, lab_path):
+    """
+    Grade a lab unless its grade is already cached.
+
+    :param grade: The function used to grade the lab when it is not cached.
+    :param cache: The GradeCache to look in and store the grade to.
+    :param auto_grader: The AutoGrader the lab is graded with.
+    :param limits: The SandboxLimits the lab is graded under.
+    :param worker_mode: The worker mode the lab is graded with.
+    :param lab_path: The path to the submitted lab file.
+    :return: A tuple of the LabResult, or None if the lab could not be graded, and the captured output.
+    """
+    cached = cache.get(auto_grader.grader_path, lab_path, auto_grader.test_options, limits, worker_mode)
+
+    if cached is not None:
+        return cached
+
+    result, output = grade(lab_path)
+    cache.put(auto_grader.grader_path, lab_path, result, output, auto_grader.test_options, limits, worker_mode)
+
+    return result, output
+
+
+def get_duplicate_key(lab_path):
+    """
+    Get what identifies the code of a lab, so labs with the same code are only graded once. Labs that differ only in
+    comments, blank lines or formatting parse to the same AST and so share a key.
+
+    :param lab_path: The path to the submitted lab file.
+    :return: A tuple of the lab number and the SHA-256 of the lab's AST, or None if the lab can not be parsed and
+             must be graded on its own.
+    """
+    try:
+        with open(lab_path, "rb") as handle:
+            tree = ast.parse(handle.read(), lab_path)
+    except (OSError, SyntaxError, ValueError, RecursionError, MemoryError):
+        return None
+
+    return Lab.get_lab_from_filename(lab_path), hashlib.sha256(ast.dump(tree).encode("utf8")).hexdigest()
+
+
+def copy_graded_lab(result, output, graded_path, lab_path):
+    """
+    Give a lab the grade of a lab with the same code.
+
+    :param result: The LabResult of the graded lab, or None if it could not be graded.
+    :param output: The output captured grading the graded lab.
+    :param graded_path: The path to the graded lab file.
+    :param lab_path: The path to the lab file given the same grade.
+    :return: A tuple of the LabResult of the lab, or None if the graded lab could not be graded, and the output.
+    """
+    output = output.replace(graded_path, lab_path)
+
+    if result is None:
+        return None, output
+
+    load_error = result.load_error.replace(graded_path, lab_path) if result.load_error else result.load_error
+
+    # The lab was not graded itself, so like a cached lab it has no timings.
+    return LabResult(Lab.get_ucid_from_filename(lab_path), result.lab_number, lab_path, result.score,
+                     result.function_bits, result.question_bits, result.function_names, load_error, result.outcome,
+                     None, result.test_report, result.answers), output
+
+
+def get_lab_grader(auto_grader, worker_mode, limits, cache=None):
+    """
+    Get the function used to grade a single lab for a worker mode.
+
+    :param auto_grader: The AutoGrader to score labs with.
+    :param worker_mode: One of WORKER_MODES.
+    :param limits: The SandboxLimits to grade under. Ignored when grading in process.
+    :param cache: A GradeCache to reuse the grades of unchanged labs from, or None to grade every lab.
+    :return: A function taking a lab path and returning a LabResult and the captured output.
+    """
+    # Labs graded only on multiple choice are parsed, never run, so they are safe to grade in process.
+    if not auto_grader.has_written_tests():
+        grade = partial(grade_lab, auto_grader)
+    elif worker_mode == WORKER_SPAWN:
+        grade = partial(grade_lab_spawned, auto_grader.grader_path, limits=limits,
+                        test_options=auto_grader.test_options)
+    elif worker_mode == WORKER_FORK:
+        auto_grader.preload()
+        grade = partial(grade_lab_forked, auto_grader, limits=limits)
+    else:
+        grade = partial(grade_lab, auto_grader)
+
+    if cache is not None:
+        return partial(grade_lab_cached, grade, cache, auto_grader, limits, worker_mode)
+
+    return grade
+
+
+def route_lab(lab_graders, lab_path):
+    """
+    Grade a lab with the grading function for its lab number.
+
+    :param lab_graders: A dictionary of lab numbers and the functions that grade them.
+    :param lab_path: The path to the submitted lab file.
+    :return: A tuple of the LabResult, or None if the lab could not be graded, and the captured output.
+    """
+    lab_number = Lab.get_lab_from_filename(lab_path)
+
+    if lab_number not in lab_graders:
+        return None, "Submission for wrong lab number in folder: %s\n" % dirname(lab_path)
+
+    return lab_graders[lab_number](lab_path)
+
+
+def get_routed_lab_grader(auto_graders, worker_mode, limits, cache=None):
+    """
+    Get the function used to grade labs for any of several AutoGraders, chosen by the lab number of each lab.
+
+    :param auto_graders: A list of AutoGraders, each for a different lab number.
+    :param worker_mode: One of WORKER_MODES.
+    :param limits: The SandboxLimits to grade under. Ignored when grading in process.
+    :param cache: A GradeCache to reuse the grades of unchanged labs from, or None to grade every lab.
+    :return: A function taking a lab path and returning a LabResult and the captured output.
+    """
+    lab_graders = {g.lab_number: get_lab_grader(g, worker_mode, limits, cache) for g in auto_graders}
+    return partial(route_lab, lab_graders)
+
+
+def get_auto_grader_list(auto_graders):
+    if isinstance(auto_graders, AutoGrader):
+        return [auto_graders]
+    return list(auto_graders)
+
+
+__WORKER_LAB_GRADER__ = None
+
+
+def init_grading_worker(graders, worker_mode, limits, cache):
+    """
+    Load the AutoGraders once inside of a grading worker process.
+
+    :param graders: Tuples of the path to each AutoGrader script file and the TestOptions to load it with.
+    :param worker_mode: One of WORKER_MODES.
+    :param limits: The SandboxLimits to grade under.
+    :param cache: The GradeCache to use or None.
+    :return:
+    """
+    global __WORKER_LAB_GRADER__
+    auto_graders = [load_grader(grader_path, test_options) for grader_path, test_options in graders]
+    __WORKER_LAB_GRADER__ = get_routed_lab_grader(auto_graders, worker_mode, limits, cache)
+
+
+def grade_lab_in_worker(lab_path):
+    return __WORKER_LAB_GRADER__(lab_path)
+
+
+def get_grading_pool(workers, graders, worker_mode, limits, cache):
+    return ProcessPoolExecutor(workers, initializer=init_grading_worker,
+                               initargs=(graders, worker_mode, limits, cache))
+
+
+def stop_grading_pool(pool):
+    """
+    Stop a pool of grading workers, including workers still grading a lab, which could otherwise run forever.
+
+    :param pool: The ProcessPoolExecutor to stop.
+    :return:
+    """
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    for process in processes:
+        process.terminate()
+
+
+def grade_lab_alone(graders, worker_mode, limits, cache, lab_path):
+    """
+    Grade a lab in a pool of its own, so if the pool breaks the lab is known to be what broke it.
+
+    :return: A tuple of the LabResult, or None if the lab could not be graded, and the captured output.
+    """
+    pool = get_grading_pool(1, graders, worker_mode, limits, cache)
+
+    try:
+        return pool.submit(grade_lab_in_worker, lab_path).result()
+    except BrokenProcessPool:
+        return get_unfinished_result(lab_path, LAB_FINISHED, "Ended the process grading it"), ""
+    finally:
+        stop_grading_pool(pool)
+
+
+def grade_labs_in_pool(graders, worker_mode, limits, cache, lab_paths, workers):
+    """
+    Grade labs in a pool of worker processes, each of which loads the AutoGraders once.
+
+    A lab that ends its worker, such as with os._exit or a segfault, breaks the pool along with every lab still being
+    graded in it. Those labs are graded again in a new pool, the first of them alone, so the lab that broke the pool
+    is given a failed LabResult instead of the run waiting forever on it.
+
+    :param graders: Tuples of the path to each AutoGrader script file and the TestOptions to load it with.
+    :param worker_mode: One of WORKER_MODES.
+    :param limits: The SandboxLimits to grade under.
+    :param cache: The GradeCache to use or None.
+    :param lab_paths: The paths to the submitted lab files.
+    :param workers: The number of worker processes.
+    :return: A generator of tuples of the LabResult, or None, and the captured output in the same order as the labs.
+    """
+    pending = deque(lab_paths)
+    futures = deque()
+    pool = get_grading_pool(workers, graders, worker_mode, limits, cache)
+
+    try:
+        while futures or pending:
+            try:
+                # Only a few labs are queued ahead of the one being waited on, so a broken pool has few to grade again.
+                while pending and len(futures) < 2 * workers:
+                    futures.append((pending[0], pool.submit(grade_lab_in_worker, pending[0])))
+                    pending.popleft()
+            except BrokenProcessPool:
+                # The pool broke after the labs waited on so far were graded. With no lab queued to blame, it is
+                # simply replaced.
+                if not futures:
+                    stop_grading_pool(pool)
+                    pool = get_grading_pool(workers, graders, worker_mode, limits, cache)
+                    continue
+
+            lab_path, future = futures.popleft()
+
+            try:
+                graded = future.result()
+            except BrokenProcessPool:
+                stop_grading_pool(pool)
+                pending.extendleft(reversed([queued_path for queued_path, _ in futures]))
+                futures.clear()
+
+                graded = grade_lab_alone(graders, worker_mode, limits, cache, lab_path)
+                pool = get_grading_pool(workers, graders, worker_mode, limits, cache)
+
+            yield graded
+    finally:
+        stop_grading_pool(pool)
+
+
+def get_lab_sort_key(lab_path):
+    """
+    Get the key used to order labs. Labs are graded and reported sorted by UCID so output is reproducible.
+
+    :param lab_path: The path to, or file name of, a submitted lab.
+    :return: A tuple of the UCID and the file name.
+    """
+    file_name = basename(lab_path)
+
+    try:
+        return Lab.get_ucid_from_filename(file_name), file_name
+    except ValueError:
+        return file_name, file_name
+
+
+def find_lab_paths(lab_folder):
+    """
+    Find every lab submission within a folder.
+
+    :param lab_folder: The folder to search.
+    :return: A list of paths to lab files sorted by UCID.
+    """
+    lab_paths = []
+
+    for entry in os.scandir(lab_folder):
+
+        if not entry.is_file():
             continue
 
-        labs.append(lab)
+        if not entry.name.endswith(".py"):
+            print("Bad file in labs directory %s" % entry.path)
+            continue
+
+        lab_paths.append(entry.path)
+
+    return sorted(lab_paths, key=get_lab_sort_key)
+
+
+def get_graded_paths(lab_paths, keys):
+    """
+    Get the labs that have to be graded, the first lab with each duplicate key.
+
+    :param lab_paths: The paths to the submitted lab files.
+    :param keys: The duplicate key of each lab, or None for labs that are always graded.
+    :return: A list of lab paths in the same order.
+    """
+    seen = set()
+    graded_paths = []
+
+    for lab_path, key in zip(lab_paths, keys):
+        if key is None or key not in seen:
+            seen.add(key)
+            graded_paths.append(lab_path)
+
+    return graded_paths
+
+
+def grade_labs(auto_graders, lab_paths, jobs=1, limits=None, worker_mode=None, cache=None, deduplicate=True):
+    """
+    Grade a list of labs, yielding each graded lab as soon as it and every lab before it are finished.
+
+    Each lab is graded by the AutoGrader for its lab number. Labs without an AutoGrader are skipped without being read.
+    Labs with the same code as an earlier lab, see get_duplicate_key, are given its grade instead of being graded.
+
+    Labs are graded with one of the following worker modes:
+        inprocess: Within GradeO itself. Fastest, but student code can change the AutoGrader and can not be limited.
+        spawn: Within a fresh interpreter per lab that loads the AutoGrader itself.
+        fork: Within a copy of a process that has already loaded the AutoGrader, forked per lab.
+
+    :param auto_graders: An AutoGrader, or a list of AutoGraders for different lab numbers, to score the labs with.
+    :param lab_paths: The paths to the submitted lab files.
+    :param jobs: The number of labs to grade at once. 1 grades one lab at a time.
+    :param limits: SandboxLimits to grade each lab under. Ignored when grading in process.
+    :param worker_mode: One of WORKER_MODES. Defaults to spawn if limits are given, otherwise inprocess.
+    :param cache: A GradeCache to reuse the grades of unchanged labs from, or None to grade every lab.
+    :param deduplicate: True to grade labs with the same code once, giving every copy the grade of the first.
+    :return: A generator of LabResults in the same order as the lab paths.
+    """
+    if worker_mode is None:
+        worker_mode = WORKER_IN_PROCESS if limits is None else WORKER_SPAWN
+
+    if limits is None:
+        limits = SandboxLimits()
+
+    auto_graders = get_auto_grader_list(auto_graders)
+
+    lab_numbers = {auto_grader.lab_number for auto_grader in auto_graders} if deduplicate else set()
+    keys = [get_duplicate_key(lab_path) if Lab.get_lab_from_filename(lab_path) in lab_numbers else None
+            for lab_path in lab_paths]
+    graded_paths = get_graded_paths(lab_paths, keys)
+
+    if jobs > 1 and len(graded_paths) > 1:
+        workers = min(jobs, len(graded_paths))
+
+        # Spawned labs do their work in child interpreters so threads are enough to keep them busy.
+        if worker_mode == WORKER_SPAWN:
+            pool = ThreadPool(workers)
+            graded = pool.imap(get_routed_lab_grader(auto_graders, worker_mode, limits, cache), graded_paths)
+        else:
+            pool = None
+            graders = [(auto_grader.grader_path, auto_grader.test_options) for auto_grader in auto_graders]
+            graded = grade_labs_in_pool(graders, worker_mode, limits, cache, graded_paths, workers)
+    else:
+        pool = None
+        grade = get_routed_lab_grader(auto_graders, worker_mode, limits, cache)
+        graded = (grade(lab_path) for lab_path in graded_paths)
+
+    graded_keys = {}
+
+    try:
+        for lab_path, key in zip(lab_paths, keys):
+            if key in graded_keys:
+                result, output = copy_graded_lab(*graded_keys[key], lab_path)
+            else:
+                result, output = next(graded)
+
+                if key is not None:
+                    graded_keys[key] = (result, output, lab_path)
+
+            if output:
+                print(output, end="")
+
+            if result is not None:
+                yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+        else:
+            # Stops the workers of grade_labs_in_pool when labs are graded in one.
+            graded.close()
+
+    if cache is not None:
+        cache.evict()
+
+
+def load_labs(auto_graders, lab_folder, jobs=1, limits=None, worker_mode=None, cache=None, deduplicate=True):
+    """
+    Grade every lab within a folder in a single pass. See grade_labs for the grading options.
 
-    return labs
+    :param auto_graders: An AutoGrader, or a list of AutoGraders for different lab numbers, to score the labs with.
+    :param lab_folder: The folder holding the lab submissions.
+    :return: A generator of LabResults sorted by UCID.
+    """
+    return grade_labs(auto_graders, find_lab_paths(lab_folder), jobs, limits, worker_mode, cache, deduplicate)
@@ -0,0 +1,186 @@
+import os
+import re
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from os.path import join, isfile
+from libs.lab_submissions import get_lab_sort_key
+
+"""
+Watches the labs folder for new or changed submissions.
+
+    On Linux the folder is watched with inotify, so labs are seen as soon as they are closed after being written or
+    moved into the folder. Everywhere else the folder is polled. A polled lab is only reported once it has stopped
+    changing between two polls, so labs that are still being copied in are not graded half written.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+LAB_FILE_NAME = re.compile(r"^hw\d{3}_[^.]+\.py$")
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def is_lab_file_name(file_name):
+    """
+    Check to see if a file name follows the hwNNN_ucid.py lab format.
+
+    :param file_name: The name of the file.
+    :return: True if the file name is for a lab.
+    """
+    return LAB_FILE_NAME.match(file_name) is not None
+
+
+class PollingFolderWatcher:
+    def __init__(self, folder, interval):
+        """
+        Watch a folder by looking at the size and modification time of every file in it.
+
+        :param folder: The folder to watch.
+        :param interval: Seconds to wait between looking at the folder.
+        :return:
+        """
+        self.folder = folder
+        self.interval = interval
+        self.reported = self.get_snapshot()
+        self.previous = dict(self.reported)
+
+    def get_snapshot(self):
+        snapshot = {}
+
+        for entry in os.scandir(self.folder):
+            if entry.is_file():
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+        return snapshot
+
+    def wait_for_changes(self):
+        """
+        Wait until files within the folder have been created or changed.
+
+        :return: A list of file names that have been created or changed since they were last reported.
+        """
+        while True:
+            time.sleep(self.interval)
+
+            current = self.get_snapshot()
+            changed = [name for name, stat in current.items()
+                       if self.previous.get(name) == stat and self.reported.get(name) != stat]
+
+            self.previous = current
+
+            for name in changed:
+                self.reported[name] = current[name]
+
+            if changed:
+                return changed
+
+    def close(self):
+        pass
+
+
+class InotifyFolderWatcher:
+    def __init__(self, folder, settle_time=0.25):
+        """
+        Watch a folder with Linux's inotify.
+
+        :param folder: The folder to watch.
+        :param settle_time: Seconds to keep collecting events after the first so that bursts are reported together.
+        :return:
+        """
+        self.folder = folder
+        self.settle_time = settle_time
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init()
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+
+        watch = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO)
+
+        if watch < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for %s" % folder)
+
+    def read_events(self):
+        """
+        Read all pending inotify events.
+
+        :return: A list of the file names in the events.
+        """
+        data = os.read(self.fd, 65536)
+        names = []
+        offset = 0
+
+        while offset < len(data):
+            _, _, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            names.append(os.fsdecode(data[offset:offset + name_length].rstrip(b"\0")))
+            offset += name_length
+
+        return names
+
+    def wait_for_changes(self):
+        """
+        Wait until files within the folder have been created or changed.
+
+        :return: A list of file names that have been written or moved into the folder.
+        """
+        select.select([self.fd], [], [])
+        changed = self.read_events()
+
+        while select.select([self.fd], [], [], self.settle_time)[0]:
+            changed.extend(self.read_events())
+
+        return list(dict.fromkeys(changed))
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_folder_watcher(folder, interval):
+    """
+    Get the best available watcher for a folder.
+
+    :param folder: The folder to watch.
+    :param interval: Seconds between polls if the folder has to be polled.
+    :return: An InotifyFolderWatcher if inotify is available, otherwise a PollingFolderWatcher.
+    """
+    if ctypes.util.find_library("c") is not None:
+        try:
+            return InotifyFolderWatcher(folder)
+        except (OSError, AttributeError):
+            pass
+
+    return PollingFolderWatcher(folder, interval)
+
+
+def watch_labs(lab_folder, grade_labs, interval=1.0):
+    """
+    Grade labs as they are written into a folder. Runs until interrupted.
+
+    :param lab_folder: The folder to watch.
+    :param grade_labs: A function called with a list of new or changed lab paths each time labs arrive.
+    :param interval: Seconds between polls if the folder has to be polled.
+    :return:
+    """
+    watcher = get_folder_watcher(lab_folder, interval)
+    print("Watching %s for new labs with %s. Press Ctrl-C to stop." % (lab_folder, type(watcher).__name__))
+
+    try:
+        while True:
+            changed = [join(lab_folder, name) for name in watcher.wait_for_changes() if is_lab_file_name(name)]
+            lab_paths = [lab_path for lab_path in changed if isfile(lab_path)]
+
+            if lab_paths:
+                grade_labs(sorted(lab_paths, key=get_lab_sort_key))
+    except KeyboardInterrupt:
+        print("Stopped watching %s" % lab_folder)
+    finally:
+        watcher.close()
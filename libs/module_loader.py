@@ -1,11 +1,25 @@
-import os
-from os.path import isfile, basename, dirname, relpath
+import sys
+import ast
+from os.path import isfile, basename, abspath
+from itertools import count
 from traceback import format_exc
 import inspect
-import importlib
+import hashlib
+import importlib.util
 
 __author__ = 'Joshua D. Katz'
 
+"""
+Modules are loaded from their file under a unique name that is never reused, such as:
+
+    gradeo_module_12_hw001_jk369
+
+Loading the same file twice runs it twice, so a changed file is never confused with an older copy. Loaded modules
+stay in sys.modules, which the inspect module relies on, until they are passed to unload_module.
+"""
+
+__MODULE_NUMBERS__ = count()
+
 
 def get_variables(module):
     """
@@ -44,10 +58,73 @@ def get_module_functions(mod):
     return {func.__name__: func for func in mod.__dict__.values() if is_function(mod, func)}
 
 
+def get_literal_variables(code_path):
+    """
+    Get the variables assigned string literals at the top level of a python file, without running any of it.
+
+        QUESTION_1 = "A"
+
+    :param code_path: The path to a python file.
+    :return: A dictionary of variable names and the last string assigned to them.
+    :raises SyntaxError: If the file can not be parsed.
+    """
+    with open(code_path, "rb") as handle:
+        tree = ast.parse(handle.read(), code_path)
+
+    variables = {}
+
+    for statement in tree.body:
+        if isinstance(statement, ast.Assign):
+            targets = statement.targets
+        elif isinstance(statement, ast.AnnAssign) and statement.value is not None:
+            targets = [statement.target]
+        else:
+            continue
+
+        value = statement.value
+
+        if not isinstance(value, ast.Constant) or not isinstance(value.value, str):
+            continue
+
+        for target in targets:
+            if isinstance(target, ast.Name):
+                variables[target.id] = value.value
+
+    return variables
+
+
+def get_file_hash(path):
+    """
+    Get the SHA-256 of a file's contents.
+
+    :param path: The path to the file.
+    :return: The hex digest of the file.
+    """
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(65536), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def get_unique_module_name(code_path):
+    """
+    Get a module name that has never been used for a python file.
+
+    :param code_path: The path to a python file.
+    :return: A module name unique to this load of the file.
+    """
+    file_name = basename(code_path)
+    stem = "".join([c if c.isalnum() else "_" for c in file_name[0:file_name.index(".")]])
+
+    return "gradeo_module_%d_%s" % (next(__MODULE_NUMBERS__), stem)
+
+
 def load_module(code_path):
     """
-    Load a module within this directory tree.
-    TODO: Work from any directory.
+    Load a module from a python file anywhere on disk.
 
     :param code_path: The path to a python file.
     :return: None if there is no file at the location, a string if there was an exception thrown or the loaded module.
@@ -55,22 +132,44 @@ def load_module(code_path):
     if not isfile(code_path):
         return None
 
+    module_name = get_unique_module_name(code_path)
+
     try:
 
         # Magic module loading
-        code_dir = dirname(relpath(code_path))
-        code_file = basename(code_path)
-        module_path = code_dir.replace(os.sep, ".")
-        module_name = code_file[0:code_file.index(".")]
+        spec = importlib.util.spec_from_file_location(module_name, abspath(code_path))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+
+        return module
 
-        return importlib.import_module("%s.%s" % (module_path, module_name))  # , fromlist=["*"])
+    # Running out of memory is reported separately from errors in the student's code.
+    except MemoryError:
+        sys.modules.pop(module_name, None)
+        raise
 
     # Must handle ANY exception.
     # This will come from the module we are loading.
     # Any exception thrown is from the student's code.
     except:
+        sys.modules.pop(module_name, None)
 
         # print("%s failed to load" % code_path)
         # traceback.format_exec() returns a string.
         # The string is the text that the exception would have been thrown.
         return format_exc()
+
+
+def unload_module(module):
+    """
+    Release a module loaded with load_module so it can be garbage collected once nothing else refers to it.
+
+    :param module: The module to unload. Strings and None from failed loads are ignored.
+    :return:
+    """
+    if module is None or type(module) is str:
+        return
+
+    if sys.modules.get(module.__name__) is module:
+        del sys.modules[module.__name__]
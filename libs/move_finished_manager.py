@@ -6,6 +6,8 @@ __author__ = 'Joshua D. Katz'
 
 
 class MoveFinishedLabHandler(FinishedLabHandler):
+    journal_event = "moved"
+
     def __init__(self, move_location):
         self.move_location = move_location
 
@@ -23,4 +25,12 @@ class MoveFinishedLabHandler(FinishedLabHandler):
 
         new_location = join(self.get_move_path(), basename(lab.lab_path))
 
-        rename(lab.lab_path, new_location)
+        # A resumed run may hand over a lab that was moved just before the run died, or one removed by hand since.
+        if exists(lab.lab_path):
+            rename(lab.lab_path, new_location)
+        elif not exists(new_location):
+            print("Could not move %s, it no longer exists." % lab.lab_path)
+            return
+
+        # Later handlers, and a resumed run, find the lab where it was moved to.
+        lab.lab_path = new_location
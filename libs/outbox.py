@@ -0,0 +1,207 @@
+import os
+import json
+import smtplib
+from time import time, time_ns, sleep
+from os.path import join, exists, isdir
+
+"""
+Keeps grade emails on disk until they are sent, so grading never waits on the email server.
+
+    Grading writes each email into the outbox folder as its own JSON file:
+
+        {"ucid": "jk369", "subject": "cs100-h01 email from ab123", "message": "...", "attempts": 0, "next_attempt": 0}
+
+    Files are named by the time they were written, so emails are sent in the order labs were graded. Each file is
+    written under a hidden temporary name and then renamed into place, so the outbox never holds half an email.
+
+    Flushing the outbox sends every email that is due. Sent emails are removed. An email that could not be sent is
+    given another attempt after a delay that doubles with each failed attempt, and once it has failed more than the
+    allowed number of retries it is moved into the outbox's "failed" folder to be looked at by hand.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+FAILED_FOLDER = "failed"
+
+
+class OutboxEmail:
+    __slots__ = ["name", "ucid", "subject", "message", "attempts", "next_attempt"]
+
+    def __init__(self, name, ucid, subject, message, attempts=0, next_attempt=0.0):
+        """
+        An email waiting in an Outbox.
+
+        :param name: The file name of the email within the outbox.
+        :param ucid: The UCID to send the email to.
+        :param subject: The subject of the email, or None for the EmailManager's default subject.
+        :param message: The text of the email.
+        :param attempts: The number of times sending the email failed.
+        :param next_attempt: The time, in seconds since the epoch, the email may next be sent.
+        :return:
+        """
+        self.name = name
+        self.ucid = ucid
+        self.subject = subject
+        self.message = message
+        self.attempts = attempts
+        self.next_attempt = next_attempt
+
+    def get_entry(self):
+        return {"ucid": self.ucid, "subject": self.subject, "message": self.message, "attempts": self.attempts,
+                "next_attempt": self.next_attempt}
+
+
+class Outbox:
+    def __init__(self, outbox_folder):
+        """
+        Open an outbox, creating its folder if it does not exist.
+
+        :param outbox_folder: The folder to keep emails in.
+        :return:
+        """
+        self.outbox_folder = outbox_folder
+        self.failed_folder = join(outbox_folder, FAILED_FOLDER)
+
+        for folder in (self.outbox_folder, self.failed_folder):
+            if not exists(folder) or not isdir(folder):
+                os.makedirs(folder)
+
+    def write(self, email):
+        """
+        Write an email to its file in the outbox, replacing the file all at once.
+
+        :param email: The OutboxEmail to write.
+        :return:
+        """
+        temporary_path = join(self.outbox_folder, ".%s.tmp" % email.name)
+
+        with open(temporary_path, "w") as handle:
+            json.dump(email.get_entry(), handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        os.replace(temporary_path, join(self.outbox_folder, email.name))
+
+    def add(self, ucid, message, subject=None):
+        """
+        Put an email in the outbox to be sent.
+
+        :param ucid: The UCID to send the email to.
+        :param message: The text of the email.
+        :param subject: The subject of the email, or None for the default subject.
+        :return: The OutboxEmail.
+        """
+        email = OutboxEmail("%020d_%d_%s.json" % (time_ns(), os.getpid(), ucid), ucid, subject, message)
+        self.write(email)
+        return email
+
+    def get_emails(self):
+        """
+        Read every email waiting in the outbox.
+
+        :return: A list of OutboxEmails, oldest first.
+        """
+        emails = []
+
+        for entry in sorted(os.scandir(self.outbox_folder), key=lambda entry: entry.name):
+            if not entry.is_file() or entry.name.startswith(".") or not entry.name.endswith(".json"):
+                continue
+
+            try:
+                with open(entry.path) as handle:
+                    fields = json.load(handle)
+            except (OSError, ValueError):
+                continue
+
+            emails.append(OutboxEmail(entry.name, fields["ucid"], fields["subject"], fields["message"],
+                                      fields["attempts"], fields["next_attempt"]))
+
+        return emails
+
+    def __len__(self):
+        return len(self.get_emails())
+
+    def remove(self, email):
+        os.remove(join(self.outbox_folder, email.name))
+
+    def set_aside(self, email):
+        """
+        Move an email that could not be sent into the failed folder.
+
+        :param email: The OutboxEmail.
+        :return:
+        """
+        self.write(email)
+        os.replace(join(self.outbox_folder, email.name), join(self.failed_folder, email.name))
+
+
+def get_backoff(attempts, backoff, max_backoff):
+    """
+    Get how long to wait before sending an email again.
+
+    :param attempts: The number of times sending the email failed.
+    :param backoff: Seconds to wait after the first failure. The wait doubles after each failure after it.
+    :param max_backoff: The longest wait in seconds.
+    :return: The seconds to wait.
+    """
+    return min(max_backoff, backoff * 2 ** (attempts - 1))
+
+
+def flush_outbox(outbox, email_manager, retries=5, backoff=2.0, max_backoff=300.0):
+    """
+    Send every email in an outbox, retrying emails that fail until they are sent or out of retries.
+
+    :param outbox: The Outbox to send.
+    :param email_manager: The EmailManager to send the emails with.
+    :param retries: How many times an email that failed is sent again before it is set aside.
+    :param backoff: Seconds to wait before the first retry of an email. The wait doubles with every retry.
+    :param max_backoff: The longest wait in seconds between attempts of an email.
+    :return: A tuple of the number of emails sent and the number set aside.
+    """
+    emails = outbox.get_emails()
+    sent = 0
+    set_aside = 0
+
+    while emails:
+        now = time()
+        due = [email for email in emails if email.next_attempt <= now]
+
+        if not due:
+            sleep(min(email.next_attempt for email in emails) - now)
+            continue
+
+        errors = email_manager.send_emails([(email.ucid, email.message, email.subject) for email in due])
+        emails = [email for email in emails if email.next_attempt > now]
+        login_failed = False
+
+        for email, error in zip(due, errors):
+            if error is None:
+                outbox.remove(email)
+                sent += 1
+                continue
+
+            # Not a failure of the email itself, so it is left as it is for the next flush.
+            if isinstance(error, smtplib.SMTPAuthenticationError):
+                login_failed = True
+                continue
+
+            email.attempts += 1
+
+            if email.attempts > retries:
+                print("Could not send the email to %s after %d attempts, moved it to %s." % (email.ucid,
+                                                                                           email.attempts,
+                                                                                           outbox.failed_folder))
+                outbox.set_aside(email)
+                set_aside += 1
+                continue
+
+            email.next_attempt = time() + get_backoff(email.attempts, backoff, max_backoff)
+            outbox.write(email)
+            emails.append(email)
+
+        # Nothing more can be sent until the login is fixed. Emails of this batch that were sent are already removed.
+        if login_failed:
+            break
+
+    return sent, set_aside
@@ -0,0 +1,158 @@
+import cProfile
+import pstats
+from time import perf_counter
+
+"""
+Collects where the time of a grading run goes.
+
+    Every graded lab carries the seconds spent importing it, running each of the grader's test functions and
+    grading it overall. The FinishedLabManager adds the seconds each handler spent on each lab and in finish.
+
+    Labs pulled from the grade cache, or given the grade of an earlier lab with the same code, were not graded this run,
+    so they carry no timings and are left out.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+
+def get_percentile(values, percent):
+    """
+    Get a percentile of a list of numbers using the nearest rank.
+
+    :param values: The numbers. Need not be sorted.
+    :param percent: The percentile to get, 0 to 100.
+    :return: The value at the percentile, or 0 for an empty list.
+    """
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = int(round(percent / 100.0 * (len(ordered) - 1)))
+
+    return ordered[rank]
+
+
+def get_timing_row(name, values):
+    """
+    Get a row of the summary table for a set of timings.
+
+    :param name: The name of the row.
+    :param values: Seconds taken by each call.
+    :return: A formatted row with the number of calls, p50, p95, max and total milliseconds.
+    """
+    milliseconds = [value * 1000 for value in values]
+
+    return "%-40s %7d %10.2f %10.2f %10.2f %12.2f" % (name[:40], len(values), get_percentile(milliseconds, 50),
+                                                      get_percentile(milliseconds, 95), max(milliseconds),
+                                                      sum(milliseconds))
+
+
+def get_timing_table(title, timings, limit):
+    """
+    Get a table of timings ranked from slowest to fastest by their maximum.
+
+    :param title: The name of the first column.
+    :param timings: A dictionary of names and lists of seconds.
+    :param limit: The number of rows to show.
+    :return: The formatted table.
+    """
+    header = "%-40s %7s %10s %10s %10s %12s" % (title, "calls", "p50 ms", "p95 ms", "max ms", "total ms")
+    ranked = sorted(timings.items(), key=lambda item: max(item[1]), reverse=True)
+
+    return "\n".join([header] + [get_timing_row(name, values) for name, values in ranked[:limit]])
+
+
+class GradingProfiler:
+    def __init__(self, stats_path=None, limit=10):
+        """
+        Create a profiler for a grading run.
+
+        :param stats_path: A file to dump cProfile stats of this process to, or None to skip cProfile.
+        :param limit: The number of rows shown in each ranked table.
+        :return:
+        """
+        self.stats_path = stats_path
+        self.limit = limit
+        self.lab_timings = {}
+        self.import_timings = []
+        self.test_timings = {}
+        self.handler_timings = {}
+        self.profile = cProfile.Profile() if stats_path else None
+
+    def start(self):
+        if self.profile is not None:
+            self.profile.enable()
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+
+    def record_lab(self, lab):
+        """
+        Record the timings carried by a graded lab.
+
+        :param lab: The graded lab.
+        :return:
+        """
+        if not lab.timings:
+            return
+
+        name = "%s (hw%0.3d)" % (lab.ucid, lab.lab_number)
+        self.lab_timings[name] = [lab.timings.get("grade", 0.0)]
+        self.import_timings.append(lab.timings.get("import", 0.0))
+
+        for test_name, seconds in lab.timings.get("tests", {}).items():
+            self.test_timings.setdefault(test_name, []).append(seconds)
+
+    def time_handler(self, handler, func, *args):
+        """
+        Call a handler method and record how long it took.
+
+        :param handler: The handler being called.
+        :param func: The bound method of the handler to call.
+        :param args: The arguments to call the method with.
+        :return: The return value of the method.
+        """
+        start = perf_counter()
+
+        try:
+            return func(*args)
+        finally:
+            name = "%s.%s" % (type(handler).__name__, func.__name__)
+            self.handler_timings.setdefault(name, []).append(perf_counter() - start)
+
+    def get_summary(self):
+        """
+        Get the ranked summary of the run.
+
+        :return: A printable report.
+        """
+        grade_timings = [values[0] for values in self.lab_timings.values()]
+
+        sections = ["Profiled %d graded labs" % len(grade_timings)]
+
+        if grade_timings:
+            sections.append(get_timing_table("Whole lab", {"grading": grade_timings, "import": self.import_timings},
+                                             self.limit))
+            sections.append(get_timing_table("Slowest students", self.lab_timings, self.limit))
+
+        if self.test_timings:
+            sections.append(get_timing_table("Slowest tests", self.test_timings, self.limit))
+
+        if self.handler_timings:
+            sections.append(get_timing_table("Handlers", self.handler_timings, self.limit))
+
+        return "\n\n".join(sections)
+
+    def finish(self):
+        """
+        Print the summary and dump the cProfile stats if they were requested.
+
+        :return:
+        """
+        print(self.get_summary())
+
+        if self.profile is not None:
+            pstats.Stats(self.profile).sort_stats("cumulative").dump_stats(self.stats_path)
+            print("\ncProfile stats of this process written to %s" % self.stats_path)
@@ -0,0 +1,140 @@
+import os
+import sys
+import copy
+import pickle
+import random
+from os.path import dirname, basename, join
+from libs.module_loader import get_file_hash
+
+"""
+Builds tables of test cases from a reference solution shipped with the AutoGrader.
+
+    Instead of listing expected values, a grader can give the solution to a function and a generator of inputs:
+
+        def reference_circle_area(radius):
+            return math.pi * radius ** 2
+
+        def circle_area_inputs(rng):
+            return [rng.uniform(0, 100) for _ in range(500)]
+
+    The generator is handed a random.Random seeded with REFERENCE_SEED, 0 unless the grader sets it, so every run
+    tests the same inputs. The reference is run on the inputs once and the inputs and outputs are saved next to the
+    grader, such as hw001_cs100_h01.reference.pickle. Every student is then compared against that table, so the
+    reference is only run again once the grader or the version of Python changes.
+
+    The saved inputs are shared by every student, so student functions are only ever called with copies of them.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+
+def get_reference_path(grader_path):
+    """
+    Get the path the reference tables of an AutoGrader are saved to.
+
+    :param grader_path: Path to the AutoGrader script file.
+    :return: The path of the reference file next to the grader.
+    """
+    grader_file = basename(grader_path)
+    return join(dirname(grader_path), grader_file[0:grader_file.rindex(".")] + ".reference.pickle")
+
+
+def get_reference_key(grader_path, seed):
+    return "\n".join([get_file_hash(grader_path), repr(seed), sys.version])
+
+
+def compute_reference_tables(references, input_generators, seed):
+    """
+    Run every reference function on its generated inputs.
+
+    :param references: A dictionary of function names and their reference implementations.
+    :param input_generators: A dictionary of function names and the *_inputs functions generating their arguments.
+    :param seed: The seed the inputs of every function are generated from.
+    :return: A dictionary of function names and tuples of the list of inputs and the list of reference outputs.
+    """
+    tables = {}
+
+    for name, reference in references.items():
+        if name not in input_generators:
+            raise Exception("reference_%s has no %s_inputs function to generate its inputs" % (name, name))
+
+        inputs = list(input_generators[name](random.Random(seed)))
+
+        # The reference is given copies, so a reference that changes its arguments does not change the inputs saved.
+        expected = [reference(*copy.deepcopy(args if isinstance(args, tuple) else (args,))) for args in inputs]
+        tables[name] = (inputs, expected)
+
+    return tables
+
+
+def load_reference_tables(grader_path, key):
+    """
+    Load the saved reference tables of an AutoGrader.
+
+    :param grader_path: Path to the AutoGrader script file.
+    :param key: The key the tables must have been saved under.
+    :return: The saved tables, or None if they are missing or were saved for a different grader.
+    """
+    try:
+        with open(get_reference_path(grader_path), "rb") as handle:
+            saved = pickle.load(handle)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+    if not isinstance(saved, dict) or saved.get("key") != key:
+        return None
+
+    return saved["tables"]
+
+
+def save_reference_tables(grader_path, key, tables):
+    """
+    Save the reference tables of an AutoGrader next to it. Graders in folders that can not be written to simply
+    have their tables computed again next run.
+
+    :param grader_path: Path to the AutoGrader script file.
+    :param key: The key identifying the grader the tables were computed with.
+    :param tables: The tables to save.
+    :return:
+    """
+    reference_path = get_reference_path(grader_path)
+    temporary_path = "%s.%d.tmp" % (reference_path, os.getpid())
+
+    try:
+        with open(temporary_path, "wb") as handle:
+            pickle.dump({"key": key, "tables": tables}, handle)
+
+        os.replace(temporary_path, reference_path)
+    except (OSError, pickle.PicklingError):
+        print("Could not save reference outputs to %s" % reference_path)
+
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def get_reference_tables(grader_path, references, input_generators, seed=0):
+    """
+    Get the inputs and reference outputs of every function with a reference solution, computing them only if they
+    have not been saved for this grader.
+
+    :param grader_path: Path to the AutoGrader script file, or None to never save the tables.
+    :param references: A dictionary of function names and their reference implementations.
+    :param input_generators: A dictionary of function names and the *_inputs functions generating their arguments.
+    :param seed: The seed the inputs of every function are generated from.
+    :return: A dictionary of function names and tuples of the list of inputs and the list of reference outputs.
+    """
+    if not references:
+        return {}
+
+    if grader_path is None:
+        return compute_reference_tables(references, input_generators, seed)
+
+    key = get_reference_key(grader_path, seed)
+    tables = load_reference_tables(grader_path, key)
+
+    if tables is None:
+        tables = compute_reference_tables(references, input_generators, seed)
+        save_reference_tables(grader_path, key, tables)
+
+    return tables
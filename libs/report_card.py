@@ -1,3 +1,5 @@
+from libs.grader_cases import CASE_PASSED
+
 __author__ = 'Joshua D. Katz'
 
 
@@ -24,11 +26,44 @@ def get_error_report(ucid, error):
     return message
 
 
+def get_outcome_report(ucid, outcome, short_hand):
+    """
+    Get the message contents to print out for a lab that did not finish grading.
+
+    :param ucid: The UCID of the user who's lab did not finish.
+    :param outcome: What happened to the lab, such as "timed out" or "ran out of memory".
+    :param short_hand: If the short hand message should be used.
+    :return: A string explaining that the lab was not graded.
+    """
+    if short_hand:
+        return "%s %s" % (ucid, outcome)
+
+    message = "The lab %s while grading and was not scored." % outcome
+    return get_format_bar(ucid + " lab " + outcome, length=len(message)) + "\n\n" + message + "\n"
+
+
 def get_longest_line(string):
     return len(max(string.split("\n"), key=len))
 
 
-def get_incorrect_report(ucid, score, incorrect_functions, incorrect_multiple_choice):
+def get_case_report(function_report, limit=10):
+    """
+    Get the lines describing the cases a function failed.
+
+    :param function_report: Tuples of the label, outcome and seconds of every case the function was run against.
+    :param limit: The most failed cases to list. The rest are counted.
+    :return: A line for every case that did not pass.
+    """
+    failed = [(label, outcome, seconds) for label, outcome, seconds in function_report if outcome != CASE_PASSED]
+    lines = ["\t\t- %s %s (%.3fs)" % case for case in failed[:limit]]
+
+    if len(failed) > limit:
+        lines.append("\t\t- and %d more failed cases" % (len(failed) - limit))
+
+    return lines
+
+
+def get_incorrect_report(ucid, score, incorrect_functions, incorrect_multiple_choice, test_report=None):
     """
     Get the message contents to print out for an incorrect lab.
 
@@ -36,6 +71,7 @@ def get_incorrect_report(ucid, score, incorrect_functions, incorrect_multiple_ch
     :param ucid: The UCID of the user who's grade us being reported.
     :param incorrect_functions: The functions that were incorrect in the lab submission.
     :param incorrect_multiple_choice: The multiple choice questions that were incorrect within this lab.
+    :param test_report: The cases run per function when tests were run in full mode, or None.
     :return: A string within information detailing what was incorrect.
     """
     if not incorrect_functions and not incorrect_multiple_choice:
@@ -45,7 +81,11 @@ def get_incorrect_report(ucid, score, incorrect_functions, incorrect_multiple_ch
 
     if incorrect_functions:
         message += "There were %d incorrect functions:" % len(incorrect_functions) + "\n"
-        message += "\n".join(["\t- " + f for f in incorrect_functions]) + "\n"
+        for f in incorrect_functions:
+            message += "\t- " + f + "\n"
+
+            if test_report and f in test_report:
+                message += "".join([line + "\n" for line in get_case_report(test_report[f])])
 
     if incorrect_multiple_choice:
         message += "There were %d incorrect multiple choice answers:" % len(incorrect_multiple_choice) + "\n"
@@ -0,0 +1,217 @@
+import os
+import json
+import pickle
+import base64
+from os.path import basename, exists
+from libs.module_loader import get_file_hash
+
+"""
+Journals the progress of a grading run so a run that dies part way can be resumed.
+
+    Every line of the journal is a JSON event about a single lab, keyed by the lab's file name:
+
+        {"lab": "hw001_jk369.py", "event": "graded", "path": "labs/hw001_jk369.py", "hash": "...", "result": "..."}
+        {"lab": "hw001_jk369.py", "event": "emailed", "path": "labs/hw001_jk369.py"}
+        {"lab": "hw001_jk369.py", "event": "moved", "path": "/course/graded/hw001_jk369.py"}
+
+    A lab is journaled as graded, with its pickled LabResult and the SHA-256 of its file, as soon as it is graded.
+    Each finished lab handler with a journal event then journals it once the lab is handled. Lines are flushed as
+    they are written, so everything journaled survives the run being killed.
+
+    Resuming a run replays the journal. Labs that were graded but not handled by every handler are handled again
+    from their journaled result, skipping the handlers that already handled them, and only labs that were never
+    graded, or have changed since, are graded. Labs the journaled run finished are passed once more to handlers
+    that report over every lab of a run, such as the similarity report, so their reports still cover the whole run.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+EVENT_GRADED = "graded"
+
+
+def get_lab_key(lab_path):
+    return basename(lab_path)
+
+
+class JournaledLab:
+    def __init__(self, result, path, file_hash):
+        """
+        What the journal knows about a single graded lab.
+
+        :param result: The journaled LabResult.
+        :param path: The path the lab was last journaled at, which changes once it is moved.
+        :param file_hash: The SHA-256 of the lab file when it was graded.
+        :return:
+        """
+        self.result = result
+        self.path = path
+        self.file_hash = file_hash
+        self.events = set()
+
+
+class RunJournal:
+    def __init__(self, journal_path, resume=False):
+        """
+        Open the journal of a run.
+
+        :param journal_path: The path to the journal file.
+        :param resume: True to replay the journal of an earlier run and continue it, otherwise it is started over.
+        :return:
+        """
+        self.journal_path = journal_path
+        self.labs = {}
+
+        if resume and exists(journal_path):
+            self.replay()
+
+        self.handle = open(journal_path, "a" if resume else "w")
+
+        # A line cut short by the run dying is ended, so the first event of this run is not joined onto it.
+        if self.handle.tell() and not self.ends_with_newline():
+            self.handle.write("\n")
+
+    def ends_with_newline(self):
+        with open(self.journal_path, "rb") as handle:
+            handle.seek(-1, os.SEEK_END)
+            return handle.read(1) == b"\n"
+
+    def replay(self):
+        """
+        Read every event of the journal. A last line cut short by the run dying is ignored.
+
+        :return:
+        """
+        with open(self.journal_path) as handle:
+            for line in handle:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+
+                self.apply(event)
+
+    def apply(self, event):
+        """
+        Apply an event to what is known about its lab. Grading a lab again forgets how it was handled before.
+
+        :param event: The event read from the journal.
+        :return:
+        """
+        key = event["lab"]
+
+        if event["event"] == EVENT_GRADED:
+            result = pickle.loads(base64.b64decode(event["result"]))
+            self.labs[key] = JournaledLab(result, event["path"], event["hash"])
+        elif key in self.labs:
+            self.labs[key].events.add(event["event"])
+            self.labs[key].path = event["path"]
+
+    def write(self, event, sync=False):
+        """
+        Append an event to the journal.
+
+        :param event: The event to write.
+        :param sync: True to also make sure the event is on disk before returning, not just written.
+        :return:
+        """
+        self.handle.write(json.dumps(event) + "\n")
+        self.handle.flush()
+
+        if sync:
+            os.fsync(self.handle.fileno())
+
+        self.apply(event)
+
+    def journal_graded(self, lab):
+        """
+        Journal that a lab was graded.
+
+        :param lab: The graded LabResult.
+        :return:
+        """
+        key = get_lab_key(lab.lab_path)
+
+        # Replayed labs were journaled as graded by the run that graded them.
+        if key in self.labs and self.labs[key].result is lab:
+            return
+
+        self.write({
+            "lab": key,
+            "event": EVENT_GRADED,
+            "path": lab.lab_path,
+            "hash": get_file_hash(lab.lab_path),
+            "result": base64.b64encode(pickle.dumps(lab)).decode("ascii")
+        })
+
+    def journal_event(self, lab, event, sync=False):
+        """
+        Journal that a lab was handled.
+
+        :param lab: The handled LabResult.
+        :param event: What was done with the lab, such as "emailed".
+        :param sync: True to make sure the event is on disk before returning.
+        :return:
+        """
+        self.write({"lab": get_lab_key(lab.lab_path), "event": event, "path": lab.lab_path}, sync)
+
+    def has_event(self, lab, event):
+        key = get_lab_key(lab.lab_path)
+        return key in self.labs and event in self.labs[key].events
+
+    def is_graded(self, lab_path):
+        """
+        Check whether a lab was graded in the journaled run and has not changed since.
+
+        :param lab_path: The path to the lab file.
+        :return: True if the journaled grade of the lab can be used.
+        """
+        key = get_lab_key(lab_path)
+        return key in self.labs and self.labs[key].file_hash == get_file_hash(lab_path)
+
+    def get_journaled_labs(self, events, finished):
+        """
+        Get the graded labs that every handler finished handling, or those that some handler did not.
+
+        :param events: The journal event of every handler that journals one.
+        :param finished: True for the labs every handler finished, False for the rest.
+        :return: A list of LabResults, each at the path its lab was last journaled at.
+        """
+        labs = []
+
+        for journaled in self.labs.values():
+            if all(event in journaled.events for event in events) != finished:
+                continue
+
+            journaled.result.lab_path = journaled.path
+            labs.append(journaled.result)
+
+        return labs
+
+    def get_unfinished_labs(self, events):
+        return self.get_journaled_labs(events, False)
+
+    def get_finished_labs(self, events):
+        return self.get_journaled_labs(events, True)
+
+    def resume(self, lab_paths, events):
+        """
+        Split the labs of a resumed run into the labs already finished, the labs left to handle and the labs left to
+        grade.
+
+        :param lab_paths: The paths of every lab in the labs folder.
+        :param events: The journal event of every handler that journals one.
+        :return: A tuple of the list of finished LabResults, the list of unfinished LabResults and the list of paths
+                 of labs to grade.
+        """
+        lab_paths = [lab_path for lab_path in lab_paths if not self.is_graded(lab_path)]
+        regraded = {get_lab_key(lab_path) for lab_path in lab_paths}
+
+        # Labs that changed since they were journaled are graded and handled again instead.
+        finished = [lab for lab in self.get_finished_labs(events) if get_lab_key(lab.lab_path) not in regraded]
+        unfinished = [lab for lab in self.get_unfinished_labs(events) if get_lab_key(lab.lab_path) not in regraded]
+
+        return finished, unfinished, lab_paths
+
+    def close(self):
+        self.handle.close()
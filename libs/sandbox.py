@@ -0,0 +1,280 @@
+import os
+import sys
+import time
+import pickle
+import select
+import signal
+import subprocess
+from traceback import print_exc
+from os.path import dirname, abspath
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+"""
+Runs untrusted code in a child process.
+
+    Spawned children are fresh Python interpreters. The child is handed a pickled function and its arguments on
+    stdin, applies the resource limits it was given and writes the pickled return value of the function back on
+    stdout. The function must be importable by name from the child, as it is pickled by reference.
+
+    Forked children are copies of the current process. Anything already imported, such as a loaded AutoGrader, is
+    shared copy-on-write so the child starts almost instantly and any changes it makes are thrown away when it exits.
+    Only the return value of the function needs to be picklable.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+OUT_OF_MEMORY_EXIT_CODE = 99
+
+
+class SandboxTimeout(Exception):
+    pass
+
+
+class SandboxOutOfMemory(Exception):
+    pass
+
+
+class SandboxCrashed(Exception):
+    pass
+
+
+class SandboxLimits:
+    def __init__(self, timeout=None, cpu_time=None, memory=None):
+        """
+        Resource limits for code run in a sandbox.
+
+        :param timeout: Wall-clock seconds the child may run for. None for no limit.
+        :param cpu_time: CPU seconds the child may use. None for no limit.
+        :param memory: Address space, in bytes, the child may allocate. None for no limit.
+        :return:
+        """
+        self.timeout = timeout
+        self.cpu_time = cpu_time
+        self.memory = memory
+
+    def apply(self):
+        """
+        Apply these limits to the current process. Only works where the resource module is available.
+
+        :return:
+        """
+        if resource is None:
+            return
+
+        if self.cpu_time is not None:
+            cpu_time = max(1, int(self.cpu_time + 0.5))
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + 1))
+
+        if self.memory is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (self.memory, self.memory))
+
+    def __repr__(self):
+        return "SandboxLimits(%r, %r, %r)" % (self.timeout, self.cpu_time, self.memory)
+
+
+def get_child_environment():
+    """
+    Get the environment for a sandbox child. GradeO's directory is added to the PYTHONPATH so libs can be imported.
+
+    :return: A copy of os.environ with PYTHONPATH updated.
+    """
+    environment = dict(os.environ)
+    gradeo_root = dirname(dirname(abspath(__file__)))
+    python_path = environment.get("PYTHONPATH")
+    environment["PYTHONPATH"] = gradeo_root if not python_path else gradeo_root + os.pathsep + python_path
+    return environment
+
+
+def is_limit_signal(return_code):
+    """
+    Check to see if a child exit code means that it was killed for running too long.
+
+    :param return_code: The return code of the child process.
+    :return: True if the child was killed by SIGXCPU or SIGKILL.
+    """
+    limit_signals = [signal.SIGKILL]
+
+    if hasattr(signal, "SIGXCPU"):
+        limit_signals.append(signal.SIGXCPU)
+
+    return return_code is not None and -return_code in limit_signals
+
+
+def run_spawned(func, args, limits):
+    """
+    Run a function in a fresh Python interpreter under resource limits.
+
+    :param func: The function to run. Must be importable by name.
+    :param args: A tuple of picklable arguments to call the function with.
+    :param limits: The SandboxLimits to apply to the child.
+    :return: The return value of the function.
+    """
+    child = subprocess.Popen([sys.executable, "-m", "libs.sandbox"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, env=get_child_environment())
+
+    try:
+        out, err = child.communicate(pickle.dumps((func, args, limits)), timeout=limits.timeout)
+    except subprocess.TimeoutExpired:
+        child.kill()
+        child.communicate()
+        raise SandboxTimeout("Ran for longer than %s seconds" % limits.timeout)
+
+    if child.returncode == OUT_OF_MEMORY_EXIT_CODE:
+        raise SandboxOutOfMemory("Used more than %s bytes of memory" % limits.memory)
+
+    if is_limit_signal(child.returncode):
+        raise SandboxTimeout("Used more than %s seconds of CPU time" % limits.cpu_time)
+
+    if child.returncode != 0 or not out:
+        error = err.decode("utf8", "replace").strip()
+        raise SandboxCrashed("Exited with code %d\n%s" % (child.returncode, error))
+
+    return pickle.loads(out)
+
+
+def get_exit_code(status):
+    """
+    Convert a status from os.waitpid into a return code like the ones used by subprocess.
+
+    :param status: The status returned by os.waitpid.
+    :return: The exit code of the child, or the negative signal number that killed it.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
+
+
+def read_child_pipes(pid, result_fd, error_fd, timeout):
+    """
+    Read everything a forked child writes to its result and error pipes.
+
+    :param pid: The process id of the child.
+    :param result_fd: The read end of the child's result pipe.
+    :param error_fd: The read end of the child's error pipe.
+    :param timeout: Wall-clock seconds to wait for the child. None to wait forever.
+    :return: A tuple of the bytes read from the result pipe and from the error pipe.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    chunks = {result_fd: [], error_fd: []}
+    open_fds = [result_fd, error_fd]
+
+    while open_fds:
+        remaining = None if deadline is None else deadline - time.monotonic()
+
+        if remaining is not None and remaining <= 0:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            raise SandboxTimeout("Ran for longer than %s seconds" % timeout)
+
+        readable, _, _ = select.select(open_fds, [], [], remaining)
+
+        for fd in readable:
+            data = os.read(fd, 65536)
+
+            if data:
+                chunks[fd].append(data)
+            else:
+                open_fds.remove(fd)
+
+    return b"".join(chunks[result_fd]), b"".join(chunks[error_fd])
+
+
+def run_forked(func, args, limits):
+    """
+    Run a function in a forked copy of this process under resource limits.
+
+    :param func: The function to run.
+    :param args: A tuple of arguments to call the function with.
+    :param limits: The SandboxLimits to apply to the child.
+    :return: The return value of the function.
+    """
+    result_read, result_write = os.pipe()
+    error_read, error_write = os.pipe()
+
+    pid = os.fork()
+
+    if pid == 0:
+        exit_code = 1
+
+        try:
+            os.close(result_read)
+            os.close(error_read)
+            os.dup2(error_write, sys.stderr.fileno())
+            os.dup2(error_write, sys.stdout.fileno())
+
+            limits.apply()
+
+            try:
+                result = pickle.dumps(func(*args))
+            except MemoryError:
+                os._exit(OUT_OF_MEMORY_EXIT_CODE)
+
+            with os.fdopen(result_write, "wb") as result_pipe:
+                result_pipe.write(result)
+
+            exit_code = 0
+        except:
+            print_exc()
+        finally:
+            os._exit(exit_code)
+
+    os.close(result_write)
+    os.close(error_write)
+
+    try:
+        out, err = read_child_pipes(pid, result_read, error_read, limits.timeout)
+    finally:
+        os.close(result_read)
+        os.close(error_read)
+
+    _, status = os.waitpid(pid, 0)
+    return_code = get_exit_code(status)
+
+    if return_code == OUT_OF_MEMORY_EXIT_CODE:
+        raise SandboxOutOfMemory("Used more than %s bytes of memory" % limits.memory)
+
+    if is_limit_signal(return_code):
+        raise SandboxTimeout("Used more than %s seconds of CPU time" % limits.cpu_time)
+
+    if return_code != 0 or not out:
+        error = err.decode("utf8", "replace").strip()
+        raise SandboxCrashed("Exited with code %d\n%s" % (return_code, error))
+
+    return pickle.loads(out)
+
+
+def can_fork():
+    return hasattr(os, "fork")
+
+
+def main():
+    """
+    Run when a sandbox child is started. Reads the function to call from stdin.
+
+    Anything the function writes to file descriptor 1 is sent to stderr so it cannot corrupt the result.
+    :return: Nothing
+    """
+    result_pipe = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    func, args, limits = pickle.load(sys.stdin.buffer)
+
+    limits.apply()
+
+    try:
+        result = pickle.dumps(func(*args))
+    except MemoryError:
+        os._exit(OUT_OF_MEMORY_EXIT_CODE)
+
+    result_pipe.write(result)
+    result_pipe.flush()
+
+
+if __name__ == '__main__':
+    main()
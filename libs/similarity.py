@@ -0,0 +1,661 @@
+import ast
+import zlib
+import hashlib
+import heapq
+from array import array
+from collections import Counter
+from fractions import Fraction
+from functools import partial
+from multiprocessing import Pool
+
+"""
+Fingerprints submissions so similar ones can be found without comparing every pair.
+
+    Each submission is parsed and its AST is walked into a stream of node types. Names, arguments and attribute
+    names are dropped and literals are reduced to their type, so renaming variables or changing constants does not
+    change the stream. Docstrings are skipped.
+
+    The stream is cut into overlapping k-grams of tokens, each hashed with CRC-32. Winnowing keeps the smallest hash
+    of every window of consecutive k-gram hashes, giving a small set of fingerprints that two submissions are
+    guaranteed to share if they have a run of at least k + window - 1 tokens in common.
+
+    A FingerprintIndex maps every fingerprint to the submissions that have it, so the only pairs ever scored are
+    those that share a fingerprint. Pairs are scored by the Jaccard similarity of their fingerprint sets.
+
+    Copies that differ only by renaming are found without comparing pairs at all. Every name the submission binds,
+    its variables, functions, arguments and imports, is renamed by the order it first appears, and the rest of the AST
+    is kept as is. Submissions sharing the SHA-256 of that form are copies of each other.
+
+    Candidate pairs are then confirmed with the Zhang-Shasha tree edit distance between their normalized ASTs, the
+    fewest node insertions, deletions and relabels turning one tree into the other. Only distances up to a limit
+    matter, so pairs are first pruned with cheap lower bounds, the difference in tree size and in node label counts,
+    and the edit distance itself skips cells that must exceed the limit. Each table of the edit distance is stopped
+    once every cell left in it must exceed the limit, and the pair is given up once the table of the two roots can not
+    come in under.
+
+    The candidate pairs are split into chunks that can be scored across a pool of processes. Each chunk keeps only its
+    most similar pairs in a heap when just the top pairs are wanted, and the chunks are merged once scored.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+KGRAM_SIZE = 8
+WINNOW_WINDOW = 4
+
+# Pairs of trees scored by a worker process at a time.
+SIMILARITY_CHUNK_SIZE = 64
+
+# Fields ignored when looking for renamed copies, as they do not change what the code does.
+UNRENAMED_IGNORED_FIELDS = {"ctx", "kind", "type_comment"}
+
+# Fields holding identifiers, which are dropped so renaming does not change a submission's tokens.
+IGNORED_FIELDS = {"id", "arg", "attr", "name", "names", "module", "asname", "lineno", "col_offset", "end_lineno",
+                  "end_col_offset", "ctx", "type_comment", "kind"}
+
+__TOKEN_CODES__ = {}
+
+
+def get_token_code(token):
+    """
+    Get the number a token is stored as. Numbers are the same in every process so fingerprints can be saved.
+
+    :param token: The token text, such as "BinOp".
+    :return: The CRC-32 of the token.
+    """
+    if token not in __TOKEN_CODES__:
+        __TOKEN_CODES__[token] = zlib.crc32(token.encode("utf8"))
+
+    return __TOKEN_CODES__[token]
+
+
+def is_docstring(node):
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+
+
+def get_node_label(node):
+    """
+    Get the token code of a single AST node. Literals are labelled by their type alone.
+
+    :param node: An AST node.
+    :return: The token code of the node.
+    """
+    if isinstance(node, ast.Constant):
+        return get_token_code("Constant:" + type(node.value).__name__)
+
+    return get_token_code(type(node).__name__)
+
+
+def get_normalized_children(node):
+    """
+    Get the children of an AST node that are kept once it is normalized.
+
+    :param node: An AST node.
+    :return: A list of the child nodes, without identifiers, contexts or docstrings.
+    """
+    children = []
+
+    for field, value in ast.iter_fields(node):
+        if field in IGNORED_FIELDS:
+            continue
+
+        if isinstance(value, list):
+            children.extend(child for child in value if isinstance(child, ast.AST) and not is_docstring(child))
+        elif isinstance(value, ast.AST):
+            children.append(value)
+
+    return children
+
+
+def add_node_tokens(node, tokens):
+    """
+    Add the tokens of a node and everything below it, in pre-order.
+
+    :param node: An AST node.
+    :param tokens: The array to append token codes to.
+    :return:
+    """
+    tokens.append(get_node_label(node))
+
+    for child in get_normalized_children(node):
+        add_node_tokens(child, tokens)
+
+
+def get_ast_tokens(tree):
+    """
+    Get the normalized token stream of a parsed submission.
+
+    :param tree: The parsed module.
+    :return: An array of token codes.
+    """
+    tokens = array("I")
+    add_node_tokens(tree, tokens)
+    return tokens
+
+
+def get_bound_names(tree):
+    """
+    Get the names a submission binds itself, as opposed to builtins, modules and attributes it only uses.
+
+    :param tree: The parsed module.
+    :return: A set of names.
+    """
+    names = set()
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.alias) and node.asname:
+            names.add(node.asname)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+
+    return names
+
+
+def add_renamed_tokens(node, tokens, bound_names, renames):
+    """
+    Add the tokens of a node and everything below it, in pre-order, with every bound name renamed.
+
+    :param node: An AST node.
+    :param tokens: The list to append token text to.
+    :param bound_names: The names bound by the submission.
+    :param renames: A dictionary of the names renamed so far and their position in order of first use.
+    :return:
+    """
+    tokens.append(type(node).__name__)
+
+    for field, value in ast.iter_fields(node):
+        if field in UNRENAMED_IGNORED_FIELDS:
+            continue
+
+        for item in (value if isinstance(value, list) else [value]):
+            if isinstance(item, ast.AST):
+                if not is_docstring(item):
+                    add_renamed_tokens(item, tokens, bound_names, renames)
+            elif isinstance(item, str) and item in bound_names and field != "attr":
+                tokens.append("name:%d" % renames.setdefault(item, len(renames)))
+            else:
+                tokens.append(repr(item))
+
+
+def get_renamed_key(tree):
+    """
+    Get what identifies a submission once its own names are renamed, so copies that only rename variables and
+    functions, or change comments, docstrings or formatting, share a key.
+
+    :param tree: The parsed module.
+    :return: The hex digest of the renamed AST.
+    """
+    tokens = []
+    add_renamed_tokens(tree, tokens, get_bound_names(tree), {})
+    return hashlib.sha256("\n".join(tokens).encode("utf8")).hexdigest()
+
+
+def get_kgram_hashes(tokens, k=KGRAM_SIZE):
+    """
+    Hash every run of k consecutive tokens.
+
+    :param tokens: An array of token codes.
+    :param k: The number of tokens in each k-gram.
+    :return: A list of the hash of each k-gram, in order.
+    """
+    data = tokens.tobytes()
+    width = tokens.itemsize * k
+
+    return [zlib.crc32(data[start:start + width]) for start in range(0, len(data) - width + 1, tokens.itemsize)]
+
+
+def winnow(hashes, window=WINNOW_WINDOW):
+    """
+    Select fingerprints from k-gram hashes by keeping the smallest hash of every window.
+
+    :param hashes: The k-gram hashes in order.
+    :param window: The number of consecutive hashes in each window.
+    :return: A sorted array of the unique fingerprints.
+    """
+    if len(hashes) <= window:
+        return array("I", sorted(set(hashes)))
+
+    fingerprints = set()
+
+    for start in range(len(hashes) - window + 1):
+        fingerprints.add(min(hashes[start:start + window]))
+
+    return array("I", sorted(fingerprints))
+
+
+def get_fingerprints(tree, k=KGRAM_SIZE, window=WINNOW_WINDOW):
+    """
+    Get the winnowed fingerprints of a parsed submission.
+
+    :param tree: The parsed module.
+    :param k: The number of tokens in each k-gram.
+    :param window: The number of k-grams in each winnowing window.
+    :return: A sorted array of fingerprints.
+    """
+    return winnow(get_kgram_hashes(get_ast_tokens(tree), k), window)
+
+
+class PostorderTree:
+    def __init__(self, labels, leftmost):
+        """
+        A normalized AST stored as two arrays indexed by the post-order number of each node.
+
+        :param labels: The token code of every node.
+        :param leftmost: The post-order number of the leftmost leaf below every node.
+        :return:
+        """
+        self.labels = labels
+        self.leftmost = leftmost
+        self.histogram = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def get_histogram(self):
+        if self.histogram is None:
+            self.histogram = Counter(self.labels)
+
+        return self.histogram
+
+    def get_keyroots(self):
+        """
+        Get the keyroots of the tree, the root and every node with a left sibling.
+
+        :return: The post-order numbers of the keyroots, in ascending order.
+        """
+        highest = {}
+
+        for node, leftmost in enumerate(self.leftmost):
+            highest[leftmost] = node
+
+        return sorted(highest.values())
+
+
+def add_postorder_nodes(node, labels, leftmost):
+    """
+    Add a node and everything below it to the arrays of a PostorderTree.
+
+    :param node: An AST node.
+    :param labels: The array of node labels.
+    :param leftmost: The array of leftmost leaves.
+    :return: The post-order number of the node.
+    """
+    first = None
+
+    for child in get_normalized_children(node):
+        child_number = add_postorder_nodes(child, labels, leftmost)
+
+        if first is None:
+            first = leftmost[child_number]
+
+    labels.append(get_node_label(node))
+    leftmost.append(len(labels) - 1 if first is None else first)
+
+    return len(labels) - 1
+
+
+def get_postorder_tree(tree):
+    """
+    Get the normalized form of a parsed submission used to measure edit distance.
+
+    :param tree: The parsed module.
+    :return: A PostorderTree.
+    """
+    labels = array("I")
+    leftmost = array("I")
+    add_postorder_nodes(tree, labels, leftmost)
+    return PostorderTree(labels, leftmost)
+
+
+def get_edit_distance_lower_bound(first, second):
+    """
+    Get a lower bound of the tree edit distance that is cheap to compute.
+
+    Every edit changes the size of the tree by at most one and the label counts by at most two.
+
+    :param first: A PostorderTree.
+    :param second: A PostorderTree.
+    :return: A number of edits the distance is at least.
+    """
+    first_histogram = first.get_histogram()
+    second_histogram = second.get_histogram()
+    labels = set(first_histogram) | set(second_histogram)
+    histogram_difference = sum(abs(first_histogram[label] - second_histogram[label]) for label in labels)
+
+    return max(abs(len(first) - len(second)), (histogram_difference + 1) // 2)
+
+
+def get_forest_distances(first, second, first_root, second_root, tree_distances, limit, abandon=False):
+    """
+    Fill in the forest distance table of one pair of keyroots, as in Zhang-Shasha.
+
+    Distances above the limit are stored as limit + 1. Cells whose forests differ in size by more than the limit
+    are never computed as they must be above it.
+
+    :param first: A PostorderTree.
+    :param second: A PostorderTree.
+    :param first_root: A keyroot of the first tree.
+    :param second_root: A keyroot of the second tree.
+    :param tree_distances: The table of distances between every pair of subtrees, updated in place.
+    :param limit: The largest distance of interest.
+    :param abandon: True when these are the roots of both trees. Any mapping between the trees splits into a mapping
+                    between the first row nodes of one and some first column nodes of the other, plus the rest, so
+                    the table is abandoned once no cell of a row plus the difference in remaining nodes is in limit.
+    :return: False if the table was stopped early, otherwise True.
+
+    The same split holds for every later cell of any table, so no later cell is below the smallest cell of a row. Once
+    every cell of a row is above the limit the rest of the table is left out, and the subtree distances it would have
+    filled in stay at limit + 1.
+    """
+    too_far = limit + 1
+    first_start = first.leftmost[first_root]
+    second_start = second.leftmost[second_root]
+    rows = first_root - first_start + 2
+    columns = second_root - second_start + 2
+
+    forest = [[too_far] * columns for _ in range(rows)]
+
+    for column in range(min(columns, too_far + 1)):
+        forest[0][column] = column
+
+    for row in range(1, rows):
+        node = first_start + row - 1
+        node_leftmost = first.leftmost[node]
+        node_label = first.labels[node]
+        previous = forest[row - 1]
+        current = forest[row]
+
+        if row <= limit:
+            current[0] = row
+
+        for column in range(max(1, row - limit), min(columns - 1, row + limit) + 1):
+            other = second_start + column - 1
+            other_leftmost = second.leftmost[other]
+            distance = min(previous[column] + 1, current[column - 1] + 1)
+
+            if node_leftmost == first_start and other_leftmost == second_start:
+                distance = min(distance, previous[column - 1] + (node_label != second.labels[other]))
+                distance = min(distance, too_far)
+                tree_distances[node][other] = distance
+            else:
+                subtree = forest[node_leftmost - first_start][other_leftmost - second_start]
+                distance = min(distance, subtree + tree_distances[node][other], too_far)
+
+            current[column] = distance
+
+        if abandon:
+            remaining = rows - 1 - row
+            bound = min(current[column] + abs(remaining - (columns - 1 - column)) for column in range(columns))
+        else:
+            bound = min(current)
+
+        if bound > limit:
+            return False
+
+    return True
+
+
+def get_tree_edit_distance(first, second, limit=None):
+    """
+    Get the Zhang-Shasha tree edit distance between two trees, with unit cost insertions, deletions and relabels.
+
+    :param first: A PostorderTree.
+    :param second: A PostorderTree.
+    :param limit: The largest distance of interest, or None for no limit.
+    :return: The edit distance, or None if it is above the limit.
+    """
+    if limit is None:
+        limit = len(first) + len(second)
+
+    if get_edit_distance_lower_bound(first, second) > limit:
+        return None
+
+    if not len(first) or not len(second):
+        return max(len(first), len(second))
+
+    tree_distances = [[limit + 1] * len(second) for _ in range(len(first))]
+    first_root = len(first) - 1
+    second_root = len(second) - 1
+
+    for first_keyroot in first.get_keyroots():
+        for second_keyroot in second.get_keyroots():
+            is_root = first_keyroot == first_root and second_keyroot == second_root
+
+            finished = get_forest_distances(first, second, first_keyroot, second_keyroot, tree_distances, limit,
+                                            is_root)
+
+            if is_root and not finished:
+                return None
+
+    distance = tree_distances[first_root][second_root]
+
+    return distance if distance <= limit else None
+
+
+def get_distance_limit(threshold, size):
+    """
+    Get the largest edit distance two trees can be apart and still be as similar as the threshold.
+
+    :param threshold: The lowest similarity, 0.0 to 1.0, of interest.
+    :param size: The size of the larger tree.
+    :return: The largest distance, worked out exactly so trees exactly at the threshold are kept. With floats
+             (1 - 0.8) * 10 is 1.9999999999999996, and would drop pairs 2 edits apart.
+    """
+    return int((1 - Fraction(repr(threshold))) * size)
+
+
+def get_tree_similarity(first, second, threshold):
+    """
+    Get how similar two trees are, one minus their tree edit distance over the size of the larger tree.
+
+    :param first: A PostorderTree.
+    :param second: A PostorderTree.
+    :param threshold: The lowest similarity, 0.0 to 1.0, of interest.
+    :return: A tuple of the similarity and the edit distance, or None if the trees are less similar than the threshold.
+    """
+    size = max(len(first), len(second))
+    distance = get_tree_edit_distance(first, second, get_distance_limit(threshold, size))
+
+    if distance is None:
+        return None
+
+    return (1 - distance / size if size else 1.0), distance
+
+
+def score_tree_pairs(trees, pairs, threshold, top=None):
+    """
+    Score pairs of trees, keeping those at or above the threshold.
+
+    :param trees: A list of PostorderTrees.
+    :param pairs: Tuples of the positions of two trees in the list.
+    :param threshold: The lowest similarity, 0.0 to 1.0, of a kept pair.
+    :param top: The number of most similar pairs to keep, or None to keep every pair.
+    :return: A list of tuples of the similarity, the edit distance and the positions of both trees, in no order.
+    """
+    scored = []
+
+    for first, second in pairs:
+        score = get_tree_similarity(trees[first], trees[second], threshold)
+
+        if score is None:
+            continue
+
+        # Distances are negated so the heap drops the most distant of equally similar pairs first.
+        entry = (score[0], -score[1], first, second)
+
+        if top is None or len(scored) < top:
+            heapq.heappush(scored, entry)
+        else:
+            heapq.heappushpop(scored, entry)
+
+    return [(similarity, -distance, first, second) for similarity, distance, first, second in scored]
+
+
+__WORKER_TREES__ = None
+
+
+def init_similarity_worker(trees):
+    """
+    Receive the trees once inside of a similarity worker process.
+
+    :param trees: A list of PostorderTrees.
+    :return:
+    """
+    global __WORKER_TREES__
+    __WORKER_TREES__ = trees
+
+
+def score_tree_pairs_in_worker(pairs, threshold, top):
+    return score_tree_pairs(__WORKER_TREES__, pairs, threshold, top)
+
+
+def get_similar_tree_pairs(trees, pairs, threshold, top=None, jobs=1, chunk_size=SIMILARITY_CHUNK_SIZE):
+    """
+    Score pairs of trees, split into chunks scored across a pool of processes.
+
+    :param trees: A list of PostorderTrees.
+    :param pairs: Tuples of the positions of two trees in the list.
+    :param threshold: The lowest similarity, 0.0 to 1.0, of a reported pair.
+    :param top: The number of most similar pairs to report, or None to report every pair.
+    :param jobs: The number of processes to score with. 1 scores every pair within this process.
+    :param chunk_size: The number of pairs handed to a process at a time.
+    :return: A list of tuples of the similarity, the edit distance and the positions of both trees, most similar
+             first.
+    """
+    if jobs > 1 and len(pairs) > chunk_size:
+        chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+        score = partial(score_tree_pairs_in_worker, threshold=threshold, top=top)
+
+        with Pool(min(jobs, len(chunks)), init_similarity_worker, (trees,)) as pool:
+            scored = [entry for chunk in pool.imap_unordered(score, chunks) for entry in chunk]
+    else:
+        scored = score_tree_pairs(trees, pairs, threshold, top)
+
+    scored.sort(key=lambda entry: (-entry[0], entry[1], entry[2], entry[3]))
+
+    return scored if top is None else scored[:top]
+
+
+def get_clusters(pairs):
+    """
+    Group submissions into the connected components of the pairs found between them.
+
+    :param pairs: Tuples of two submissions.
+    :return: A list of lists of submissions, in the order each group was first seen.
+    """
+    parents = {}
+
+    def find(key):
+        root = parents.setdefault(key, key)
+
+        while root != parents[root]:
+            root = parents[root]
+
+        while key != root:
+            parents[key], key = root, parents[key]
+
+        return root
+
+    for first, second in pairs:
+        first_root = find(first)
+        second_root = find(second)
+
+        if first_root != second_root:
+            parents[second_root] = first_root
+
+    clusters = {}
+
+    for key in parents:
+        clusters.setdefault(find(key), []).append(key)
+
+    return list(clusters.values())
+
+
+def get_jaccard(shared, first_size, second_size):
+    union = first_size + second_size - shared
+    return shared / union if union else 0.0
+
+
+class FingerprintIndex:
+    def __init__(self, common_fraction=0.5, common_minimum=10):
+        """
+        An inverted index from fingerprints to the submissions that have them.
+
+        :param common_fraction: Fingerprints shared by more than this fraction of submissions are boilerplate, such
+                                as code given to every student, and do not make submissions candidates.
+        :param common_minimum: Fingerprints are never treated as boilerplate while this few submissions have them.
+        :return:
+        """
+        self.common_fraction = common_fraction
+        self.common_minimum = common_minimum
+        self.postings = {}
+        self.fingerprints = {}
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def add(self, key, fingerprints):
+        """
+        Add a submission to the index.
+
+        :param key: What identifies the submission.
+        :param fingerprints: The sorted array of the submission's fingerprints.
+        :return:
+        """
+        self.fingerprints[key] = fingerprints
+
+        for fingerprint in fingerprints:
+            self.postings.setdefault(fingerprint, []).append(key)
+
+    def get_shared_counts(self, key):
+        """
+        Count the fingerprints a submission shares with every other submission it shares any with.
+
+        :param key: A submission within the index.
+        :return: A Counter of other submissions and the number of fingerprints shared with them.
+        """
+        most_common = max(self.common_minimum, int(self.common_fraction * len(self.fingerprints)))
+        shared = Counter()
+
+        for fingerprint in self.fingerprints[key]:
+            posting = self.postings[fingerprint]
+
+            if len(posting) > most_common:
+                continue
+
+            shared.update(other for other in posting if other is not key)
+
+        return shared
+
+    def get_similar_pairs(self, keys, threshold):
+        """
+        Find the submissions similar to any of a set of submissions.
+
+        :param keys: The submissions to find similar submissions for.
+        :param threshold: The lowest Jaccard similarity, 0.0 to 1.0, of a reported pair.
+        :return: A list of tuples of the similarity and both submissions, most similar first. Each pair is only
+                 listed once.
+        """
+        pairs = {}
+
+        for key in keys:
+            size = len(self.fingerprints[key])
+
+            for other, shared in self.get_shared_counts(key).items():
+                pair_id = frozenset((id(key), id(other)))
+
+                if pair_id in pairs:
+                    continue
+
+                similarity = get_jaccard(shared, size, len(self.fingerprints[other]))
+
+                if similarity >= threshold:
+                    pairs[pair_id] = (similarity, key, other)
+
+        return sorted(pairs.values(), key=lambda pair: -pair[0])
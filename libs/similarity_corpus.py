@@ -0,0 +1,408 @@
+import os
+import mmap
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import date
+from os.path import join, exists, getsize
+from libs.similarity import KGRAM_SIZE, WINNOW_WINDOW, PostorderTree, get_jaccard
+
+"""
+Keeps the fingerprints and normalized ASTs of past submissions so new labs can be compared against earlier semesters.
+
+    Each course and lab number has its own folder within the corpus folder, such as corpus/cs100/hw001, holding:
+
+        format.txt:        The corpus format and the k-gram size and winnowing window the fingerprints were made with.
+        submissions.txt:   One line per submission, of the UCID, the SHA-256 of the file and the day it was added.
+        fingerprints.bin:  The sorted fingerprints of every submission, one after another.
+        fingerprint_ends.bin, tree_ends.bin: Where the fingerprints and tree nodes of each submission end.
+        labels.bin, leftmost.bin: The PostorderTree arrays of every submission, one after another.
+        postings.bin:      The number of submissions covered, then every fingerprint and the submission it belongs
+                           to, packed as fingerprint << 32 | submission and sorted.
+
+    Every .bin file is a flat array of native unsigned integers, so the files are memory mapped rather than read and
+    nothing is parsed again. Fingerprints are looked up by a binary search of the postings, and only the trees of
+    submissions sharing enough fingerprints are ever copied out of their files.
+
+    New submissions are appended to the end of each array file, and submissions.txt is then replaced with a copy
+    listing them, so a run that stops part way through an append leaves the submissions before it intact. Only the
+    postings of the new submissions are sorted, and they are merged into the stored postings. The postings are
+    rebuilt from every fingerprint only when they do not cover every submission, such as after a run stopped part way.
+
+    A corpus is written by one run at a time.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+# Part of format.txt, so a corpus stored in an older layout or with different fingerprints is never read back.
+CORPUS_FORMAT = "1"
+
+SUBMISSIONS_FILE = "submissions.txt"
+FORMAT_FILE = "format.txt"
+
+# The array files of a corpus and the typecodes of their items.
+ARRAY_FILES = {
+    "fingerprints": "I",
+    "fingerprint_ends": "Q",
+    "labels": "I",
+    "leftmost": "I",
+    "tree_ends": "Q",
+    "postings": "Q",
+}
+
+
+class CorpusSubmission:
+    __slots__ = ["ucid", "lab_number", "number", "file_hash", "added"]
+
+    def __init__(self, ucid, lab_number, number, file_hash, added):
+        """
+        A submission from an earlier run stored in a SimilarityCorpus.
+
+        :param ucid: The UCID of the student who submitted it.
+        :param lab_number: The lab number it was submitted for.
+        :param number: Its position within the corpus.
+        :param file_hash: The SHA-256 of the submitted file.
+        :param added: The day it was added to the corpus, such as "2015-12-14".
+        :return:
+        """
+        self.ucid = ucid
+        self.lab_number = lab_number
+        self.number = number
+        self.file_hash = file_hash
+        self.added = added
+
+    def __str__(self):
+        return "%s from %s" % (self.ucid, self.added)
+
+
+def map_array(path, typecode):
+    """
+    Memory map an array file.
+
+    :param path: The path to the array file.
+    :param typecode: The array typecode of its items.
+    :return: A tuple of the mmap, or None if the file is empty, and a read only view of its items.
+    """
+    if not exists(path) or getsize(path) < array(typecode).itemsize:
+        return None, memoryview(array(typecode))
+
+    with open(path, "rb") as handle:
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    length = len(mapped) - len(mapped) % array(typecode).itemsize
+    return mapped, memoryview(mapped)[:length].cast("B").cast(typecode)
+
+
+def get_bounds(ends, number):
+    """
+    Get where the items of a submission are within an array file.
+
+    :param ends: The view of the ends of every submission.
+    :param number: The position of the submission.
+    :return: A tuple of the first item and one past the last item of the submission.
+    """
+    return (ends[number - 1] if number else 0), ends[number]
+
+
+def merge_postings(postings, added):
+    """
+    Merge new postings into the stored postings. The stored postings are copied in runs between the places the new
+    postings go, so only the new postings are looked at one at a time.
+
+    :param postings: The sorted view of the stored postings.
+    :param added: The sorted new postings.
+    :return: An array of every posting, sorted.
+    """
+    merged = array("Q")
+    start = 0
+
+    for posting in added:
+        end = bisect_left(postings, posting, start)
+        merged.frombytes(postings[start:end].cast("B"))
+        merged.append(posting)
+        start = end
+
+    merged.frombytes(postings[start:].cast("B"))
+    return merged
+
+
+class SimilarityCorpus:
+    def __init__(self, corpus_folder, course, lab_number):
+        """
+        Open the corpus of a course and lab number.
+
+        :param corpus_folder: The folder holding every corpus. The lab's own folder is created if it does not exist.
+        :param course: The course the submissions are for, such as "cs100".
+        :param lab_number: The lab number the submissions are for.
+        :return:
+        """
+        self.folder = join(corpus_folder, course, "hw%0.3d" % lab_number)
+        self.lab_number = lab_number
+        self.lines = []
+        self.submissions = []
+        self.submission_keys = set()
+        self.mappings = []
+        self.views = {}
+        self.pending = []
+
+        if not exists(self.folder):
+            os.makedirs(self.folder)
+
+        self.check_format()
+        self.open()
+
+    def get_path(self, name):
+        return join(self.folder, name)
+
+    def check_format(self):
+        """
+        Make sure the corpus was written with the current fingerprints, starting an empty corpus if it is new.
+
+        :return:
+        """
+        current_format = " ".join([CORPUS_FORMAT, str(KGRAM_SIZE), str(WINNOW_WINDOW)])
+        format_path = self.get_path(FORMAT_FILE)
+
+        if not exists(format_path):
+            with open(format_path, "w") as handle:
+                handle.write(current_format + "\n")
+            return
+
+        with open(format_path) as handle:
+            saved_format = handle.read().strip()
+
+        if saved_format != current_format:
+            raise ValueError("The similarity corpus in %s was made with format %s, not %s" % (self.folder,
+                                                                                          saved_format,
+                                                                                          current_format))
+
+    def open(self):
+        """
+        Memory map the array files and read the list of submissions.
+
+        :return:
+        """
+        for name, typecode in ARRAY_FILES.items():
+            mapped, self.views[name] = map_array(self.get_path(name + ".bin"), typecode)
+
+            if mapped is not None:
+                self.mappings.append(mapped)
+
+        lines = []
+        submissions_path = self.get_path(SUBMISSIONS_FILE)
+
+        if exists(submissions_path):
+            with open(submissions_path) as handle:
+                lines = [line.split() for line in handle if line.strip()]
+
+        # Submissions only count once every array holds them.
+        count = min(len(lines), len(self.views["fingerprint_ends"]), len(self.views["tree_ends"]))
+        self.lines = lines[:count]
+        self.submissions = [CorpusSubmission(ucid, self.lab_number, number, file_hash, added)
+                            for number, (ucid, file_hash, added) in enumerate(self.lines)]
+        self.submission_keys = {(ucid, file_hash) for ucid, file_hash, _ in self.lines}
+
+        postings = self.views["postings"]
+
+        if not len(postings) or postings[0] != count:
+            self.close()
+            self.rebuild_postings(count)
+            self.open()
+
+    def close(self):
+        for view in self.views.values():
+            view.release()
+
+        for mapped in self.mappings:
+            mapped.close()
+
+        self.views = {}
+        self.mappings = []
+
+    def __len__(self):
+        return len(self.submissions)
+
+    def has_submission(self, ucid, file_hash):
+        return (ucid, file_hash) in self.submission_keys
+
+    def get_tree(self, number):
+        """
+        Copy the tree of a submission out of the corpus.
+
+        :param number: The position of the submission.
+        :return: A PostorderTree.
+        """
+        start, end = get_bounds(self.views["tree_ends"], number)
+        return PostorderTree(array("I", self.views["labels"][start:end]),
+                             array("I", self.views["leftmost"][start:end]))
+
+    def get_shared_counts(self, fingerprints, common_fraction=0.5, common_minimum=10):
+        """
+        Count the fingerprints a new submission shares with every stored submission it shares any with.
+
+        :param fingerprints: The sorted array of the new submission's fingerprints.
+        :param common_fraction: Fingerprints held by more than this fraction of stored submissions are boilerplate.
+        :param common_minimum: Fingerprints are never treated as boilerplate while this few submissions have them.
+        :return: A Counter of the positions of stored submissions and the number of fingerprints shared with them.
+        """
+        # The first item of the postings is the number of submissions covered, not a posting.
+        postings = self.views["postings"][1:]
+        most_common = max(common_minimum, int(common_fraction * len(self.submissions)))
+        shared = Counter()
+
+        for fingerprint in fingerprints:
+            start = bisect_left(postings, fingerprint << 32)
+            end = bisect_left(postings, (fingerprint + 1) << 32, start)
+
+            if end - start > most_common:
+                continue
+
+            shared.update(posting & 0xFFFFFFFF for posting in postings[start:end])
+
+        postings.release()
+
+        return shared
+
+    def get_similar(self, fingerprints, threshold, ucid=None):
+        """
+        Find the stored submissions sharing enough fingerprints with a new submission.
+
+        :param fingerprints: The sorted array of the new submission's fingerprints.
+        :param threshold: The lowest Jaccard similarity, 0.0 to 1.0, of a returned submission.
+        :param ucid: The UCID of the new submission. Earlier submissions by the same student are not returned.
+        :return: A list of tuples of the similarity and the CorpusSubmission.
+        """
+        ends = self.views["fingerprint_ends"]
+        similar = []
+
+        for number, shared in self.get_shared_counts(fingerprints).items():
+            submission = self.submissions[number]
+
+            if submission.ucid == ucid:
+                continue
+
+            start, end = get_bounds(ends, number)
+            similarity = get_jaccard(shared, len(fingerprints), end - start)
+
+            if similarity >= threshold:
+                similar.append((similarity, submission))
+
+        return similar
+
+    def add(self, ucid, file_hash, fingerprints, tree):
+        """
+        Add a submission to the corpus once it is saved. Submissions already in the corpus are skipped.
+
+        :param ucid: The UCID of the student who submitted it.
+        :param file_hash: The SHA-256 of the submitted file.
+        :param fingerprints: The sorted array of its fingerprints.
+        :param tree: Its PostorderTree.
+        :return:
+        """
+        if self.has_submission(ucid, file_hash):
+            return
+
+        self.submission_keys.add((ucid, file_hash))
+        self.pending.append((ucid, file_hash, fingerprints, tree))
+
+    def save(self):
+        """
+        Append every added submission to the end of the corpus files.
+
+        :return:
+        """
+        if not self.pending:
+            return
+
+        pending = self.pending
+        self.pending = []
+
+        count = len(self.submissions)
+        fingerprint_end = self.views["fingerprint_ends"][count - 1] if count else 0
+        tree_end = self.views["tree_ends"][count - 1] if count else 0
+
+        # The first item of the postings is the number of submissions covered, not a posting.
+        stored = self.views["postings"][1:]
+        postings = array("Q", [count + len(pending)])
+        postings.extend(merge_postings(stored, sorted(fingerprint << 32 | number for number, (_, _, fingerprints, _)
+                                                      in enumerate(pending, count) for fingerprint in fingerprints)))
+        stored.release()
+
+        self.close()
+
+        # Files are truncated to the submissions listed, dropping anything left by a run that stopped part way.
+        appended = {name: array(typecode) for name, typecode in ARRAY_FILES.items() if name != "postings"}
+        today = date.today().isoformat()
+
+        for ucid, file_hash, fingerprints, tree in pending:
+            fingerprint_end += len(fingerprints)
+            tree_end += len(tree)
+            appended["fingerprints"].extend(fingerprints)
+            appended["fingerprint_ends"].append(fingerprint_end)
+            appended["labels"].extend(tree.labels)
+            appended["leftmost"].extend(tree.leftmost)
+            appended["tree_ends"].append(tree_end)
+
+        item_counts = {
+            "fingerprints": fingerprint_end - len(appended["fingerprints"]),
+            "fingerprint_ends": count,
+            "labels": tree_end - len(appended["labels"]),
+            "leftmost": tree_end - len(appended["leftmost"]),
+            "tree_ends": count,
+        }
+
+        for name, items in appended.items():
+            with open(self.get_path(name + ".bin"), "ab") as handle:
+                handle.truncate(item_counts[name] * items.itemsize)
+                items.tofile(handle)
+
+        lines = self.lines + [(ucid, file_hash, today) for ucid, file_hash, _, _ in pending]
+        submissions_path = self.get_path(SUBMISSIONS_FILE)
+        temporary_path = "%s.%d.tmp" % (submissions_path, os.getpid())
+
+        with open(temporary_path, "w") as handle:
+            handle.writelines("%s %s %s\n" % tuple(line) for line in lines)
+
+        os.replace(temporary_path, submissions_path)
+
+        self.write_postings(postings)
+        self.open()
+
+    def rebuild_postings(self, count):
+        """
+        Write the postings of the first submissions in the corpus.
+
+        :param count: The number of submissions the postings cover.
+        :return:
+        """
+        fingerprints_mapping, fingerprints = map_array(self.get_path("fingerprints.bin"), "I")
+        ends_mapping, ends = map_array(self.get_path("fingerprint_ends.bin"), "Q")
+
+        postings = array("Q", [count])
+        postings.extend(sorted(fingerprint << 32 | number for number in range(count)
+                               for fingerprint in fingerprints[slice(*get_bounds(ends, number))]))
+
+        fingerprints.release()
+        ends.release()
+
+        for mapped in (fingerprints_mapping, ends_mapping):
+            if mapped is not None:
+                mapped.close()
+
+        self.write_postings(postings)
+
+    def write_postings(self, postings):
+        """
+        Replace the postings file all at once.
+
+        :param postings: The array of the number of submissions covered followed by the sorted postings.
+        :return:
+        """
+        postings_path = self.get_path("postings.bin")
+        temporary_path = "%s.%d.tmp" % (postings_path, os.getpid())
+
+        with open(temporary_path, "wb") as handle:
+            postings.tofile(handle)
+
+        os.replace(temporary_path, postings_path)
@@ -0,0 +1,237 @@
+import socket
+import smtplib
+import threading
+from time import monotonic, sleep
+
+"""
+Sends email over a small pool of SMTP connections that are kept open between messages.
+
+    Opening an SMTP connection takes several round trips (the greeting, EHLO, STARTTLS, EHLO again and AUTH), far
+    more than sending a short message over one that is already open, so connections are returned to the pool once a
+    message is sent and reused by the next. Several messages are sent at once, one per connection.
+
+    A connection left idle for a while may have been closed by the server, so it is checked with a NOOP before it is
+    reused and replaced if the check fails. A message whose connection drops before it is handed to the server, while
+    its sender and recipient are being given, is sent again over a new connection. Once the message itself has been
+    sent with DATA the server may have accepted it even if the connection drops before it replies, so the message is
+    never sent again here, and the error is raised instead. Sending it again could deliver it twice. The outbox does
+    try such an email again after its backoff, so a grade email is sent at least once and, rarely, twice.
+
+    Providers throttle accounts that send too quickly, so messages can be limited to a number per second across every
+    connection.
+
+"""
+
+__author__ = 'Joshua D. Katz'
+
+# Errors that mean the connection is gone, rather than the message being refused.
+DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+
+def close_quietly(connection):
+    """
+    Close an SMTP connection that may already be closed.
+
+    :param connection: An instance of smtplib.SMTP.
+    :return:
+    """
+    try:
+        connection.quit()
+    except (smtplib.SMTPException, OSError):
+        connection.close()
+
+
+def reset_quietly(connection):
+    """
+    Reset an SMTP connection after a refused message so it can send the next, leaving a dropped connection to be
+    replaced when it is next used.
+
+    :param connection: An instance of smtplib.SMTP.
+    :return:
+    """
+    try:
+        connection.rset()
+    except DISCONNECT_ERRORS:
+        pass
+
+
+def send_envelope(connection, from_address, to_address):
+    """
+    Give the sender and recipient of a message. The server has been handed nothing to deliver yet, so a message
+    whose connection drops here can safely be sent again.
+
+    :param connection: An instance of smtplib.SMTP.
+    :param from_address: The address the message is from.
+    :param to_address: The address to send the message to.
+    :return:
+    """
+    connection.ehlo_or_helo_if_needed()
+    code, response = connection.mail(from_address)
+
+    if code != 250:
+        reset_quietly(connection)
+        raise smtplib.SMTPSenderRefused(code, response, from_address)
+
+    code, response = connection.rcpt(to_address)
+
+    if code not in (250, 251):
+        reset_quietly(connection)
+        raise smtplib.SMTPRecipientsRefused({to_address: (code, response)})
+
+
+def send_data(connection, message):
+    """
+    Hand the text of a message to the server once its envelope has been given.
+
+    :param connection: An instance of smtplib.SMTP.
+    :param message: The text of the message.
+    :return:
+    """
+    code, response = connection.data(message)
+
+    if code != 250:
+        reset_quietly(connection)
+        raise smtplib.SMTPDataError(code, response)
+
+
+class RateLimiter:
+    def __init__(self, rate=None):
+        """
+        Spaces out messages so no more than a number are sent each second, across every thread.
+
+        :param rate: The most messages per second, or None for no limit.
+        :return:
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the next message may be sent.
+
+        :return:
+        """
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = monotonic()
+            send_time = max(now, self.next_time)
+            self.next_time = send_time + self.interval
+
+        if send_time > now:
+            sleep(send_time - now)
+
+
+class SMTPConnectionPool:
+    def __init__(self, connect, size=1, idle_check=10.0):
+        """
+        Create a pool of SMTP connections. Connections are only opened once they are needed.
+
+        :param connect: A function returning a new logged in smtplib.SMTP connection.
+        :param size: The most connections open at once.
+        :param idle_check: Seconds a connection may sit idle before it is checked with a NOOP when reused.
+        :return:
+        """
+        self.connect = connect
+        self.size = size
+        self.idle_check = idle_check
+        self.idle = []
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_alive(connection):
+        try:
+            return connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def acquire(self):
+        """
+        Take a connection out of the pool, waiting while every connection is in use.
+
+        :return: An open smtplib.SMTP connection. It must be given back with release.
+        """
+        self.slots.acquire()
+
+        try:
+            with self.lock:
+                entry = self.idle.pop() if self.idle else None
+
+            if entry is not None:
+                connection, last_used = entry
+
+                if monotonic() - last_used < self.idle_check or self.is_alive(connection):
+                    return connection
+
+                close_quietly(connection)
+
+            return self.connect()
+        except:
+            self.slots.release()
+            raise
+
+    def release(self, connection, broken=False):
+        """
+        Give a connection back to the pool.
+
+        :param connection: The connection taken with acquire.
+        :param broken: True if the connection dropped, so it is closed instead of reused.
+        :return:
+        """
+        if broken:
+            close_quietly(connection)
+        else:
+            with self.lock:
+                self.idle.append((connection, monotonic()))
+
+        self.slots.release()
+
+    def sendmail(self, from_address, to_address, message, retries=1):
+        """
+        Send a message over a pooled connection.
+
+        :param from_address: The address the message is from.
+        :param to_address: The address to send the message to.
+        :param message: The text of the message.
+        :param retries: How many times the message is sent again over a new connection if its connection drops
+                        before the message is handed to the server.
+        :return:
+        """
+        for attempt in range(retries + 1):
+            connection = self.acquire()
+            handed_off = False
+
+            try:
+                send_envelope(connection, from_address, to_address)
+                handed_off = True
+                send_data(connection, message)
+            except DISCONNECT_ERRORS:
+                self.release(connection, broken=True)
+
+                # The server may already have the message, so it is not sent again.
+                if handed_off or attempt == retries:
+                    raise
+
+                continue
+            except:
+                self.release(connection)
+                raise
+
+            self.release(connection)
+            return
+
+    def close(self):
+        """
+        Close every idle connection.
+
+        :return:
+        """
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+
+        for connection, _ in idle:
+            close_quietly(connection)
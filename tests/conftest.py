@@ -0,0 +1,27 @@
+import textwrap
+import pytest
+
+from libs.auto_grader import load_grader
+from libs.lab_submissions import grade_lab
+
+
+@pytest.fixture
+def write_file(tmp_path):
+    def write(name, source):
+        path = tmp_path / name
+        path.write_text(textwrap.dedent(source))
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def grade(write_file):
+    """
+    Grade labs in process with a grader, one after another, as a single run would.
+    """
+    def grade_labs(grader_source, labs):
+        auto_grader = load_grader(write_file("hw001_cs100_h01.py", grader_source))
+        return [grade_lab(auto_grader, write_file("hw001_%s.py" % ucid, source))[0] for ucid, source in labs]
+
+    return grade_labs
@@ -0,0 +1,16 @@
+from argparse import ArgumentTypeError
+
+import pytest
+
+from libs.argparse_validation import is_positive_number
+
+
+def test_positive_numbers_are_accepted():
+    assert is_positive_number("0.2") == 0.2
+    assert is_positive_number("10") == 10.0
+
+
+@pytest.mark.parametrize("value", ["0", "-1", "nan", "NaN", "inf", "-inf", "ten"])
+def test_other_values_are_rejected(value):
+    with pytest.raises(ArgumentTypeError):
+        is_positive_number(value)
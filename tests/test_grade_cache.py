@@ -0,0 +1,16 @@
+from libs.grade_cache import GradeCache
+from libs.lab_submissions import LabResult, WORKER_IN_PROCESS, WORKER_FORK
+from libs.sandbox import SandboxLimits
+
+
+def test_grades_are_cached_per_limits_and_worker_mode(tmp_path, write_file):
+    cache = GradeCache(str(tmp_path / "cache"), 1024 * 1024)
+    grader_path = write_file("hw001_cs100_h01.py", "QUESTION_1 = 'a'\n")
+    lab_path = write_file("hw001_aaa.py", "while True:\n    pass\n")
+
+    cache.put(grader_path, lab_path, LabResult("aaa", 1, lab_path, 35), "", None, SandboxLimits(),
+              WORKER_IN_PROCESS)
+
+    assert cache.get(grader_path, lab_path, None, SandboxLimits(), WORKER_IN_PROCESS)[0].score == 35
+    assert cache.get(grader_path, lab_path, None, SandboxLimits(timeout=0.2), WORKER_IN_PROCESS) is None
+    assert cache.get(grader_path, lab_path, None, SandboxLimits(), WORKER_FORK) is None
@@ -0,0 +1,49 @@
+from libs.gradebook import Gradebook, import_csv, export_csv
+from libs.gradebook_manager import GradebookManager
+from libs.lab_submissions import LabResult, LAB_TIMED_OUT, LAB_FINISHED
+
+OLD_CSV = "ab123,100,,TIMEOUT\njk369,65.0,OOM\n"
+
+
+def test_imported_csv_is_exported_unchanged(tmp_path):
+    csv_file = str(tmp_path / "grades.csv")
+    open(csv_file, "w").write(OLD_CSV)
+
+    gradebook = Gradebook(str(tmp_path / "grades.sqlite"))
+    import_csv(gradebook, csv_file, "cs100", "h01")
+    export_csv(gradebook, csv_file, "cs100", "h01")
+    gradebook.close()
+
+    assert open(csv_file).read() == "ab123,100,,TIMEOUT\njk369,65.0,OOM,\n"
+    assert [name for name in tmp_path.iterdir() if name.suffix == ".tmp"] == []
+
+
+def test_export_pads_every_line_to_the_lab_count(tmp_path):
+    csv_file = str(tmp_path / "grades.csv")
+    gradebook = Gradebook(str(tmp_path / "grades.sqlite"))
+    gradebook.record_grades("cs100", "h01", [("ab123", 2, 80, LAB_FINISHED)])
+    export_csv(gradebook, csv_file, "cs100", "h01", lab_count=4)
+    gradebook.close()
+
+    assert open(csv_file).read() == "ab123,,80,,\n"
+
+
+def test_regraded_lab_replaces_its_grade(tmp_path):
+    csv_file = str(tmp_path / "grades.csv")
+    open(csv_file, "w").write(OLD_CSV)
+
+    gradebook = Gradebook(str(tmp_path / "grades.sqlite"))
+    import_csv(gradebook, csv_file, "cs100", "h01")
+
+    manager = GradebookManager(gradebook, "cs100", "h01", 3, csv_file)
+    manager.handle_lab(LabResult("ab123", 3, "hw003_ab123.py", 90))
+    manager.handle_lab(LabResult("jk369", 1, "hw001_jk369.py", outcome=LAB_TIMED_OUT))
+    manager.finish()
+    gradebook.close()
+
+    assert open(csv_file).read() == "ab123,100,,90\njk369,TIMEOUT,OOM,\n"
+
+    # Grades in another section are kept apart.
+    reopened = Gradebook(str(tmp_path / "grades.sqlite"))
+    assert not reopened.has_grades("cs100", "h02")
+    reopened.close()
@@ -0,0 +1,67 @@
+from libs import grader_cases
+
+MUTATING_LAB = """
+def total(numbers):
+    numbers.append(100)
+    return sum(numbers)
+"""
+
+CORRECT_LAB = """
+def total(numbers):
+    return sum(numbers)
+"""
+
+LISTED_GRADER = """
+def total_cases():
+    return [(([1, 2, 3],), 6), (([],), 0)]
+
+def scorer(mc_correct, written_correct):
+    return written_correct * 100
+"""
+
+
+def test_mutating_lab_does_not_change_listed_cases(grade):
+    mutating, correct = grade(LISTED_GRADER, [("aaa", MUTATING_LAB), ("bbb", CORRECT_LAB)])
+
+    assert mutating.functions_incorrect == ["total"]
+    assert correct.functions_incorrect == []
+    assert correct.score == 100
+
+
+def test_mutating_returned_value_does_not_change_expected_value():
+    def extend(numbers):
+        numbers.append(1)
+        return numbers
+
+    case = grader_cases.get_listed_cases("extend", [(([1],), [1, 1])])[0]
+
+    assert all(case.check(extend) for _ in range(3))
+
+
+TABLE_GRADER = """
+def total_table():
+    return {"inputs": [[1, 2, 3], [4, 5], []], "expected": [6, 9, 0]}
+
+def scorer(mc_correct, written_correct):
+    return written_correct * 100
+"""
+
+
+def test_mutating_lab_does_not_change_table_rows(grade):
+    mutating, correct = grade(TABLE_GRADER, [("aaa", MUTATING_LAB), ("bbb", CORRECT_LAB)])
+
+    assert mutating.score < 100
+    assert correct.score == 100
+
+
+def test_table_rows_are_run_on_their_own_copies():
+    table = grader_cases.TestTable("total", [([1, 2, 3],), ([4, 5],)], [6, 9])
+
+    def mutating_total(numbers):
+        numbers.append(100)
+        return sum(numbers)
+
+    table.run(mutating_total, None, grader_cases.TEST_MODE_FULL)
+
+    assert table.args == [([1, 2, 3],), ([4, 5],)]
+    assert table.run(sum, None, grader_cases.TEST_MODE_FULL)[0] == 2
@@ -0,0 +1,48 @@
+import pytest
+
+from libs import item_analysis
+
+CORRECT_ANSWERS = {1: "a", 2: "b", 3: "c"}
+
+# Question 2 is answered correctly by the weakest students only, and one student left question 3 blank.
+RESPONSES = [
+    ["b", "b", "c"],
+    ["a", "b", ""],
+    ["a", "a", "c"],
+    ["a", "c", "d"],
+    ["a", "a", "c"],
+    ["a", "d", "c"],
+]
+SCORES = [10, 20, 30, 40, 50, 60]
+
+
+def analyze(monkeypatch, vectorized):
+    if not vectorized:
+        monkeypatch.setattr(item_analysis, "numpy", None)
+
+    return [(analysis.difficulty, analysis.discrimination, analysis.frequencies)
+            for analysis in item_analysis.analyze_items(1, CORRECT_ANSWERS, RESPONSES, SCORES)]
+
+
+def test_both_code_paths_agree(monkeypatch):
+    if item_analysis.numpy is None:
+        pytest.skip("NumPy is not installed")
+
+    vectorized = analyze(monkeypatch, True)
+    looped = analyze(monkeypatch, False)
+
+    assert len(vectorized) == len(looped) == 3
+
+    for (difficulty, discrimination, frequencies), expected in zip(vectorized, looped):
+        assert difficulty == pytest.approx(expected[0])
+        assert discrimination == pytest.approx(expected[1])
+        assert frequencies == expected[2]
+
+
+def test_item_analysis(monkeypatch):
+    difficulty, discrimination, frequencies = zip(*analyze(monkeypatch, False))
+
+    assert difficulty == pytest.approx((5 / 6, 2 / 6, 4 / 6))
+    assert discrimination == pytest.approx((0.5, -1.0, 0.5))
+    assert frequencies[1] == {"a": 2, "b": 2, "c": 1, "d": 1}
+    assert frequencies[2] == {"": 1, "c": 4, "d": 1}
@@ -0,0 +1,67 @@
+from libs.auto_grader import load_grader
+from libs.lab_submissions import grade_labs
+
+TOTAL_GRADER = """
+def total_cases():
+    return [(([1, 2, 3],), 6)]
+
+def scorer(mc_correct, written_correct):
+    return written_correct * 100
+"""
+
+MIXED_GRADER = """
+ANSWERS_1 = "A"
+
+def total_cases():
+    return [(([1, 2, 3],), 6)]
+
+def scorer(mc_correct, written_correct):
+    return mc_correct * 50 + written_correct * 50
+"""
+
+CORRECT_LAB = """
+def total(numbers):
+    return sum(numbers)
+"""
+
+
+def test_lab_ending_its_worker_fails_alone(write_file):
+    auto_grader = load_grader(write_file("hw001_cs100_h01.py", TOTAL_GRADER))
+    lab_paths = [write_file("hw001_%s.py" % ucid, CORRECT_LAB) for ucid in ["aaa", "bbb", "ddd", "eee"]]
+    lab_paths.insert(2, write_file("hw001_ccc.py", "import os\nos._exit(5)\n"))
+
+    results = list(grade_labs(auto_grader, lab_paths, jobs=2, deduplicate=False))
+
+    assert [result.ucid for result in results] == ["aaa", "bbb", "ccc", "ddd", "eee"]
+    assert [result.score for result in results] == [100, 100, None, 100, 100]
+    assert results[2].load_error
+
+
+def grade_mixed(write_file, labs):
+    auto_grader = load_grader(write_file("hw001_cs100_h01.py", MIXED_GRADER))
+    lab_paths = [write_file("hw001_%s.py" % ucid, source) for ucid, source in labs]
+    return lab_paths, list(grade_labs(auto_grader, lab_paths))
+
+
+def test_labs_differing_in_formatting_share_a_grade(write_file):
+    lab_paths, results = grade_mixed(write_file, [
+        ("aaa", 'QUESTIONS_1 = "A"\ndef total(numbers):\n    return sum(numbers)\n'),
+        ("bbb", '# My lab\n\nQUESTIONS_1 = "A"\n\n\ndef total( numbers ):\n    # Add them up\n    return sum(numbers)\n'),
+        ("ccc", 'QUESTIONS_1 = "B"\ndef total(numbers):\n    return sum(numbers)\n')
+    ])
+
+    assert [(result.ucid, result.lab_path) for result in results] == list(zip(["aaa", "bbb", "ccc"], lab_paths))
+    assert [result.score for result in results] == [100, 100, 50]
+
+    # bbb was given aaa's grade without being graded itself, so it has no timings.
+    assert results[0].timings is not None and results[1].timings is None
+
+
+def test_labs_with_different_names_are_graded_separately(write_file):
+    lab_paths, results = grade_mixed(write_file, [
+        ("aaa", 'QUESTIONS_1 = "A"\ndef total(numbers):\n    return sum(numbers)\n'),
+        ("bbb", 'QUESTIONS_1 = "A"\ndef totals(numbers):\n    return sum(numbers)\n')
+    ])
+
+    assert [result.score for result in results] == [100, 50]
+    assert results[1].ucid == "bbb"
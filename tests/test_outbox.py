@@ -0,0 +1,81 @@
+import os
+import json
+import smtplib
+
+from libs.outbox import Outbox, flush_outbox, get_backoff
+
+
+class ScriptedSender:
+    """
+    Stands in for an EmailManager, failing each UCID's sends with the errors listed for it, in order.
+    """
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.sent = []
+        self.batches = []
+
+    def send_emails(self, emails):
+        self.batches.append([ucid for ucid, _, _ in emails])
+        errors = []
+
+        for ucid, message, subject in emails:
+            error = self.failures.get(ucid, []).pop(0) if self.failures.get(ucid) else None
+
+            if error is None:
+                self.sent.append(ucid)
+
+            errors.append(error)
+
+        return errors
+
+
+def test_outbox_files_are_written_whole(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.add("jk369", "jk369 received a 65")
+
+    names = [name for name in os.listdir(str(tmp_path)) if name.endswith(".json")]
+
+    assert len(names) == 1
+    assert not [name for name in os.listdir(str(tmp_path)) if name.startswith(".")]
+    assert json.load(open(str(tmp_path / names[0])))["ucid"] == "jk369"
+
+
+def test_backoff_doubles_up_to_the_longest_wait():
+    assert [get_backoff(attempts, 2.0, 10.0) for attempts in range(1, 6)] == [2.0, 4.0, 8.0, 10.0, 10.0]
+
+
+def test_failed_emails_are_retried_until_sent(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.add("aaa", "a")
+    outbox.add("bbb", "b")
+    sender = ScriptedSender({"bbb": [smtplib.SMTPServerDisconnected(), smtplib.SMTPServerDisconnected()]})
+
+    assert flush_outbox(outbox, sender, retries=3, backoff=0.01) == (2, 0)
+    assert sender.sent == ["aaa", "bbb"]
+    assert sender.batches == [["aaa", "bbb"], ["bbb"], ["bbb"]]
+    assert outbox.get_emails() == []
+
+
+def test_emails_out_of_retries_are_set_aside(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.add("aaa", "a")
+    sender = ScriptedSender({"aaa": [ConnectionRefusedError()] * 3})
+
+    assert flush_outbox(outbox, sender, retries=2, backoff=0.01) == (0, 1)
+    assert outbox.get_emails() == []
+    assert len(os.listdir(outbox.failed_folder)) == 1
+
+
+def test_login_failure_keeps_unsent_emails_and_removes_sent_ones(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.add("aaa", "a")
+    outbox.add("bbb", "b")
+    outbox.add("ccc", "c")
+    sender = ScriptedSender({"aaa": [smtplib.SMTPAuthenticationError(535, b"bad login")]})
+
+    assert flush_outbox(outbox, sender, retries=3, backoff=0.01) == (2, 0)
+
+    remaining = outbox.get_emails()
+
+    assert [email.ucid for email in remaining] == ["aaa"]
+    assert remaining[0].attempts == 0
@@ -0,0 +1,44 @@
+import pickle
+
+from libs.reference_oracle import get_reference_path
+
+REFERENCE_GRADER = """
+def reference_total(numbers):
+    numbers.sort()
+    return sum(numbers)
+
+def total_inputs(rng):
+    return [([rng.randint(0, 9) for _ in range(5)],) for _ in range(20)]
+
+def scorer(mc_correct, written_correct):
+    return written_correct * 100
+"""
+
+MUTATING_LAB = """
+def total(numbers):
+    numbers.append(100)
+    return sum(numbers)
+"""
+
+CORRECT_LAB = """
+def total(numbers):
+    return sum(numbers)
+"""
+
+
+def test_mutating_lab_does_not_change_reference_inputs(grade):
+    labs = [("aaa", MUTATING_LAB), ("bbb", CORRECT_LAB), ("ccc", MUTATING_LAB), ("ddd", CORRECT_LAB)]
+    results = grade(REFERENCE_GRADER, labs)
+
+    assert [result.score for result in results] == [0, 100, 0, 100]
+
+
+def test_saved_inputs_are_not_changed_by_reference_or_labs(grade, tmp_path):
+    grade(REFERENCE_GRADER, [("aaa", MUTATING_LAB)])
+
+    with open(get_reference_path(str(tmp_path / "hw001_cs100_h01.py")), "rb") as handle:
+        inputs, expected = next(iter(pickle.load(handle)["tables"].values()))
+
+    assert any(numbers != sorted(numbers) for numbers, in inputs)
+    assert all(len(numbers) == 5 for numbers, in inputs)
+    assert [sum(numbers) for numbers, in inputs] == expected
@@ -0,0 +1,10 @@
+from libs.lab_submissions import LabResult, LAB_TIMED_OUT, LAB_OUT_OF_MEMORY
+
+
+def test_unfinished_reports_are_sentences():
+    out_of_memory = LabResult("jk369", 1, "hw001_jk369.py", outcome=LAB_OUT_OF_MEMORY)
+    timed_out = LabResult("jk369", 1, "hw001_jk369.py", outcome=LAB_TIMED_OUT)
+
+    assert "The lab ran out of memory while grading and was not scored." in out_of_memory.get_score_report(False)
+    assert "The lab timed out while grading and was not scored." in timed_out.get_score_report(False)
+    assert out_of_memory.get_score_report(True) == "jk369 ran out of memory"
@@ -0,0 +1,174 @@
+import os
+import pytest
+
+from libs.finished_manager import FinishedLabManager, FinishedLabHandler, JOURNAL_BEFORE_HANDLING, \
+    JOURNAL_AFTER_FINISH
+from libs.lab_submissions import LabResult
+from libs.move_finished_manager import MoveFinishedLabHandler
+from libs.run_journal import RunJournal
+
+
+class Crash(Exception):
+    pass
+
+
+class Emailer(FinishedLabHandler):
+    journal_event = "emailed"
+    journal_when = JOURNAL_BEFORE_HANDLING
+
+    def __init__(self, crash_on=None):
+        self.emailed = []
+        self.crash_on = crash_on
+
+    def handle_lab(self, lab, broken=False):
+        if lab.ucid == self.crash_on:
+            raise Crash()
+
+        self.emailed.append(lab.ucid)
+
+
+class Recorder(FinishedLabHandler):
+    journal_event = "recorded"
+    journal_when = JOURNAL_AFTER_FINISH
+
+    def __init__(self):
+        self.recorded = []
+        self.pending = []
+
+    def handle_lab(self, lab, broken=False):
+        self.pending.append(lab.ucid)
+
+    def finish(self):
+        self.recorded.extend(self.pending)
+        self.pending = []
+
+
+class Reporter(FinishedLabHandler):
+    replays_finished_labs = True
+
+    def __init__(self):
+        self.reported = []
+
+    def handle_lab(self, lab, broken=False):
+        self.reported.append(lab.ucid)
+
+
+@pytest.fixture
+def lab_paths(tmp_path):
+    paths = []
+
+    for ucid in ["aaa", "bbb", "ccc", "ddd"]:
+        path = tmp_path / ("hw001_%s.py" % ucid)
+        path.write_text("QUESTION_1 = 'a'\n")
+        paths.append(str(path))
+
+    return paths
+
+
+def get_result(lab_path):
+    ucid = lab_path.rsplit("_", 1)[1][:-3]
+    return LabResult(ucid, 1, lab_path, 100, answers={1: "a"})
+
+
+def run(journal_path, lab_paths, emailer, resume=False):
+    recorder = Recorder()
+    reporter = Reporter()
+    journal = RunJournal(journal_path, resume)
+    manager = FinishedLabManager([emailer, recorder, reporter], journal=journal)
+
+    try:
+        finished, unfinished, to_grade = journal.resume(lab_paths, manager.get_journal_events())
+        manager.replay_finished_labs(finished)
+        manager.handle_graded_lab(unfinished + [get_result(lab_path) for lab_path in to_grade])
+    finally:
+        journal.close()
+
+    return recorder, reporter, to_grade
+
+
+def test_resumed_run_does_not_email_twice(tmp_path, lab_paths):
+    journal_path = str(tmp_path / "journal")
+
+    with pytest.raises(Crash):
+        run(journal_path, lab_paths, Emailer(crash_on="ccc"))
+
+    emailer = Emailer()
+    recorder, reporter, to_grade = run(journal_path, lab_paths, emailer, resume=True)
+
+    # ccc was journaled as emailed before the crash, so it is never emailed again, even if it was never sent.
+    assert emailer.emailed == ["ddd"]
+    assert to_grade == lab_paths[3:]
+    assert sorted(recorder.recorded) == ["aaa", "bbb", "ccc", "ddd"]
+
+
+def test_resumed_run_reports_on_every_lab(tmp_path, lab_paths):
+    journal_path = str(tmp_path / "journal")
+    run(journal_path, lab_paths[:2], Emailer())
+
+    emailer = Emailer()
+    recorder, reporter, to_grade = run(journal_path, lab_paths, emailer, resume=True)
+
+    assert emailer.emailed == ["ccc", "ddd"]
+    assert recorder.recorded == ["ccc", "ddd"]
+    assert sorted(reporter.reported) == ["aaa", "bbb", "ccc", "ddd"]
+
+
+def test_changed_lab_is_graded_again(tmp_path, lab_paths):
+    journal_path = str(tmp_path / "journal")
+    run(journal_path, lab_paths, Emailer())
+
+    with open(lab_paths[1], "a") as handle:
+        handle.write("QUESTION_2 = 'b'\n")
+
+    emailer = Emailer()
+    recorder, reporter, to_grade = run(journal_path, lab_paths, emailer, resume=True)
+
+    assert to_grade == [lab_paths[1]]
+    assert emailer.emailed == ["bbb"]
+    assert sorted(reporter.reported) == ["aaa", "bbb", "ccc", "ddd"]
+
+
+def test_cut_short_line_is_ignored(tmp_path, lab_paths):
+    journal_path = str(tmp_path / "journal")
+    run(journal_path, lab_paths[:1], Emailer())
+
+    with open(journal_path, "a") as handle:
+        handle.write('{"lab": "hw001_bbb.py", "ev')
+
+    journal = RunJournal(journal_path, resume=True)
+    journal.journal_graded(get_result(lab_paths[2]))
+    journal.close()
+
+    assert list(journal.labs) == ["hw001_aaa.py", "hw001_ccc.py"]
+
+    reopened = RunJournal(journal_path, resume=True)
+    reopened.close()
+
+    assert list(reopened.labs) == ["hw001_aaa.py", "hw001_ccc.py"]
+
+
+def test_resume_skips_moving_a_removed_lab(tmp_path, lab_paths):
+    journal_path = str(tmp_path / "journal")
+    finished_folder = tmp_path / "finished"
+    finished_folder.mkdir()
+
+    def run_moving(emailer, resume=False):
+        journal = RunJournal(journal_path, resume)
+        manager = FinishedLabManager([emailer, MoveFinishedLabHandler(str(finished_folder))], journal=journal)
+
+        try:
+            # Moved labs are no longer in the labs folder.
+            in_folder = [lab_path for lab_path in lab_paths if os.path.exists(lab_path)]
+            finished, unfinished, to_grade = journal.resume(in_folder, manager.get_journal_events())
+            manager.handle_graded_lab(unfinished + [get_result(lab_path) for lab_path in to_grade])
+        finally:
+            journal.close()
+
+    with pytest.raises(Crash):
+        run_moving(Emailer(crash_on="bbb"))
+
+    # bbb was graded but not moved before the crash, and is then removed by hand.
+    os.remove(lab_paths[1])
+    run_moving(Emailer(), resume=True)
+
+    assert sorted(os.listdir(str(finished_folder))) == ["hw001_aaa.py", "hw001_ccc.py", "hw001_ddd.py"]
@@ -0,0 +1,78 @@
+import sys
+import pytest
+
+from libs.auto_grader import load_grader
+from libs.lab_submissions import grade_labs, LAB_FINISHED, LAB_TIMED_OUT, LAB_OUT_OF_MEMORY, WORKER_SPAWN, \
+    WORKER_FORK
+from libs.sandbox import SandboxLimits, SandboxOutOfMemory, run_forked
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Resource limits are only set on Linux")
+
+TOTAL_GRADER = """
+def total_cases():
+    return [(([1, 2, 3],), 6)]
+
+def scorer(mc_correct, written_correct):
+    return written_correct * 100
+"""
+
+LOOPING_LAB = """
+def total(numbers):
+    while True:
+        pass
+"""
+
+ALLOCATING_LAB = """
+def total(numbers):
+    blocks = []
+
+    while True:
+        blocks.append(bytearray(16 * 1024 * 1024))
+"""
+
+EXITING_LAB = """
+import os
+
+def total(numbers):
+    os._exit(5)
+"""
+
+
+def grade_limited(write_file, source, worker_mode, limits):
+    auto_grader = load_grader(write_file("hw001_cs100_h01.py", TOTAL_GRADER))
+    return list(grade_labs(auto_grader, [write_file("hw001_aaa.py", source)], limits=limits,
+                           worker_mode=worker_mode))[0]
+
+
+@pytest.mark.parametrize("worker_mode", [WORKER_SPAWN, WORKER_FORK])
+def test_looping_lab_times_out(write_file, worker_mode):
+    result = grade_limited(write_file, LOOPING_LAB, worker_mode, SandboxLimits(timeout=1))
+
+    assert result.outcome == LAB_TIMED_OUT
+    assert result.score is None
+
+
+@pytest.mark.parametrize("worker_mode", [WORKER_SPAWN, WORKER_FORK])
+def test_allocating_lab_runs_out_of_memory(write_file, worker_mode):
+    result = grade_limited(write_file, ALLOCATING_LAB, worker_mode, SandboxLimits(timeout=30, memory=512 * 1024 * 1024))
+
+    assert result.outcome == LAB_OUT_OF_MEMORY
+    assert result.score is None
+
+
+@pytest.mark.parametrize("worker_mode", [WORKER_SPAWN, WORKER_FORK])
+def test_exiting_lab_is_reported(write_file, worker_mode):
+    result = grade_limited(write_file, EXITING_LAB, worker_mode, SandboxLimits(timeout=30))
+
+    assert result.outcome == LAB_FINISHED
+    assert result.score is None
+    assert "Exited with code 5" in result.load_error
+
+
+def allocate():
+    return bytearray(1024 * 1024 * 1024)
+
+
+def test_memory_error_leaving_the_child_is_out_of_memory():
+    with pytest.raises(SandboxOutOfMemory):
+        run_forked(allocate, (), SandboxLimits(timeout=30, memory=512 * 1024 * 1024))
@@ -0,0 +1,120 @@
+import ast
+import random
+from array import array
+from functools import lru_cache
+
+from libs.similarity import PostorderTree, get_tree_edit_distance, get_tree_similarity, get_distance_limit, \
+    get_postorder_tree, get_renamed_key, get_clusters
+
+
+def get_random_tree(rng, size, labels=3):
+    """
+    Build a random tree of nested (label, children) tuples.
+    """
+    nodes = [(rng.randrange(labels), [])]
+
+    for _ in range(size - 1):
+        child = (rng.randrange(labels), [])
+        rng.choice(nodes)[1].append(child)
+        nodes.append(child)
+
+    def freeze(node):
+        return node[0], tuple(freeze(child) for child in node[1])
+
+    return freeze(nodes[0])
+
+
+def get_size(forest):
+    return sum(1 + get_size(children) for _, children in forest)
+
+
+@lru_cache(maxsize=None)
+def get_forest_distance(first, second):
+    """
+    The forest edit distance from its definition, removing the rightmost root of either forest.
+    """
+    if not first or not second:
+        return get_size(first) + get_size(second)
+
+    (first_label, first_children), (second_label, second_children) = first[-1], second[-1]
+
+    return min(get_forest_distance(first[:-1] + first_children, second) + 1,
+               get_forest_distance(first, second[:-1] + second_children) + 1,
+               get_forest_distance(first[:-1], second[:-1]) + get_forest_distance(first_children, second_children) +
+               (first_label != second_label))
+
+
+def get_postorder(tree):
+    labels = array("I")
+    leftmost = array("I")
+
+    def add(node):
+        first = None
+
+        for child in node[1]:
+            child_number = add(child)
+
+            if first is None:
+                first = leftmost[child_number]
+
+        labels.append(node[0])
+        leftmost.append(len(labels) - 1 if first is None else first)
+        return len(labels) - 1
+
+    add(tree)
+    return PostorderTree(labels, leftmost)
+
+
+def test_tree_edit_distance_matches_brute_force():
+    rng = random.Random(0)
+
+    for _ in range(300):
+        first = get_random_tree(rng, rng.randint(1, 8))
+        second = get_random_tree(rng, rng.randint(1, 8))
+        expected = get_forest_distance((first,), (second,))
+
+        assert get_tree_edit_distance(get_postorder(first), get_postorder(second)) == expected
+
+        for limit in range(expected + 2):
+            bounded = get_tree_edit_distance(get_postorder(first), get_postorder(second), limit)
+            assert bounded == (expected if expected <= limit else None)
+
+
+def test_pairs_exactly_at_the_threshold_are_kept():
+    assert get_distance_limit(0.8, 10) == 2
+
+    first = get_postorder((0, tuple((1, ()) for _ in range(9))))
+    second = get_postorder((0, tuple((1, ()) for _ in range(7)) + ((2, ()), (2, ()))))
+
+    assert get_tree_similarity(first, second, 0.8) == (0.8, 2)
+    assert get_tree_similarity(first, second, 0.81) is None
+
+
+def test_renamed_copies_share_a_key():
+    original = ast.parse("def area(width, height):\n    return width * height\n")
+    renamed = ast.parse("def f(a, b):\n    # Not copied\n    return a * b\n")
+    different = ast.parse("def area(width, height):\n    return width + height\n")
+
+    assert get_renamed_key(original) == get_renamed_key(renamed)
+    assert get_renamed_key(original) != get_renamed_key(different)
+    assert get_tree_edit_distance(get_postorder_tree(original), get_postorder_tree(renamed)) == 0
+
+
+def test_clusters_join_connected_pairs():
+    clusters = get_clusters([("a", "b"), ("b", "c"), ("x", "y")])
+
+    assert sorted(sorted(cluster) for cluster in clusters) == [["a", "b", "c"], ["x", "y"]]
+
+
+def test_stopped_subtree_tables_keep_distances_exact():
+    rng = random.Random(1)
+
+    # Few labels and deep trees give subtree tables that are stopped before the table of the two roots is reached.
+    for _ in range(150):
+        first = get_random_tree(rng, rng.randint(8, 12), labels=2)
+        second = get_random_tree(rng, rng.randint(8, 12), labels=2)
+        expected = get_forest_distance((first,), (second,))
+
+        for limit in range(max(0, expected - 2), expected + 2):
+            bounded = get_tree_edit_distance(get_postorder(first), get_postorder(second), limit)
+            assert bounded == (expected if expected <= limit else None)
@@ -0,0 +1,38 @@
+from array import array
+
+from libs.similarity import PostorderTree
+from libs.similarity_corpus import SimilarityCorpus
+
+
+def add_submissions(corpus, ucids):
+    for number, ucid in enumerate(ucids):
+        fingerprints = array("I", sorted({(number * 7 + step * 3) % 20 for step in range(6)}))
+        corpus.add(ucid, "%064d" % number, fingerprints, PostorderTree(array("I", [1, 2]), array("I", [0, 0])))
+
+
+def test_saving_merges_new_postings(tmp_path, monkeypatch):
+    corpus = SimilarityCorpus(str(tmp_path), "cs100", 1)
+    add_submissions(corpus, ["aaa", "bbb", "ccc"])
+    corpus.save()
+
+    def rebuild_postings(count):
+        raise AssertionError("Saving rebuilt every posting")
+
+    monkeypatch.setattr(corpus, "rebuild_postings", rebuild_postings)
+    add_submissions(corpus, ["ddd", "eee"])
+    corpus.save()
+
+    merged = list(corpus.views["postings"])
+    corpus.close()
+    monkeypatch.undo()
+
+    # Postings no longer covering every submission are rebuilt from scratch.
+    with open(str(tmp_path / "cs100" / "hw001" / "postings.bin"), "wb"):
+        pass
+
+    rebuilt = SimilarityCorpus(str(tmp_path), "cs100", 1)
+
+    assert merged == list(rebuilt.views["postings"])
+    assert merged[0] == 5 and merged[1:] == sorted(merged[1:])
+    assert {submission.ucid for _, submission in rebuilt.get_similar(array("I", [0, 3, 6]), 0.0)} >= {"aaa"}
+    rebuilt.close()
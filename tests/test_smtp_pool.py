@@ -0,0 +1,68 @@
+import smtplib
+
+import pytest
+
+from libs.smtp_pool import SMTPConnectionPool
+
+
+class ScriptedConnection:
+    """
+    Stands in for an smtplib.SMTP connection, dropping on the SMTP command it is told to drop on.
+    """
+    def __init__(self, server, drop_on=None):
+        self.server = server
+        self.drop_on = drop_on
+
+    def command(self, name):
+        if name == self.drop_on:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def mail(self, from_address):
+        self.command("MAIL")
+        return 250, b"OK"
+
+    def rcpt(self, to_address):
+        self.command("RCPT")
+        return 250, b"OK"
+
+    def data(self, message):
+        # The server keeps the message even if the connection drops before it replies.
+        self.server.append(message)
+        self.command("DATA")
+        return 250, b"OK"
+
+    def noop(self):
+        return 250, b"OK"
+
+    def rset(self):
+        return 250, b"OK"
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def get_pool(server, drops):
+    drops = list(drops)
+    return SMTPConnectionPool(lambda: ScriptedConnection(server, drops.pop(0) if drops else None))
+
+
+def test_drop_before_the_message_is_sent_again():
+    server = []
+    get_pool(server, ["MAIL"]).sendmail("ab123@njit.edu", "jk369@njit.edu", "jk369 received a 65")
+
+    assert server == ["jk369 received a 65"]
+
+
+def test_drop_after_the_message_is_not_sent_again():
+    server = []
+
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        get_pool(server, ["DATA"]).sendmail("ab123@njit.edu", "jk369@njit.edu", "jk369 received a 65")
+
+    assert server == ["jk369 received a 65"]